@@ -1,10 +1,17 @@
 # Copyright 2022 Guillaume Belanger
 # See LICENSE file for licensing details.
 
-"""Interface used by provider and requirer of the 5G AMF."""
+"""Interface used by provider and requirer of the 5G AMF.
+
+The AMF application publishes its service address in the application data bag. Each AMF unit
+also publishes its own address and GUAMI in its unit data bag, so that requirers of a pooled
+AMF set can spread load across AMF instances or target a specific one. The
+`FiveGAMFRequires.amf_instances` property returns every AMF instance of the relation.
+"""
 
 import logging
-from typing import Optional
+from dataclasses import dataclass
+from typing import List, Optional
 
 from ops.charm import CharmBase, CharmEvents, RelationChangedEvent
 from ops.framework import EventBase, EventSource, Handle, Object
@@ -17,7 +24,7 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 1
+LIBPATCH = 2
 
 
 logger = logging.getLogger(__name__)
@@ -58,6 +65,38 @@ class AMFAvailableEvent(EventBase):
         self.amf_api_version = snapshot["amf_api_version"]
 
 
+@dataclass(frozen=True)
+class AMFInstance:
+    """AMF instance of a pooled AMF set, published by an AMF unit."""
+
+    unit_name: str
+    address: str
+    fqdn: str
+    mcc: str
+    mnc: str
+    region_id: str
+    amf_set_id: str
+    amf_pointer: str
+    relative_capacity: int
+
+    @property
+    def guami(self) -> str:
+        """Returns the GUAMI of the instance as `<MCC><MNC>-<RegionID>-<AMFSetID>-<AMFPointer>`."""
+        return f"{self.mcc}{self.mnc}-{self.region_id}-{self.amf_set_id}-{self.amf_pointer}"
+
+
+AMF_INSTANCE_KEYS = [
+    "amf_address",
+    "amf_fqdn",
+    "guami_mcc",
+    "guami_mnc",
+    "guami_region_id",
+    "guami_amf_set_id",
+    "guami_amf_pointer",
+    "relative_capacity",
+]
+
+
 class FiveGAMFRequirerCharmEvents(CharmEvents):
     """List of events that the 5G AMF requirer charm can leverage."""
 
@@ -181,6 +220,35 @@ class FiveGAMFRequires(Object):
             return None
         return remote_app_relation_data.get("amf_api_version", None)
 
+    @property
+    def amf_instances(self) -> List[AMFInstance]:
+        """Returns the AMF instances published by the units of the remote AMF application.
+
+        Units that did not publish every field yet are left out.
+        """
+        relation = self.model.get_relation(relation_name=self.relationship_name)
+        if not relation:
+            return []
+        instances = []
+        for unit in sorted(relation.units, key=lambda unit: unit.name):
+            unit_relation_data = relation.data[unit]
+            if not all(key in unit_relation_data for key in AMF_INSTANCE_KEYS):
+                continue
+            instances.append(
+                AMFInstance(
+                    unit_name=unit.name,
+                    address=unit_relation_data["amf_address"],
+                    fqdn=unit_relation_data["amf_fqdn"],
+                    mcc=unit_relation_data["guami_mcc"],
+                    mnc=unit_relation_data["guami_mnc"],
+                    region_id=unit_relation_data["guami_region_id"],
+                    amf_set_id=unit_relation_data["guami_amf_set_id"],
+                    amf_pointer=unit_relation_data["guami_amf_pointer"],
+                    relative_capacity=int(unit_relation_data["relative_capacity"]),
+                )
+            )
+        return instances
+
 
 class FiveGAMFProvides(Object):
     """Class to be instantiated by the AMF charm providing the 5G AMF Interface."""
@@ -222,3 +290,49 @@ class FiveGAMFProvides(Object):
                 "amf_api_version": amf_api_version,
             }
         )
+
+    def set_amf_unit_information(
+        self,
+        amf_address: str,
+        amf_fqdn: str,
+        guami_mcc: str,
+        guami_mnc: str,
+        guami_region_id: str,
+        guami_amf_set_id: str,
+        guami_amf_pointer: str,
+        relative_capacity: int,
+        relation_id: int,
+    ) -> None:
+        """Sets the information of this AMF unit in its unit relation data.
+
+        Unlike `set_amf_information`, this is called by every unit of the AMF application.
+
+        Args:
+            amf_address: Address of this AMF unit
+            amf_fqdn: FQDN of this AMF unit
+            guami_mcc: GUAMI MCC
+            guami_mnc: GUAMI MNC
+            guami_region_id: GUAMI AMF Region ID
+            guami_amf_set_id: GUAMI AMF Set ID
+            guami_amf_pointer: GUAMI AMF Pointer of this unit
+            relative_capacity: Relative capacity of this AMF unit
+            relation_id: Relation ID
+
+        Returns:
+            None
+        """
+        relation = self.model.get_relation(self.relationship_name, relation_id=relation_id)
+        if not relation:
+            raise RuntimeError(f"Relation {self.relationship_name} not created yet.")
+        relation.data[self.charm.unit].update(
+            {
+                "amf_address": amf_address,
+                "amf_fqdn": amf_fqdn,
+                "guami_mcc": guami_mcc,
+                "guami_mnc": guami_mnc,
+                "guami_region_id": guami_region_id,
+                "guami_amf_set_id": guami_amf_set_id,
+                "guami_amf_pointer": guami_amf_pointer,
+                "relative_capacity": str(relative_capacity),
+            }
+        )
@@ -3,11 +3,13 @@
 
 """Interface used by provider and requirer of the 5G N2."""
 
+import json
 import logging
 from typing import Optional
 
 from ops.charm import CharmBase, CharmEvents, RelationChangedEvent
 from ops.framework import EventBase, EventSource, Handle, Object
+from ops.model import Relation
 
 # The unique Charmhub library identifier, never change it
 LIBID = "9cffc4bd8216447a9463a14ac8ecae0b"
@@ -17,11 +19,14 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 1
+LIBPATCH = 2
 
 
 logger = logging.getLogger(__name__)
 
+LAST_SEEN_KEY = "last_seen"
+N2_KEYS = ["amf_address"]
+
 
 class N2AvailableEvent(EventBase):
     """Charm event emitted when an N2 is available."""
@@ -83,10 +88,26 @@ class FiveGN2Requires(Object):
         if "amf_address" not in remote_app_relation_data:
             logger.info("No amf_address in relation data - Not triggering amf_available event")
             return
+        if not self._consumed_data_changed(relation, remote_app_relation_data):
+            logger.debug("Relation data unchanged - Not triggering amf_available event")
+            return
         self.on.amf_available.emit(
             amf_address=remote_app_relation_data["amf_address"],
         )
 
+    def _consumed_data_changed(self, relation: Relation, remote_app_relation_data) -> bool:
+        """Returns whether the fields used by the charm changed since they were last seen.
+
+        Like the `data` key of `DatabaseRequires`, the last seen values are kept in the local
+        unit data bag so that they are compared across hooks.
+        """
+        consumed_data = {key: remote_app_relation_data[key] for key in N2_KEYS}
+        last_seen_data = json.loads(relation.data[self.charm.unit].get(LAST_SEEN_KEY, "{}"))
+        if consumed_data == last_seen_data:
+            return False
+        relation.data[self.charm.unit][LAST_SEEN_KEY] = json.dumps(consumed_data, sort_keys=True)
+        return True
+
     @property
     def amf_address_available(self) -> bool:
         """Returns whether amf address is available in relation data."""
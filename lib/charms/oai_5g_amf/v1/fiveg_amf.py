@@ -0,0 +1,329 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Interface used by provider and requirer of the 5G AMF.
+
+The AMF application publishes its service address in the application data bag. Each AMF unit
+also publishes its own address and GUAMI in its unit data bag, so that requirers of a pooled
+AMF set can spread load across AMF instances or target a specific one.
+
+Compared to v0, each data bag holds a single versioned JSON document, under the `amf` key for
+the application and the `amf_instance` key for units, which requirers parse once. Providers
+keep writing the v0 keys next to it, so v0 requirers are not affected, and v1 requirers fall
+back to the v0 keys when the provider does not publish the document yet.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional
+
+from ops.charm import CharmBase, CharmEvents, RelationChangedEvent
+from ops.framework import EventBase, EventSource, Handle, Object
+
+# The unique Charmhub library identifier, never change it
+LIBID = "ff1717f64ab7465e8a725ec1cd6f5095"
+
+# Increment this major API version when introducing breaking changes
+LIBAPI = 1
+
+# Increment this PATCH version before using `charmcraft publish-lib` or reset
+# to 0 if you are raising the major API version
+LIBPATCH = 0
+
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_VERSION = 1
+AMF_KEY = "amf"
+AMF_INSTANCE_KEY = "amf_instance"
+LEGACY_AMF_KEYS = {
+    "ipv4_address": "amf_ipv4_address",
+    "fqdn": "amf_fqdn",
+    "port": "amf_port",
+    "api_version": "amf_api_version",
+}
+LEGACY_AMF_INSTANCE_KEYS = {
+    "address": "amf_address",
+    "fqdn": "amf_fqdn",
+    "mcc": "guami_mcc",
+    "mnc": "guami_mnc",
+    "region_id": "guami_region_id",
+    "amf_set_id": "guami_amf_set_id",
+    "amf_pointer": "guami_amf_pointer",
+    "relative_capacity": "relative_capacity",
+}
+
+
+@dataclass(frozen=True)
+class AMFInformation:
+    """Service address of the AMF application."""
+
+    ipv4_address: str
+    fqdn: str
+    port: str
+    api_version: str
+
+
+@dataclass(frozen=True)
+class AMFInstance:
+    """AMF instance of a pooled AMF set, published by an AMF unit."""
+
+    unit_name: str
+    address: str
+    fqdn: str
+    mcc: str
+    mnc: str
+    region_id: str
+    amf_set_id: str
+    amf_pointer: str
+    relative_capacity: int
+
+    @property
+    def guami(self) -> str:
+        """Returns the GUAMI of the instance as `<MCC><MNC>-<RegionID>-<AMFSetID>-<AMFPointer>`."""
+        return f"{self.mcc}{self.mnc}-{self.region_id}-{self.amf_set_id}-{self.amf_pointer}"
+
+
+class AMFAvailableEvent(EventBase):
+    """Charm event emitted when an AMF is available."""
+
+    def __init__(
+        self,
+        handle: Handle,
+        amf_ipv4_address: str,
+        amf_fqdn: str,
+        amf_port: str,
+        amf_api_version: str,
+    ):
+        """Init."""
+        super().__init__(handle)
+        self.amf_ipv4_address = amf_ipv4_address
+        self.amf_fqdn = amf_fqdn
+        self.amf_port = amf_port
+        self.amf_api_version = amf_api_version
+
+    def snapshot(self) -> dict:
+        """Returns snapshot."""
+        return {
+            "amf_ipv4_address": self.amf_ipv4_address,
+            "amf_fqdn": self.amf_fqdn,
+            "amf_port": self.amf_port,
+            "amf_api_version": self.amf_api_version,
+        }
+
+    def restore(self, snapshot: dict) -> None:
+        """Restores snapshot."""
+        self.amf_ipv4_address = snapshot["amf_ipv4_address"]
+        self.amf_fqdn = snapshot["amf_fqdn"]
+        self.amf_port = snapshot["amf_port"]
+        self.amf_api_version = snapshot["amf_api_version"]
+
+
+def _encode(fields: Mapping[str, Any]) -> str:
+    return json.dumps({"version": DOCUMENT_VERSION, **fields}, separators=(",", ":"))
+
+
+class FiveGAMFRequirerCharmEvents(CharmEvents):
+    """List of events that the 5G AMF requirer charm can leverage."""
+
+    amf_available = EventSource(AMFAvailableEvent)
+
+
+class FiveGAMFRequires(Object):
+    """Class to be instantiated by the charm requiring the 5G AMF Interface."""
+
+    on = FiveGAMFRequirerCharmEvents()
+
+    def __init__(self, charm: CharmBase, relationship_name: str):
+        """Init."""
+        super().__init__(charm, relationship_name)
+        self.charm = charm
+        self.relationship_name = relationship_name
+        self._documents: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.framework.observe(
+            charm.on[relationship_name].relation_changed, self._on_relation_changed
+        )
+
+    def _on_relation_changed(self, event: RelationChangedEvent) -> None:
+        """Handler triggered on relation changed event.
+
+        Args:
+            event: Juju event (RelationChangedEvent)
+
+        Returns:
+            None
+        """
+        relation = event.relation
+        if not relation.app:
+            logger.warning("No remote application in relation: %s", self.relationship_name)
+            return
+        amf_information = self._amf_information(relation.data[relation.app])
+        if not amf_information:
+            logger.info("No AMF information in relation data - Not triggering amf_available event")
+            return
+        self.on.amf_available.emit(
+            amf_ipv4_address=amf_information.ipv4_address,
+            amf_fqdn=amf_information.fqdn,
+            amf_port=amf_information.port,
+            amf_api_version=amf_information.api_version,
+        )
+
+    @property
+    def amf_information(self) -> Optional[AMFInformation]:
+        """Returns the service address of the remote AMF application, if published."""
+        relation = self.model.get_relation(relation_name=self.relationship_name)
+        if not relation or not relation.app:
+            return None
+        return self._amf_information(relation.data[relation.app])
+
+    @property
+    def amf_instances(self) -> List[AMFInstance]:
+        """Returns the AMF instances published by the units of the remote AMF application.
+
+        Units that did not publish every field yet are left out.
+        """
+        relation = self.model.get_relation(relation_name=self.relationship_name)
+        if not relation:
+            return []
+        instances = []
+        for unit in sorted(relation.units, key=lambda unit: unit.name):
+            fields = self._fields(relation.data[unit], AMF_INSTANCE_KEY, LEGACY_AMF_INSTANCE_KEYS)
+            if not fields:
+                continue
+            instances.append(
+                AMFInstance(
+                    unit_name=unit.name,
+                    **{**fields, "relative_capacity": int(fields["relative_capacity"])},
+                )
+            )
+        return instances
+
+    def _amf_information(self, relation_data: Mapping[str, str]) -> Optional[AMFInformation]:
+        fields = self._fields(relation_data, AMF_KEY, LEGACY_AMF_KEYS)
+        return AMFInformation(**fields) if fields else None
+
+    def _fields(
+        self, relation_data: Mapping[str, str], key: str, legacy_keys: Mapping[str, str]
+    ) -> Optional[Dict[str, Any]]:
+        """Returns the fields of a data bag, from its JSON document or from the v0 keys.
+
+        Returns:
+            dict: Fields by name, None if any is missing.
+        """
+        if key in relation_data:
+            document = self._document(relation_data[key])
+            if document and all(name in document for name in legacy_keys):
+                return {name: document[name] for name in legacy_keys}
+        if not all(legacy_key in relation_data for legacy_key in legacy_keys.values()):
+            return None
+        return {name: relation_data[legacy_key] for name, legacy_key in legacy_keys.items()}
+
+    def _document(self, raw_document: str) -> Optional[Dict[str, Any]]:
+        """Parses a JSON document, each distinct document is only parsed once."""
+        if raw_document not in self._documents:
+            try:
+                document = json.loads(raw_document)
+            except ValueError:
+                document = None
+            if not isinstance(document, dict) or document.get("version") != DOCUMENT_VERSION:
+                logger.warning("Unsupported AMF document in relation data: %s", raw_document)
+                document = None
+            self._documents[raw_document] = document
+        return self._documents[raw_document]
+
+
+class FiveGAMFProvides(Object):
+    """Class to be instantiated by the AMF charm providing the 5G AMF Interface."""
+
+    def __init__(self, charm: CharmBase, relationship_name: str):
+        """Init."""
+        super().__init__(charm, relationship_name)
+        self.relationship_name = relationship_name
+        self.charm = charm
+
+    def set_amf_information(
+        self,
+        amf_ipv4_address: str,
+        amf_fqdn: str,
+        amf_port: str,
+        amf_api_version: str,
+        relation_id: int,
+    ) -> None:
+        """Sets AMF information in relation data.
+
+        Args:
+            amf_ipv4_address: AMF address
+            amf_fqdn: AMF FQDN
+            amf_port: AMF port
+            amf_api_version: AMF API version
+            relation_id: Relation ID
+
+        Returns:
+            None
+        """
+        relation = self.model.get_relation(self.relationship_name, relation_id=relation_id)
+        if not relation:
+            raise RuntimeError(f"Relation {self.relationship_name} not created yet.")
+        fields = {
+            "ipv4_address": amf_ipv4_address,
+            "fqdn": amf_fqdn,
+            "port": amf_port,
+            "api_version": amf_api_version,
+        }
+        relation.data[self.charm.app].update(
+            {
+                AMF_KEY: _encode(fields),
+                **{LEGACY_AMF_KEYS[name]: value for name, value in fields.items()},
+            }
+        )
+
+    def set_amf_unit_information(
+        self,
+        amf_address: str,
+        amf_fqdn: str,
+        guami_mcc: str,
+        guami_mnc: str,
+        guami_region_id: str,
+        guami_amf_set_id: str,
+        guami_amf_pointer: str,
+        relative_capacity: int,
+        relation_id: int,
+    ) -> None:
+        """Sets the information of this AMF unit in its unit relation data.
+
+        Unlike `set_amf_information`, this is called by every unit of the AMF application.
+
+        Args:
+            amf_address: Address of this AMF unit
+            amf_fqdn: FQDN of this AMF unit
+            guami_mcc: GUAMI MCC
+            guami_mnc: GUAMI MNC
+            guami_region_id: GUAMI AMF Region ID
+            guami_amf_set_id: GUAMI AMF Set ID
+            guami_amf_pointer: GUAMI AMF Pointer of this unit
+            relative_capacity: Relative capacity of this AMF unit
+            relation_id: Relation ID
+
+        Returns:
+            None
+        """
+        relation = self.model.get_relation(self.relationship_name, relation_id=relation_id)
+        if not relation:
+            raise RuntimeError(f"Relation {self.relationship_name} not created yet.")
+        fields = {
+            "address": amf_address,
+            "fqdn": amf_fqdn,
+            "mcc": guami_mcc,
+            "mnc": guami_mnc,
+            "region_id": guami_region_id,
+            "amf_set_id": guami_amf_set_id,
+            "amf_pointer": guami_amf_pointer,
+            "relative_capacity": relative_capacity,
+        }
+        relation.data[self.charm.unit].update(
+            {
+                AMF_INSTANCE_KEY: _encode(fields),
+                **{LEGACY_AMF_INSTANCE_KEYS[name]: str(value) for name, value in fields.items()},
+            }
+        )
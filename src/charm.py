@@ -4,67 +4,152 @@
 
 """Charmed Operator for the OpenAirInterface 5G Core AMF component."""
 
-
+import dataclasses
+import hashlib
+import json
 import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional
 
 from charms.data_platform_libs.v0.database_requires import (  # type: ignore[import]
     DatabaseRequires,
 )
-from charms.oai_5g_amf.v0.fiveg_amf import FiveGAMFProvides  # type: ignore[import]
 from charms.oai_5g_amf.v0.fiveg_n2 import FiveGN2Provides  # type: ignore[import]
+from charms.oai_5g_amf.v1.fiveg_amf import FiveGAMFProvides  # type: ignore[import]
 from charms.oai_5g_ausf.v0.fiveg_ausf import FiveGAUSFRequires  # type: ignore[import]
 from charms.oai_5g_nrf.v0.fiveg_nrf import FiveGNRFRequires  # type: ignore[import]
 from charms.oai_5g_udm.v0.oai_5g_udm import FiveGUDMRequires  # type: ignore[import]
-from charms.observability_libs.v1.kubernetes_service_patch import (  # type: ignore[import]
-    KubernetesServicePatch,
-    ServicePort,
-)
 from jinja2 import Environment, FileSystemLoader
-from ops.charm import CharmBase, ConfigChangedEvent
+from lightkube import ApiError
+from lightkube.models.core_v1 import ServicePort
+from lightkube.utils.quantity import parse_quantity
+from ops.charm import ActionEvent, CharmBase, ConfigChangedEvent
+from ops.framework import StoredState
 from ops.main import main
-from ops.model import ActiveStatus, BlockedStatus, ModelError, WaitingStatus
-
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+    MaintenanceStatus,
+    ModelError,
+    Relation,
+    StatusBase,
+    WaitingStatus,
+)
+from ops.pebble import CheckInfo, CheckLevel, CheckStatus, PathError
+
+from charm_config import CharmConfig
+from config_renderer import (
+    changed_sections,
+    render_config,
+    render_section,
+    section_digests,
+)
+from config_validator import ConfigValidationError, validate_amf_config
+from fqdn_pinning import cache_expired, pinned_address
 from kubernetes import Kubernetes
+from nf_relations import NFInstance, nf_instances
+from sbi_proxy import (
+    SBI_PROXY_ADDRESS,
+    SBI_PROXY_FQDN,
+    SBI_PROXY_LISTENER_PORTS,
+    Endpoint,
+    render_sbi_proxy_config,
+)
 
 logger = logging.getLogger(__name__)
 
 BASE_CONFIG_PATH = "/openair-amf/etc"
 CONFIG_FILE_NAME = "amf.conf"
+CONFIG_HISTORY_DIRECTORY = f"{BASE_CONFIG_PATH}/history"
+CONFIG_HISTORY_SIZE = 3
+WORKLOAD_CHECK_PERIOD_SECONDS = 3
+WORKLOAD_CHECK_TIMEOUT_SECONDS = 2
+WORKLOAD_CHECK_THRESHOLD = 5
+WORKLOAD_STARTUP_GRACE_SECONDS = WORKLOAD_CHECK_PERIOD_SECONDS * WORKLOAD_CHECK_THRESHOLD
+WORKLOAD_HEALTH_WINDOW_SECONDS = WORKLOAD_STARTUP_GRACE_SECONDS
+WORKLOAD_HEALTH_POLL_INTERVAL_SECONDS = 1
+PEER_RELATION_NAME = "replicas"
+RESTART_REQUESTED_KEY = "restart-requested"
+RESTART_LOCK_HOLDERS_KEY = "restart-lock-holders"
+ROLLED_BACK_STATUS_MESSAGE = "AMF was not healthy with the new config, restored last known good"
 DATABASE_NAME = "oai_db"
+NGAP_MULTUS_INTERFACE_NAME = "ngap"
+NGAP_PORT = 38412
+N11_PORT = 80
+N11_HTTP2_PORT = 9090
+CGROUP_V2_CPU_STAT_PATH = "/sys/fs/cgroup/cpu.stat"
+LOG_DIRECTORY = f"{BASE_CONFIG_PATH}/log"
+LOG_FILE_PATH = f"{LOG_DIRECTORY}/amf.log"
+LOG_RATE_FILE_PATH = f"{LOG_DIRECTORY}/rate"
+LOG_ROTATE_SCRIPT_NAME = "log-rotate.sh"
+LOG_ROTATE_SERVICE_NAME = "log-rotate"
+LOG_ROTATE_INTERVAL_SECONDS = 10
+NGAP_CHECK_NAME = "ngap"
+SBI_CHECK_NAME = "sbi"
+DRAIN_CHECK_NAME = "drain"
+DRAIN_MARKER_PATH = f"{BASE_CONFIG_PATH}/draining"
+MAX_AMF_POINTER = 63
+SBI_PROXY_SERVICE_NAME = "sbi-proxy"
+SBI_PROXY_CONFIG_PATH = f"{BASE_CONFIG_PATH}/sbi-proxy.yaml"
+SBI_PROXY_BINARIES = ["/usr/local/bin/envoy", "/usr/bin/envoy"]
+SIDECAR_CONTAINER_RESOURCES = {"cpu": "250m", "memory": "256Mi"}
+WORKLOAD_CHECK_NAMES = [NGAP_CHECK_NAME, SBI_CHECK_NAME]
+PINNED_PEERS = {"n11": ["smf_0", "smf_1"], "nf_peers": ["nrf", "udm", "ausf", "nssf"]}
+ALLOCATOR_LIBRARIES = {
+    "default": [],
+    "jemalloc": [
+        "/usr/lib/x86_64-linux-gnu/libjemalloc.so.2",
+        "/usr/lib/aarch64-linux-gnu/libjemalloc.so.2",
+        "/usr/local/lib/libjemalloc.so.2",
+    ],
+    "tcmalloc": [
+        "/usr/lib/x86_64-linux-gnu/libtcmalloc_minimal.so.4",
+        "/usr/lib/aarch64-linux-gnu/libtcmalloc_minimal.so.4",
+        "/usr/local/lib/libtcmalloc_minimal.so.4",
+    ],
+}
+
+
+def _parsed_quantities(resources: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns nested resource requirements with parsed quantities, so that 1Gi equals 1024Mi."""
+    return {
+        key: _parsed_quantities(value) if isinstance(value, dict) else parse_quantity(value)
+        for key, value in resources.items()
+    }
+
+
+def _digest(data: Any) -> str:
+    """Returns a digest of JSON serializable data, independent of key order."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
 
 
 class Oai5GAMFOperatorCharm(CharmBase):
     """Charm the service."""
 
+    _stored: Any = StoredState()
+
     def __init__(self, *args):
         """Observes juju events."""
         super().__init__(*args)
+        self._stored.set_default(
+            config_digest="",
+            layer_digest="",
+            relation_data_digests={},
+            ngap_address="",
+            ngap_address_source="",
+            config_sections={},
+            config_section_digests={},
+            failed_config_digest="",
+            known_good_layer="",
+            resolved_fqdns={},
+            statefulset_digest="",
+            ready_network_attachment="",
+            nf_relation_data_digest="",
+        )
         self._container_name = self._service_name = "amf"
         self._container = self.unit.get_container(self._container_name)
-        self.service_patcher = KubernetesServicePatch(
-            charm=self,
-            service_type="LoadBalancer",
-            ports=[
-                ServicePort(
-                    name="oai-amf",
-                    port=int(self._config_ngap_amf_interface_port),
-                    protocol="SCTP",
-                    targetPort=int(self._config_ngap_amf_interface_port),
-                ),
-                ServicePort(
-                    name="http1",
-                    port=int(self._config_n11_amf_interface_port),
-                    protocol="TCP",
-                    targetPort=int(self._config_n11_amf_interface_port),
-                ),
-                ServicePort(
-                    name="http2",
-                    port=int(self._config_n11_amf_interface_http2_port),
-                    protocol="TCP",
-                    targetPort=int(self._config_n11_amf_interface_http2_port),
-                ),
-            ],
-        )
+        self._cached_charm_config: Optional[CharmConfig] = None
         self.kubernetes = Kubernetes(namespace=self.model.name)
         self.amf_provides = FiveGAMFProvides(self, "fiveg-amf")
         self.n2_provides = FiveGN2Provides(self, "fiveg-n2")
@@ -74,15 +159,113 @@ class Oai5GAMFOperatorCharm(CharmBase):
         self.database = DatabaseRequires(
             self, relation_name="database", database_name=DATABASE_NAME
         )
+        self.framework.observe(self.on.install, self._on_install)
+        self.framework.observe(self.on.upgrade_charm, self._on_upgrade_charm)
+        self.framework.observe(self.on.remove, self._on_remove)
         self.framework.observe(self.on.config_changed, self._on_config_changed)
-        self.framework.observe(self.on.fiveg_nrf_relation_changed, self._on_config_changed)
-        self.framework.observe(self.on.fiveg_udm_relation_changed, self._on_config_changed)
-        self.framework.observe(self.on.fiveg_ausf_relation_changed, self._on_config_changed)
+        self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(self.on.leader_elected, self._on_leader_elected)
+        self.framework.observe(
+            self.on[PEER_RELATION_NAME].relation_changed, self._on_peer_relation_changed
+        )
+        self.framework.observe(
+            self.on[PEER_RELATION_NAME].relation_departed, self._on_peer_relation_changed
+        )
+        self.framework.observe(self.on.drain_action, self._on_drain_action)
+        self.framework.observe(self.on.resume_action, self._on_resume_action)
+        self.framework.observe(self.on.rollback_config_action, self._on_rollback_config_action)
+        self.framework.observe(self.nrf_requires.on.nrf_available, self._on_nf_available)
+        self.framework.observe(self.udm_requires.on.udm_available, self._on_nf_available)
+        self.framework.observe(self.ausf_requires.on.ausf_available, self._on_nf_available)
         self.framework.observe(self.database.on.database_created, self._on_config_changed)
         self.framework.observe(
             self.on.fiveg_amf_relation_joined, self._on_fiveg_amf_relation_joined
         )
         self.framework.observe(self.on.fiveg_n2_relation_joined, self._on_fiveg_n2_relation_joined)
+        self.framework.observe(
+            self.on.fiveg_amf_relation_broken, self._on_published_relation_broken
+        )
+        self.framework.observe(
+            self.on.fiveg_n2_relation_broken, self._on_published_relation_broken
+        )
+
+    def _on_install(self, event) -> None:
+        """Sets the SBI ports of the Juju service and creates the NGAP LoadBalancer service.
+
+        The Juju service is made a ClusterIP service, as SBI traffic stays in the cluster, also
+        when an earlier revision of the charm made it a LoadBalancer. Only NGAP is exposed
+        outside of the cluster. The `Local` external traffic policy preserves gNB source
+        addresses and avoids an extra node-to-node hop.
+
+        Args:
+            event: Install or Upgrade Charm Event
+        """
+        self.kubernetes.patch_service(
+            name=self.app.name,
+            app_name=self.app.name,
+            ports=[
+                ServicePort(
+                    name="http1",
+                    port=N11_PORT,
+                    protocol="TCP",
+                    targetPort=N11_PORT,
+                ),
+                ServicePort(
+                    name="http2",
+                    port=N11_HTTP2_PORT,
+                    protocol="TCP",
+                    targetPort=N11_HTTP2_PORT,
+                ),
+            ],
+            service_type="ClusterIP",
+        )
+        self.kubernetes.create_load_balancer_service(
+            name=self._ngap_service_name,
+            app_name=self.app.name,
+            port=ServicePort(
+                name="ngap",
+                port=NGAP_PORT,
+                protocol="SCTP",
+                targetPort=NGAP_PORT,
+            ),
+            external_traffic_policy="Local",
+        )
+
+    def _on_upgrade_charm(self, event) -> None:
+        """Drops the rendered config sections, as the new charm may ship different templates.
+
+        Args:
+            event: Upgrade Charm Event
+        """
+        self._stored.config_sections = {}
+        self._on_install(event)
+
+    def _on_remove(self, event) -> None:
+        """Deletes the NGAP LoadBalancer service when the application is removed.
+
+        Args:
+            event: Remove Event
+        """
+        if not self.unit.is_leader():
+            return
+        if self.app.planned_units() > 0:
+            return
+        self.kubernetes.delete_service(name=self._ngap_service_name)
+
+    @property
+    def _charm_config(self) -> CharmConfig:
+        """Returns the charm configuration, built on first use.
+
+        The Juju config does not change during a hook, so the configuration is built at most
+        once per hook. It is built again after a config-changed event.
+        """
+        if self._cached_charm_config is None:
+            self._cached_charm_config = CharmConfig.from_charm_config(self.model.config)
+        return self._cached_charm_config
+
+    @property
+    def _ngap_service_name(self) -> str:
+        return f"{self.app.name}-ngap"
 
     def _on_fiveg_amf_relation_joined(self, event) -> None:
         """Triggered when a relation is joined.
@@ -90,40 +273,160 @@ class Oai5GAMFOperatorCharm(CharmBase):
         Args:
             event: Relation Joined Event
         """
-        if not self.unit.is_leader():
-            return
-        if not self._amf_service_started:
-            logger.info("AMF service not started yet, deferring event")
+        if not self._amf_service_is_ready:
+            logger.info("AMF service not ready yet, deferring event")
             event.defer()
             return
-        amf_hostname, amf_ipv4_address = self.kubernetes.get_service_load_balancer_address(
-            name=self.app.name
-        )
+        self._publish_amf_unit_information(event.relation.id)
+        if not self.unit.is_leader():
+            return
+        amf_ipv4_address = self.kubernetes.get_service_cluster_ip(name=self.app.name)
         if not amf_ipv4_address:
-            raise Exception("Loadbalancer doesn't have an IP address")
-        self.amf_provides.set_amf_information(
-            amf_ipv4_address=amf_ipv4_address,
-            amf_fqdn=f"{self.model.app.name}.{self.model.name}.svc.cluster.local",
-            amf_port=self._config_n11_amf_interface_port,
-            amf_api_version=self._config_n11_amf_api_version,
-            relation_id=event.relation.id,
-        )
+            raise Exception("Service doesn't have a cluster IP address")
+        relation_data = {
+            "amf_ipv4_address": amf_ipv4_address,
+            "amf_fqdn": f"{self.model.app.name}.{self.model.name}.svc.cluster.local",
+            "amf_port": str(N11_PORT),
+            "amf_api_version": self._charm_config.n11_api_version,
+        }
+        if self._relation_data_is_published(event.relation.id, relation_data):
+            return
+        self.amf_provides.set_amf_information(**relation_data, relation_id=event.relation.id)
+        self._record_published_relation_data(event.relation.id, relation_data)
+
+    def _publish_amf_unit_information(self, relation_id: int) -> None:
+        """Publishes the address and GUAMI of this AMF unit, for requirers of pooled AMF sets."""
+        if not self._guami_amf_pointer_is_valid:
+            logger.warning("No GUAMI AMF pointer for this unit, not publishing unit information")
+            return
+        binding = self.model.get_binding("fiveg-amf")
+        if not binding:
+            logger.warning("No binding for fiveg-amf, not publishing unit information")
+            return
+        relation_data = {
+            "amf_address": str(binding.network.bind_address),
+            "amf_fqdn": f"{self._pod_name}.{self.app.name}-endpoints.{self.model.name}.svc.cluster.local",  # noqa: E501
+            "guami_mcc": self._charm_config.guami_mcc,
+            "guami_mnc": self._charm_config.guami_mnc,
+            "guami_region_id": self._charm_config.guami_region_id,
+            "guami_amf_set_id": self._charm_config.guami_amf_set_id,
+            "guami_amf_pointer": self._guami_amf_pointer,
+            "relative_capacity": self._charm_config.relative_capacity,
+        }
+        if self._relation_data_is_published(relation_id, relation_data, databag="unit"):
+            return
+        self.amf_provides.set_amf_unit_information(**relation_data, relation_id=relation_id)
+        self._record_published_relation_data(relation_id, relation_data, databag="unit")
+
+    @property
+    def _guami_amf_pointer(self) -> str:
+        """Returns the AMF Pointer of this unit's GUAMI.
+
+        The pointer tells apart the AMFs of a set. It is 6 bits long and derived from the unit
+        number, starting at 1.
+        """
+        return str(self._unit_number + 1)
+
+    @property
+    def _guami_amf_pointer_is_valid(self) -> bool:
+        """Returns whether the AMF Pointer of this unit fits in 6 bits.
+
+        Pointers are not wrapped, as two AMFs of a set with the same GUAMI would steal each
+        other's UEs.
+        """
+        return self._unit_number + 1 <= MAX_AMF_POINTER
+
+    @property
+    def _unit_number(self) -> int:
+        return int(self.unit.name.split("/")[-1])
 
     def _on_fiveg_n2_relation_joined(self, event) -> None:
+        """Publishes the NGAP address to a new gNB.
+
+        The address published last is reused, so that joining gNBs do not each cost a
+        Kubernetes API call. Changes of the address are picked up on update-status.
+
+        Args:
+            event: Relation Joined Event
+        """
         if not self.unit.is_leader():
             return
-        if not self._amf_service_started:
-            logger.info("AMF service not started yet, deferring event")
+        if not self._amf_service_is_ready:
+            logger.info("AMF service not ready yet, deferring event")
             event.defer()
             return
-        amf_hostname, amf_ipv4_address = self.kubernetes.get_service_load_balancer_address(
-            name=self.app.name
-        )
-        if not amf_ipv4_address:
-            raise Exception("Loadbalancer doesn't have an IP address")
-        self.n2_provides.set_amf_information(
-            amf_address=amf_ipv4_address, relation_id=event.relation.id
+        amf_address = self._stored.ngap_address or self._ngap_address
+        if not amf_address:
+            raise Exception("NGAP interface doesn't have an IP address")
+        self._publish_ngap_address(amf_address, relation_id=event.relation.id)
+
+    def _forget_ngap_address_of_previous_source(self) -> None:
+        """Forgets the published NGAP address when it switches between Multus and LoadBalancer.
+
+        Joining gNBs then get the address of the new source, and update-status republishes it
+        to the gNBs that got the previous one.
+        """
+        source = self._charm_config.ngap_network_attachment_definition
+        if source == self._stored.ngap_address_source:
+            return
+        self._stored.ngap_address_source = source
+        self._stored.ngap_address = ""
+
+    def _publish_ngap_address(self, amf_address: str, relation_id: int) -> None:
+        relation_data = {"amf_address": amf_address}
+        self._stored.ngap_address = amf_address
+        if self._relation_data_is_published(relation_id, relation_data):
+            return
+        self.n2_provides.set_amf_information(amf_address=amf_address, relation_id=relation_id)
+        self._record_published_relation_data(relation_id, relation_data)
+
+    def _on_published_relation_broken(self, event) -> None:
+        """Forgets the digests of the data published on a removed relation.
+
+        Args:
+            event: Relation Broken Event
+        """
+        for key in list(self._stored.relation_data_digests):
+            if key.startswith(f"{event.relation.id}/"):
+                del self._stored.relation_data_digests[key]
+
+    def _relation_data_is_published(
+        self, relation_id: int, relation_data: dict, databag: str = "app"
+    ) -> bool:
+        """Returns whether this unit already published the given data on the relation."""
+        published_digest = self._stored.relation_data_digests.get(f"{relation_id}/{databag}")
+        return published_digest == _digest(relation_data)
+
+    def _record_published_relation_data(
+        self, relation_id: int, relation_data: dict, databag: str = "app"
+    ) -> None:
+        self._stored.relation_data_digests[f"{relation_id}/{databag}"] = _digest(relation_data)
+
+    @property
+    def _ngap_address(self) -> Optional[str]:
+        """Returns the address gNBs should use to reach the AMF over NGAP.
+
+        When a Multus network attachment is configured, this is the address of the secondary
+        interface of the leader's pod. Otherwise, it is the LoadBalancer address.
+        """
+        if self._charm_config.ngap_network_attachment_definition:
+            return self.kubernetes.get_pod_network_attachment_ip(
+                pod_name=self._pod_name, interface_name=NGAP_MULTUS_INTERFACE_NAME
+            )
+        _, amf_ipv4_address = self.kubernetes.get_service_load_balancer_address(
+            name=self._ngap_service_name
         )
+        return amf_ipv4_address
+
+    @property
+    def _ngap_interface_name(self) -> str:
+        if self._charm_config.ngap_network_attachment_definition:
+            return NGAP_MULTUS_INTERFACE_NAME
+        return self._charm_config.ngap_interface_name
+
+    @property
+    def _pod_name(self) -> str:
+        return self.unit.name.replace("/", "-")
 
     @property
     def _amf_service_started(self) -> bool:
@@ -137,422 +440,1068 @@ class Oai5GAMFOperatorCharm(CharmBase):
             return False
         return True
 
+    @property
+    def _amf_service_is_ready(self) -> bool:
+        """Returns whether the AMF serves NGAP and SBI, based on its Pebble checks.
+
+        A running process may not have bound its interfaces yet, so relation data is only
+        published once every readiness check is up.
+        """
+        if not self._amf_service_started:
+            return False
+        checks = self._container.get_checks(*WORKLOAD_CHECK_NAMES, level=CheckLevel.READY)
+        if set(checks) != set(WORKLOAD_CHECK_NAMES):
+            return False
+        return all(check.status == CheckStatus.UP for check in checks.values())
+
     def _on_config_changed(self, event: ConfigChangedEvent) -> None:
         """Triggered on any change in configuration.
 
+        A unit that cannot apply its configuration withdraws its request for the rolling
+        restart lock, so that it does not keep other units from restarting.
+
         Args:
             event: Config Changed Event
 
         Returns:
             None
         """
-        if not self._container.can_connect():
-            self.unit.status = WaitingStatus("Waiting for Pebble in workload container")
-            event.defer()
-            return
-        if not self._database_relation_created:
-            self.unit.status = BlockedStatus("Waiting for relation to database to be created")
-            return
-        if not self._nrf_relation_created:
-            self.unit.status = BlockedStatus("Waiting for relation to NRF to be created")
-            return
-        if not self._udm_relation_created:
-            self.unit.status = BlockedStatus("Waiting for relation to UDM to be created")
-            return
-        if not self._ausf_relation_created:
-            self.unit.status = BlockedStatus("Waiting for relation to AUSF to be created")
+        if isinstance(event, ConfigChangedEvent):
+            self._cached_charm_config = None
+            self._forget_ngap_address_of_previous_source()
+        if status := self._workload_blocking_status(event):
+            self.unit.status = status
+            self._release_restart_lock()
             return
-        if not self._database_relation_data_is_available:
-            self.unit.status = WaitingStatus("Waiting for database relation data to be available")
-            return
-        if not self.nrf_requires.nrf_ipv4_address_available:
-            self.unit.status = WaitingStatus(
-                "Waiting for NRF IPv4 address to be available in relation data"
-            )
-            return
-        if not self.udm_requires.udm_ipv4_address_available:
-            self.unit.status = WaitingStatus(
-                "Waiting for UDM IPv4 address to be available in relation data"
-            )
+        self._configure_workload()
+
+    def _on_nf_available(self, event) -> None:
+        """Reconfigures the AMF when the NRF, UDM or AUSF data it uses changed.
+
+        The NF requirer libraries emit their available event on every relation-changed, also
+        when only keys the AMF does not use changed.
+
+        Args:
+            event: NRF, UDM or AUSF Available Event
+        """
+        nf_relation_data_digest = _digest(self._nf_relation_data)
+        if nf_relation_data_digest == self._stored.nf_relation_data_digest:
+            logger.debug("NF relation data used by the AMF did not change")
             return
-        if not self.ausf_requires.ausf_ipv4_address_available:
-            self.unit.status = WaitingStatus(
-                "Waiting for AUSF IPv4 address to be available in relation data"
+        self._on_config_changed(event)
+        if not event.deferred:
+            self._stored.nf_relation_data_digest = nf_relation_data_digest
+
+    @property
+    def _nf_relation_data(self) -> Dict[str, Any]:
+        """Returns the NRF, UDM and AUSF relation data used by the AMF."""
+        nrf_relation_data = {}
+        if self._relation_created("fiveg-nrf"):
+            nrf_relation_data = {
+                field: getattr(self.nrf_requires, f"nrf_{field}")
+                for field in ("ipv4_address", "fqdn", "port", "api_version")
+            }
+        return {
+            "nrf": nrf_relation_data,
+            **{
+                nf: [dataclasses.astuple(instance) for instance in self._nf_instances(nf)]
+                for nf in ("udm", "ausf")
+            },
+        }
+
+    def _nf_instances(self, nf: str) -> List[NFInstance]:
+        return nf_instances(nf, self.model.relations[f"fiveg-{nf}"])
+
+    def _workload_blocking_status(self, event: ConfigChangedEvent) -> Optional[StatusBase]:
+        """Returns the status to set when the AMF cannot be configured yet, None otherwise.
+
+        Args:
+            event: Event being handled, deferred when Pebble is not reachable yet
+        """
+        if config_error := self._charm_config.validate():
+            return BlockedStatus(config_error)
+        if not self._guami_amf_pointer_is_valid:
+            return BlockedStatus(
+                f"Unit number {self._unit_number} exceeds the GUAMI AMF pointer range "
+                f"(at most {MAX_AMF_POINTER - 1})"
             )
-            return
-        self._push_config()
-        self._update_pebble_layer()
-        self.unit.status = ActiveStatus()
+        if self.unit.is_leader():
+            self._patch_statefulset()
+        if not self._container.can_connect():
+            event.defer()
+            return WaitingStatus("Waiting for Pebble in workload container")
+        if relations_status := self._relations_status:
+            return relations_status
+        if not self._ngap_network_attachment_is_ready:
+            return WaitingStatus("Waiting for NGAP network attachment to be ready")
+        if self._charm_config.sbi_proxy and not self._sbi_proxy_binary:
+            return BlockedStatus("sbi-proxy requires Envoy in the workload image")
+        return None
+
+    @property
+    def _sbi_proxy_config(self) -> Optional[str]:
+        """Returns the rendered SBI proxy config, None when `sbi-proxy` is disabled."""
+        if not self._charm_config.sbi_proxy:
+            return None
+        return render_sbi_proxy_config(self._sbi_proxy_upstreams)
+
+    def _sbi_proxy_is_up_to_date(self, content: Optional[str]) -> bool:
+        """Returns whether the SBI proxy runs with the given config, or is stopped when None."""
+        if content is None:
+            service = self._container.get_plan().services.get(SBI_PROXY_SERVICE_NAME)
+            service_disabled = not service or service.startup == "disabled"
+            return service_disabled and not self._sbi_proxy_service_is_running
+        try:
+            pushed_content = self._container.pull(SBI_PROXY_CONFIG_PATH).read()
+        except PathError:
+            return False
+        return pushed_content == content and self._sbi_proxy_service_is_running
 
-    def _update_pebble_layer(self) -> None:
-        """Updates pebble layer with new configuration.
+    def _configure_sbi_proxy(self, content: Optional[str]) -> None:
+        """Pushes the SBI proxy config and runs Envoy next to the AMF when `sbi-proxy` is enabled.
 
-        Returns:
-            None
+        Envoy does not watch its bootstrap file, so the proxy is restarted when it changes.
+        When the option is disabled, the proxy is stopped and left out of the startup services.
+
+        Args:
+            content: Rendered SBI proxy config, None when the proxy is disabled
         """
-        self._container.add_layer("amf", self._pebble_layer, combine=True)
-        self._container.replan()
-        self._container.restart(self._service_name)
+        binary = self._sbi_proxy_binary if content is not None else None
+        if content is None or not binary:
+            if SBI_PROXY_SERVICE_NAME in self._container.get_plan().services:
+                self._container.add_layer(
+                    SBI_PROXY_SERVICE_NAME,
+                    {
+                        "services": {
+                            SBI_PROXY_SERVICE_NAME: {"override": "merge", "startup": "disabled"}
+                        }
+                    },
+                    combine=True,
+                )
+            if self._sbi_proxy_service_is_running:
+                self._container.stop(SBI_PROXY_SERVICE_NAME)
+            return
+        try:
+            config_changed = self._container.pull(SBI_PROXY_CONFIG_PATH).read() != content
+        except PathError:
+            config_changed = True
+        if config_changed:
+            self._container.push(path=SBI_PROXY_CONFIG_PATH, source=content, make_dirs=True)
+            logger.info("Wrote SBI proxy config to container")
+        self._container.add_layer(
+            SBI_PROXY_SERVICE_NAME, self._sbi_proxy_pebble_layer(binary), combine=True
+        )
+        if not self._sbi_proxy_service_is_running:
+            self._container.start(SBI_PROXY_SERVICE_NAME)
+        elif config_changed:
+            self._container.restart(SBI_PROXY_SERVICE_NAME)
 
     @property
-    def _database_relation_created(self) -> bool:
-        return self._relation_created("database")
+    def _sbi_proxy_service_is_running(self) -> bool:
+        services = self._container.get_services(SBI_PROXY_SERVICE_NAME)
+        return SBI_PROXY_SERVICE_NAME in services and services[SBI_PROXY_SERVICE_NAME].is_running()
 
-    @property
-    def _nrf_relation_created(self) -> bool:
-        return self._relation_created("fiveg-nrf")
+    @staticmethod
+    def _sbi_proxy_pebble_layer(binary: str) -> dict:
+        return {
+            "summary": "sbi-proxy layer",
+            "description": "pebble config layer for the SBI egress proxy",
+            "services": {
+                SBI_PROXY_SERVICE_NAME: {
+                    "override": "replace",
+                    "summary": "sbi-proxy",
+                    "command": f"{binary} -c {SBI_PROXY_CONFIG_PATH} --log-level warn",
+                    "startup": "enabled",
+                }
+            },
+        }
 
     @property
-    def _udm_relation_created(self) -> bool:
-        return self._relation_created("fiveg-udm")
+    def _sbi_proxy_binary(self) -> Optional[str]:
+        """Returns the path of Envoy in the workload image, which stock AMF images do not ship."""
+        for binary_path in SBI_PROXY_BINARIES:
+            if self._container.exists(binary_path):
+                return binary_path
+        return None
 
     @property
-    def _ausf_relation_created(self) -> bool:
-        return self._relation_created("fiveg-ausf")
+    def _sbi_proxy_upstreams(self) -> Dict[str, List[Endpoint]]:
+        """Returns the NRF, UDM and AUSF instances to proxy, from relation data."""
+        upstreams: Dict[str, List[Endpoint]] = {"nrf": [], "udm": [], "ausf": []}
+        if self.nrf_requires.nrf_ipv4_address and self.nrf_requires.nrf_port:
+            upstreams["nrf"].append(
+                (self.nrf_requires.nrf_ipv4_address, int(self.nrf_requires.nrf_port))
+            )
+        for nf in ("udm", "ausf"):
+            for instance in self._nf_instances(nf):
+                upstreams[nf].append((instance.ipv4_address, int(instance.port)))
+        return upstreams
+
+    def _configure_workload(self) -> None:
+        """Pushes the config file and Pebble layer, restarting the AMF when either changed."""
+        sections = self._render_config_sections()
+        content = render_config(sections)
+        config_digest = _digest(content)
+        layer = self._pebble_layer
+        layer_digest = _digest(layer)
+        if _digest([config_digest, layer_digest]) == self._stored.failed_config_digest:
+            self._release_restart_lock()
+            self.unit.status = BlockedStatus(ROLLED_BACK_STATUS_MESSAGE)
+            return
+        if self._workload_is_up_to_date(config_digest, layer_digest):
+            logger.info("Config file and Pebble layer are unchanged")
+            self._release_restart_lock()
+            self.unit.status = ActiveStatus(self._active_status_message)
+            return
+        try:
+            validate_amf_config(content)
+        except ConfigValidationError as e:
+            self._release_restart_lock()
+            self.unit.status = BlockedStatus(f"Invalid AMF config: {e}")
+            return
+        if not self._restart_lock_acquired():
+            self.unit.status = MaintenanceStatus("Waiting for rolling restart lock")
+            return
+        self._apply_workload_config(sections, content, layer)
+        self._release_restart_lock()
 
-    def _relation_created(self, relation_name: str) -> bool:
-        if not self.model.get_relation(relation_name):
-            return False
-        return True
+    def _apply_workload_config(
+        self, sections: Optional[Dict[str, str]], content: str, layer: dict
+    ) -> bool:
+        """Pushes the config file and Pebble layer and waits for the AMF to be healthy.
 
-    @property
-    def _database_relation_data_is_available(self) -> bool:
-        relation_data = self.database.fetch_relation_data()
-        if not relation_data:
-            return False
-        relation = self.model.get_relation(relation_name="database")
-        if not relation:
-            return False
-        if "username" not in relation_data[relation.id]:
-            return False
-        if "password" not in relation_data[relation.id]:
-            return False
-        if "endpoints" not in relation_data[relation.id]:
+        Args:
+            sections: Rendered sections of the config file, None for an archived config file
+                whose sections are not known. The section digests are then cleared, so the next
+                rendered config file reports all of its sections as changed.
+            content: Content of the config file
+            layer: Pebble layer
+
+        Returns:
+            bool: Whether the AMF became healthy, otherwise the known good config is restored.
+        """
+        if sections is None:
+            logger.info("Applying an archived config file, AMF config section digests cleared")
+        elif updated_sections := changed_sections(sections, self._stored.config_section_digests):
+            logger.info("AMF config sections changed: %s", ", ".join(updated_sections))
+        config_file_changed = self._push_config(content)
+        if self._charm_config.log_sink == "file":
+            self._push_log_rotate_script()
+        self._update_pebble_layer(config_file_changed, self._sbi_proxy_config)
+        if not self._workload_became_healthy():
+            self._restore_known_good_config(content, layer)
             return False
+        self._stored.failed_config_digest = ""
+        self._stored.config_digest = _digest(content)
+        self._stored.layer_digest = _digest(layer)
+        self._stored.known_good_layer = json.dumps(layer)
+        self._stored.config_section_digests = section_digests(sections) if sections else {}
+        for relation in self.model.relations["fiveg-amf"]:
+            self._publish_amf_unit_information(relation.id)
+        self.unit.status = ActiveStatus(self._active_status_message)
         return True
 
-    def _push_config(self) -> None:
-        jinja2_environment = Environment(loader=FileSystemLoader("src/templates/"))
-        template = jinja2_environment.get_template(f"{CONFIG_FILE_NAME}.j2")
-        content = template.render(
-            instance=self._config_instance,
-            pid_directory=self._config_pid_directory,
-            amf_name=self._config_amf_name,
-            guami_mcc=self._config_guami_mcc,
-            guami_mnc=self._config_guami_mnc,
-            guami_region_id=self._config_guami_region_id,
-            guami_amf_set_id=self._config_guami_amf_set_id,
-            served_guami_0_mcc=self._config_served_guami_0_mcc,
-            served_guami_0_mnc=self._config_served_guami_0_mnc,
-            served_guami_0_region_id=self._config_served_guami_0_region_id,
-            served_guami_0_amf_set_id=self._config_served_guami_0_amf_set_id,
-            served_guami_1_mcc=self._config_served_guami_1_mcc,
-            served_guami_1_mnc=self._config_served_guami_1_mnc,
-            served_guami_1_region_id=self._config_served_guami_1_region_id,
-            served_guami_1_amf_set_id=self._config_served_guami_1_amf_set_id,
-            plmn_0_support_mcc=self._config_plmn_0_support_mcc,
-            plmn_0_support_mnc=self._config_plmn_0_support_mnc,
-            plmn_0_support_tac=self._config_plmn_0_support_tac,
-            plmn_0_slice_0_sd=self._config_plmn_0_slice_0_sd,
-            plmn_0_slice_1_sd=self._config_plmn_0_slice_1_sd,
-            plmn_0_slice_2_sd=self._config_plmn_0_slice_2_sd,
-            plmn_0_slice_0_sst=self._config_plmn_0_slice_0_sst,
-            plmn_0_slice_1_sst=self._config_plmn_0_slice_1_sst,
-            plmn_0_slice_2_sst=self._config_plmn_0_slice_2_sst,
-            ngap_amf_interface_name=self._config_ngap_amf_interface_name,
-            ngap_amf_interface_port=self._config_ngap_amf_interface_port,
-            n11_amf_interface_name=self._config_n11_amf_interface_name,
-            n11_amf_interface_port=self._config_n11_amf_interface_port,
-            n11_amf_api_version=self._config_n11_amf_api_version,
-            n11_amf_interface_http2_port=self._config_n11_amf_interface_http2_port,
-            smf_0_instance_id=self._config_smf_0_instance_id,
-            smf_0_ipv4_address=self._config_smf_0_ipv4_address,
-            smf_0_port=self._config_smf_0_port,
-            smf_0_http2_port=self._config_smf_0_http2_port,
-            smf_0_api_version=self._config_smf_0_api_version,
-            smf_0_fqdn=self._config_smf_0_fqdn,
-            smf_1_instance_id=self._config_smf_1_instance_id,
-            smf_1_ipv4_address=self._config_smf_1_ipv4_address,
-            smf_1_port=self._config_smf_1_port,
-            smf_1_http2_port=self._config_smf_1_http2_port,
-            smf_1_api_version=self._config_smf_1_api_version,
-            smf_1_fqdn=self._config_smf_1_fqdn,
-            nrf_ipv4_address=self.nrf_requires.nrf_ipv4_address,
-            nrf_port=self.nrf_requires.nrf_port,
-            nrf_api_version=self.nrf_requires.nrf_api_version,
-            nrf_fqdn=self.nrf_requires.nrf_fqdn,
-            udm_ipv4_address=self.udm_requires.udm_ipv4_address,
-            udm_port=self.udm_requires.udm_port,
-            udm_api_version=self.udm_requires.udm_api_version,
-            udm_fqdn=self.udm_requires.udm_fqdn,
-            ausf_ipv4_address=self.ausf_requires.ausf_ipv4_address,
-            ausf_port=self.ausf_requires.ausf_port,
-            ausf_api_version=self.ausf_requires.ausf_api_version,
-            ausf_fqdn=self.ausf_requires.ausf_fqdn,
-            nssf_ipv4_address=self._config_nssf_ipv4_address,
-            nssf_port=self._config_nssf_port,
-            nssf_api_version=self._config_nssf_api_version,
-            nssf_fqdn=self._config_nssf_fqdn,
-            nf_registration=self._config_nf_registration,
-            nrf_selection=self._config_nrf_selection,
-            external_nrf=self._config_external_nrf,
-            smf_selection=self._config_smf_selection,
-            external_ausf=self._config_external_ausf,
-            external_udm=self._config_external_udm,
-            external_nssf=self._config_external_nssf,
-            use_fqdn_dns=self._config_use_fqdn_dns,
-            use_http2=self._config_use_http2,
-            mysql_server=self._database_relation_server,
-            mysql_user=self._database_relation_user,
-            mysql_password=self._database_relation_password,
-            mysql_database=DATABASE_NAME,
-            integrity_algorithm_list=self._config_integrity_algorithm_list,
-            cyphering_algorithm_list=self._config_cyphering_algorithm_list,
+    def _restart_lock_acquired(self) -> bool:
+        """Requests the rolling restart lock and returns whether this unit holds it.
+
+        Restarting every unit of the AMF set at once would drop all NGAP associations together.
+        A unit whose AMF is running takes a lock from the leader before restarting it, so that
+        at most `max-unavailable-units` units restart at the same time and gNBs can fail over
+        to the others. The lock is not needed when the AMF is not running or has no peers.
+        """
+        peer_relation = self.model.get_relation(PEER_RELATION_NAME)
+        if not peer_relation or not peer_relation.units or not self._amf_service_started:
+            return True
+        peer_relation.data[self.unit][RESTART_REQUESTED_KEY] = "true"
+        if self.unit.is_leader():
+            self._grant_restart_locks(peer_relation)
+        return self.unit.name in self._restart_lock_holders(peer_relation)
+
+    def _release_restart_lock(self) -> None:
+        peer_relation = self.model.get_relation(PEER_RELATION_NAME)
+        if not peer_relation or RESTART_REQUESTED_KEY not in peer_relation.data[self.unit]:
+            return
+        del peer_relation.data[self.unit][RESTART_REQUESTED_KEY]
+        if self.unit.is_leader():
+            self._grant_restart_locks(peer_relation)
+
+    def _grant_restart_locks(self, peer_relation: Relation) -> None:
+        """Grants the restart lock to requesting units, up to `max-unavailable-units` at once.
+
+        Holders keep the lock until they withdraw their request or leave the peer relation.
+        """
+        units = [self.unit, *peer_relation.units]
+        requesting_units = sorted(
+            unit.name for unit in units if peer_relation.data[unit].get(RESTART_REQUESTED_KEY)
         )
+        holders = [
+            name for name in self._restart_lock_holders(peer_relation) if name in requesting_units
+        ]
+        for name in requesting_units:
+            if len(holders) >= self._charm_config.max_unavailable_units:
+                break
+            if name not in holders:
+                holders.append(name)
+        peer_relation.data[self.app][RESTART_LOCK_HOLDERS_KEY] = json.dumps(holders)
+
+    def _restart_lock_holders(self, peer_relation: Relation) -> List[str]:
+        return json.loads(peer_relation.data[self.app].get(RESTART_LOCK_HOLDERS_KEY, "[]"))
+
+    def _on_leader_elected(self, event) -> None:
+        """Grants the restart lock, which the previous leader may have left with pending requests.
 
-        self._container.push(path=f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}", source=content)
-        logger.info(f"Wrote file to container: {CONFIG_FILE_NAME}")
+        Args:
+            event: Leader Elected Event
+        """
+        for peer_relation in self.model.relations[PEER_RELATION_NAME]:
+            self._grant_restart_locks(peer_relation)
 
-    @property
-    def _config_file_is_pushed(self) -> bool:
-        """Check if config file is pushed to the container."""
-        if not self._container.exists(f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}"):
-            logger.info(f"Config file is not written: {CONFIG_FILE_NAME}")
-            return False
-        logger.info("Config file is pushed")
-        return True
+    def _on_peer_relation_changed(self, event) -> None:
+        """Hands the restart lock over and restarts the AMF of this unit once it holds the lock.
 
-    @property
-    def _config_instance(self) -> str:
-        return "0"
+        Args:
+            event: Peer Relation Changed or Departed Event
+        """
+        if self.unit.is_leader():
+            self._grant_restart_locks(event.relation)
+        if RESTART_REQUESTED_KEY not in event.relation.data[self.unit]:
+            return
+        if self.unit.name not in self._restart_lock_holders(event.relation):
+            return
+        self._on_config_changed(event)
 
-    @property
-    def _config_pid_directory(self) -> str:
-        return "/var/run"
+    def _workload_became_healthy(self) -> bool:
+        """Watches the AMF after a restart and returns whether it is healthy.
 
-    @property
-    def _config_guami_mcc(self) -> str:
-        return self.model.config["guami-mcc"]
+        The hook waits for at most `WORKLOAD_HEALTH_WINDOW_SECONDS`, the startup grace that the
+        checks give the AMF. Watching stops as soon as the service stops or a check goes down,
+        and as soon as every check passed since the restart, which is known once a check period
+        and timeout went by without failure. At the end of the window, the AMF is healthy if
+        none of its checks is failing.
+        """
+        checks: Mapping[str, CheckInfo] = {}
+        for elapsed in range(
+            WORKLOAD_HEALTH_POLL_INTERVAL_SECONDS,
+            WORKLOAD_HEALTH_WINDOW_SECONDS + 1,
+            WORKLOAD_HEALTH_POLL_INTERVAL_SECONDS,
+        ):
+            time.sleep(WORKLOAD_HEALTH_POLL_INTERVAL_SECONDS)
+            if not self._amf_service_started:
+                return False
+            checks = self._container.get_checks(*WORKLOAD_CHECK_NAMES)
+            if any(check.status == CheckStatus.DOWN for check in checks.values()):
+                return False
+            if elapsed >= WORKLOAD_CHECK_PERIOD_SECONDS + WORKLOAD_CHECK_TIMEOUT_SECONDS and all(
+                check.failures == 0 for check in checks.values()
+            ):
+                return True
+        return all(check.failures == 0 for check in checks.values())
+
+    def _restore_known_good_config(self, failed_content: str, failed_layer: dict) -> None:
+        """Restores the last config file and Pebble layer the AMF was healthy with.
+
+        The charm state holds the digest of the last config file the AMF became healthy with,
+        which is looked up in the archived config files, and the last such layer. The digest of
+        the failed config file and layer is kept so that later hooks do not apply them again
+        until the configuration changes.
 
-    @property
-    def _config_guami_mnc(self) -> str:
-        return self.model.config["guami-mnc"]
+        Args:
+            failed_content: Config file the AMF did not become healthy with
+            failed_layer: Pebble layer the AMF did not become healthy with
+        """
+        if _digest(failed_content) == self._stored.config_digest:
+            known_good_content: Optional[str] = failed_content
+        else:
+            known_good_content = self._archived_config(self._stored.config_digest)
+        if known_good_content is None or not self._stored.known_good_layer:
+            logger.error("AMF did not become healthy, no known good config to restore")
+            self.unit.status = BlockedStatus("AMF did not become healthy after restart")
+            return
+        logger.error("AMF did not become healthy with the new config, restoring known good one")
+        self._push_config(known_good_content)
+        self._container.add_layer("amf", json.loads(self._stored.known_good_layer), combine=True)
+        self._container.restart(self._service_name)
+        self._container.replan()
+        self._stored.failed_config_digest = _digest(
+            [_digest(failed_content), _digest(failed_layer)]
+        )
+        self._stored.config_section_digests = {}
+        self.unit.status = BlockedStatus(ROLLED_BACK_STATUS_MESSAGE)
+
+    def _archived_config(self, config_digest: str) -> Optional[str]:
+        """Returns the most recent archived config file with the given digest, if any."""
+        if not config_digest:
+            return None
+        for path in reversed(self._archived_config_paths):
+            content = self._container.pull(path).read()
+            if _digest(content) == config_digest:
+                return content
+        return None
+
+    def _workload_is_up_to_date(self, config_digest: str, layer_digest: str) -> bool:
+        """Returns whether the AMF already runs with the given config file and Pebble layer.
+
+        The digests of the last applied config file and layer are kept in the charm state, so
+        hooks that change neither do not push files nor restart the AMF. The running service is
+        checked as well since Pebble loses its layers when the workload container restarts.
+        The SBI proxy is compared with its rendered config, as its upstreams can change without
+        changing the config file of the AMF.
+        """
+        if self._stored.config_digest != config_digest:
+            return False
+        if self._stored.layer_digest != layer_digest:
+            return False
+        if not self._sbi_proxy_is_up_to_date(self._sbi_proxy_config):
+            return False
+        return self._amf_service_started
 
-    @property
-    def _config_guami_region_id(self) -> str:
-        return self.model.config["guami-region-id"]
+    def _on_update_status(self, event) -> None:
+        """Refreshes the CPU throttling and log rate statistics shown in the unit status.
 
-    @property
-    def _config_guami_amf_set_id(self) -> str:
-        return self.model.config["guami-amf-set-id"]
+        Pinned FQDNs whose TTL expired are resolved again by configuring the AMF as on a config
+        change, through the same checks.
 
-    @property
-    def _config_served_guami_0_mcc(self) -> str:
-        return self.model.config["served-guami-0-mcc"]
+        Args:
+            event: Update Status Event
+        """
+        if not isinstance(self.unit.status, ActiveStatus):
+            return
+        if not self._container.can_connect():
+            return
+        if self.unit.is_leader():
+            self._republish_ngap_address()
+        if self._charm_config.pins_fqdns and cache_expired(
+            self._stored.resolved_fqdns, self._charm_config.fqdn_pinning_ttl, time.time()
+        ):
+            self._on_config_changed(event)
+            return
+        self.unit.status = ActiveStatus(self._active_status_message)
 
-    @property
-    def _config_served_guami_0_mnc(self) -> str:
-        return self.model.config["served-guami-0-mnc"]
+    def _refresh_active_status(self) -> None:
+        if isinstance(self.unit.status, ActiveStatus):
+            self.unit.status = ActiveStatus(self._active_status_message)
 
-    @property
-    def _config_served_guami_0_region_id(self) -> str:
-        return self.model.config["served-guami-0-region-id"]
+    def _republish_ngap_address(self) -> None:
+        """Publishes the NGAP address again when it changed since it was last published.
 
-    @property
-    def _config_served_guami_0_amf_set_id(self) -> str:
-        return self.model.config["served-guami-0-amf-set-id"]
+        The LoadBalancer address may change when the NGAP service is recreated, and the address
+        is forgotten when the NGAP source changes. When the address cannot be fetched, the
+        published one is kept until a later update-status.
+        """
+        if not self.model.relations["fiveg-n2"]:
+            return
+        try:
+            amf_address = self._ngap_address
+        except (ApiError, RuntimeError) as e:
+            logger.warning("Could not fetch the NGAP address, keeping the published one: %s", e)
+            return
+        if not amf_address or amf_address == self._stored.ngap_address:
+            return
+        for relation in self.model.relations["fiveg-n2"]:
+            self._publish_ngap_address(amf_address, relation_id=relation.id)
 
     @property
-    def _config_served_guami_1_mcc(self) -> str:
-        return self.model.config["served-guami-1-mcc"]
+    def _active_status_message(self) -> str:
+        messages = [self._drain_message, self._cpu_throttling_message, self._log_rate_message]
+        return ", ".join(message for message in messages if message)
 
     @property
-    def _config_served_guami_1_mnc(self) -> str:
-        return self.model.config["served-guami-1-mnc"]
+    def _drain_message(self) -> str:
+        return "Drained, not accepting new NGAP associations" if self._is_drained else ""
 
     @property
-    def _config_served_guami_1_region_id(self) -> str:
-        return self.model.config["served-guami-1-region-id"]
+    def _log_rate_message(self) -> str:
+        """Returns the AMF log rate measured by the log rotation service, in file log sink mode."""
+        if self._charm_config.log_sink != "file":
+            return ""
+        try:
+            bytes_per_second = int(self._container.pull(LOG_RATE_FILE_PATH).read().strip())
+        except (PathError, ValueError):
+            return ""
+        return f"Logging {bytes_per_second / 1024:.1f} KiB/s"
 
     @property
-    def _config_served_guami_1_amf_set_id(self) -> str:
-        return self.model.config["served-guami-1-amf-set-id"]
+    def _cpu_throttling_message(self) -> str:
+        """Returns a summary of the CFS throttling of the workload container.
 
-    @property
-    def _config_plmn_0_support_mcc(self) -> str:
-        return self.model.config["plmn-0-support-mcc"]
+        The statistics are cumulative since the container started and come from the cgroup v2
+        `cpu.stat` file. An empty string is returned when the container was never throttled or
+        when the statistics are not available.
+        """
+        try:
+            cpu_stat = self._container.pull(CGROUP_V2_CPU_STAT_PATH).read()
+        except PathError:
+            return ""
+        stats = dict(line.split() for line in cpu_stat.splitlines() if len(line.split()) == 2)
+        nr_periods = int(stats.get("nr_periods", 0))
+        nr_throttled = int(stats.get("nr_throttled", 0))
+        if not nr_periods or not nr_throttled:
+            return ""
+        throttled_seconds = int(stats.get("throttled_usec", 0)) / 1_000_000
+        return (
+            f"CPU throttled in {100 * nr_throttled / nr_periods:.1f}% of periods "
+            f"({throttled_seconds:.1f}s total)"
+        )
 
-    @property
-    def _config_plmn_0_support_mnc(self) -> str:
-        return self.model.config["plmn-0-support-mnc"]
+    def _patch_statefulset(self) -> None:
+        """Patches the container resources and the NGAP network attachment of the StatefulSet.
 
-    @property
-    def _config_plmn_0_support_tac(self) -> str:
-        return self.model.config["plmn-0-support-tac"]
+        Patching the pod template makes Kubernetes recreate the pods. The digest of the options
+        the StatefulSet was last patched for is kept in the charm state, so that hooks that
+        change none of them do not call the Kubernetes API.
+        """
+        statefulset_digest = _digest(
+            {
+                "requests": self._charm_config.resource_requests,
+                "limits": self._charm_config.resource_limits,
+                "guaranteed_qos": self._charm_config.guaranteed_qos,
+                "ngap": self._charm_config.ngap_network_attachment_definition,
+            }
+        )
+        if self._stored.statefulset_digest == statefulset_digest:
+            return
+        self._patch_statefulset_resources()
+        self._patch_statefulset_network_attachment(
+            self._charm_config.ngap_network_attachment_definition
+        )
+        self._stored.statefulset_digest = statefulset_digest
 
-    @property
-    def _config_plmn_0_slice_0_sd(self) -> str:
-        return self.model.config["plmn-0-slice-0-sd"]
+    def _patch_statefulset_resources(self) -> None:
+        """Patches the configured resources of the pod containers on the StatefulSet.
 
-    @property
-    def _config_plmn_0_slice_0_sst(self) -> str:
-        return self.model.config["plmn-0-slice-0-sst"]
+        The configured requests and limits apply to the amf container. A pod only gets the
+        Guaranteed QoS class when every container, init containers included, has limits equal
+        to its requests, so with `guaranteed-qos` the other containers, such as the Juju charm
+        container, get fixed resources. These are removed again when the option is disabled.
+        Quantities are compared parsed, since the API server normalizes them.
+        """
+        current_resources = self.kubernetes.get_statefulset_resources(
+            statefulset_name=self.app.name
+        )
+        expected_resources = {
+            kind: {
+                container_name: self._container_resources(container_name, resources)
+                for container_name, resources in containers.items()
+            }
+            for kind, containers in current_resources.items()
+        }
+        if _parsed_quantities(current_resources) == _parsed_quantities(expected_resources):
+            return
+        self.kubernetes.patch_statefulset_resources(
+            statefulset_name=self.app.name, resources=expected_resources
+        )
 
-    @property
-    def _config_plmn_0_slice_1_sd(self) -> str:
-        return self.model.config["plmn-0-slice-1-sd"]
+    def _container_resources(
+        self, container_name: str, current_resources: Dict[str, Dict[str, str]]
+    ) -> Dict[str, Dict[str, str]]:
+        """Returns the expected requests and limits of a container of the pod."""
+        if container_name == self._container_name:
+            return {
+                "requests": self._charm_config.resource_requests,
+                "limits": self._charm_config.resource_limits,
+            }
+        guaranteed_resources = {
+            "requests": SIDECAR_CONTAINER_RESOURCES,
+            "limits": SIDECAR_CONTAINER_RESOURCES,
+        }
+        if self._charm_config.guaranteed_qos:
+            return guaranteed_resources
+        if _parsed_quantities(current_resources) == _parsed_quantities(guaranteed_resources):
+            return {"requests": {}, "limits": {}}
+        return current_resources
+
+    def _update_pebble_layer(
+        self, config_file_changed: bool, sbi_proxy_config: Optional[str]
+    ) -> None:
+        """Updates pebble layer with new configuration.
 
-    @property
-    def _config_plmn_0_slice_1_sst(self) -> str:
-        return self.model.config["plmn-0-slice-1-sst"]
+        Replanning starts the AMF when it is not running and restarts it when its service
+        definition changed. The AMF is only restarted explicitly when a new config file would
+        otherwise not be loaded, so that applying a configuration restarts it at most once.
+        The SBI proxy is reconfigured in the same drain window, as restarting it interrupts the
+        requests of the AMF to its peers.
 
-    @property
-    def _config_plmn_0_slice_2_sd(self) -> str:
-        return self.model.config["plmn-0-slice-2-sd"]
+        Args:
+            config_file_changed: Whether a new config file was pushed
+            sbi_proxy_config: Rendered SBI proxy config, None when the proxy is disabled
+        """
+        layer = self._pebble_layer
+        current_service = self._container.get_plan().services.get(self._service_name)
+        current_service_definition = current_service.to_dict() if current_service else None
+        service_changed = current_service_definition != layer["services"][self._service_name]
+        sbi_proxy_changed = not self._sbi_proxy_is_up_to_date(sbi_proxy_config)
+        amf_was_running = self._amf_service_started
+        restart_expected = amf_was_running and (
+            config_file_changed or service_changed or sbi_proxy_changed
+        )
+        drained = self._drain_before_restart() if restart_expected else False
+        if sbi_proxy_changed:
+            self._configure_sbi_proxy(sbi_proxy_config)
+        self._container.add_layer("amf", layer, combine=True)
+        self._container.replan()
+        if self._charm_config.log_sink != "file":
+            self._stop_log_rotate_service()
+        if config_file_changed and amf_was_running and not service_changed:
+            self._container.restart(self._service_name)
+        if drained:
+            self._set_drained(False)
 
-    @property
-    def _config_plmn_0_slice_2_sst(self) -> str:
-        return self.model.config["plmn-0-slice-2-sst"]
+    def _drain_before_restart(self) -> bool:
+        """Takes the unit out of rotation for `drain-period` seconds before the AMF restarts.
 
-    @property
-    def _config_amf_name(self) -> str:
-        return "OAI_AMF"
+        The wait blocks the hook, validation keeps `drain-period` under MAX_DRAIN_PERIOD_SECONDS.
+        With a Multus NGAP attachment, gNBs reach the AMF on its Multus address rather than
+        through the NGAP service, so draining would not move them and is skipped.
 
-    @property
-    def _config_use_fqdn_dns(self) -> str:
-        return "yes"
+        Returns:
+            bool: Whether the unit was drained here, in which case it is resumed after restart.
+        """
+        if not self._charm_config.drain_period or self._is_drained:
+            return False
+        if self._charm_config.ngap_network_attachment_definition:
+            logger.warning(
+                "drain-period is ignored with ngap-network-attachment-definition, restarting "
+                "the AMF without draining"
+            )
+            return False
+        logger.info(
+            "Draining for %s seconds before restarting the AMF", self._charm_config.drain_period
+        )
+        self._set_drained(True)
+        time.sleep(self._charm_config.drain_period)
+        return True
 
     @property
-    def _config_register_nrf(self) -> str:
-        return "no"
+    def _is_drained(self) -> bool:
+        return self._container.exists(DRAIN_MARKER_PATH)
 
-    @property
-    def _config_use_http2(self) -> str:
-        return "no"
+    def _set_drained(self, drained: bool) -> None:
+        """Fails or restores the drain readiness check of the AMF.
 
-    @property
-    def _config_n11_amf_interface_name(self) -> str:
-        return "eth0"
+        Juju points the readiness probe of the workload container to the Pebble health
+        endpoint, so a failing ready check takes the pod out of the endpoints of the NGAP and
+        SBI services. New NGAP associations then go to the other AMFs of the set.
+        """
+        if drained:
+            self._container.push(DRAIN_MARKER_PATH, source="", make_dirs=True)
+        elif self._is_drained:
+            self._container.remove_path(DRAIN_MARKER_PATH)
 
-    @property
-    def _config_ngap_amf_interface_name(self) -> str:
-        return "eth0"
+    def _on_drain_action(self, event: ActionEvent) -> None:
+        """Takes the unit out of rotation until the resume action is run.
 
-    @property
-    def _config_ngap_amf_interface_port(self) -> str:
-        return "38412"
+        Args:
+            event: Drain Action Event
+        """
+        if not self._container.can_connect():
+            event.fail("Container is not ready")
+            return
+        self._set_drained(True)
+        self._refresh_active_status()
+        event.set_results({"message": "Unit drained, run the resume action to undo"})
 
-    @property
-    def _config_n11_amf_interface_port(self) -> str:
-        return "80"
+    def _on_resume_action(self, event: ActionEvent) -> None:
+        """Puts a drained unit back in rotation.
 
-    @property
-    def _config_n11_amf_api_version(self) -> str:
-        return "v1"
+        Args:
+            event: Resume Action Event
+        """
+        if not self._container.can_connect():
+            event.fail("Container is not ready")
+            return
+        self._set_drained(False)
+        self._refresh_active_status()
+        event.set_results({"message": "Unit resumed"})
 
-    @property
-    def _config_n11_amf_interface_http2_port(self) -> str:
-        return "9090"
+    def _stop_log_rotate_service(self) -> None:
+        """Stops the log rotation service left over from the file log sink mode."""
+        try:
+            service = self._container.get_service(LOG_ROTATE_SERVICE_NAME)
+        except ModelError:
+            return
+        if service.is_running():
+            self._container.stop(LOG_ROTATE_SERVICE_NAME)
 
-    @property
-    def _config_smf_0_instance_id(self) -> str:
-        return "1"
+    def _push_log_rotate_script(self) -> None:
+        jinja2_environment = Environment(loader=FileSystemLoader("src/templates/"))
+        template = jinja2_environment.get_template(f"{LOG_ROTATE_SCRIPT_NAME}.j2")
+        content = template.render(
+            log_file=LOG_FILE_PATH,
+            rate_file=LOG_RATE_FILE_PATH,
+            interval=LOG_ROTATE_INTERVAL_SECONDS,
+        )
+        self._container.push(
+            path=f"{LOG_DIRECTORY}/{LOG_ROTATE_SCRIPT_NAME}", source=content, make_dirs=True
+        )
+        logger.info(f"Wrote file to container: {LOG_ROTATE_SCRIPT_NAME}")
 
     @property
-    def _config_smf_0_ipv4_address(self) -> str:
-        return "0.0.0.0"
+    def _relations_status(self) -> Optional[StatusBase]:
+        """Returns the status to set if relations are not ready, None otherwise."""
+        nfs = ["nrf", "udm", "ausf"]
+        if not self._database_relation_created:
+            return BlockedStatus("Waiting for relation to database to be created")
+        for nf in nfs:
+            if not self._relation_created(f"fiveg-{nf}"):
+                return BlockedStatus(f"Waiting for relation to {nf.upper()} to be created")
+        if not self._database_relation_data_is_available:
+            return WaitingStatus("Waiting for database relation data to be available")
+        for nf, available in (
+            ("nrf", self.nrf_requires.nrf_ipv4_address_available),
+            ("udm", bool(self._nf_instances("udm"))),
+            ("ausf", bool(self._nf_instances("ausf"))),
+        ):
+            if not available:
+                return WaitingStatus(
+                    f"Waiting for {nf.upper()} IPv4 address to be available in relation data"
+                )
+        return None
+
+    def _nf_peer_parameters(self, nf: str) -> Dict[str, Any]:
+        """Returns the template parameters of the UDM or AUSF.
+
+        The AMF only takes one address per NF. With several related applications, units are
+        spread across them by unit number so that the load is balanced over the AMF set.
 
-    @property
-    def _config_smf_0_port(self) -> str:
-        return "80"
+        Args:
+            nf: "udm" or "ausf"
+        """
+        instances = self._nf_instances(nf)
+        instance = instances[self._unit_number % len(instances)]
+        return self._proxied_peer_parameters(
+            nf,
+            {
+                f"{nf}_{field}": getattr(instance, field)
+                for field in ("ipv4_address", "port", "api_version", "fqdn")
+            },
+        )
 
     @property
-    def _config_smf_0_http2_port(self) -> str:
-        return "8080"
+    def _nrf_peer_parameters(self) -> Dict[str, Any]:
+        """Returns the template parameters of the NRF."""
+        return self._proxied_peer_parameters(
+            "nrf",
+            {
+                "nrf_ipv4_address": self.nrf_requires.nrf_ipv4_address,
+                "nrf_port": self.nrf_requires.nrf_port,
+                "nrf_api_version": self.nrf_requires.nrf_api_version,
+                "nrf_fqdn": self.nrf_requires.nrf_fqdn,
+            },
+        )
 
-    @property
-    def _config_smf_0_api_version(self) -> str:
-        return "v1"
+    def _proxied_peer_parameters(self, nf: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """Points the NF template parameters at the local SBI proxy when it is enabled."""
+        if not self._charm_config.sbi_proxy:
+            return parameters
+        return {
+            **parameters,
+            f"{nf}_ipv4_address": SBI_PROXY_ADDRESS,
+            f"{nf}_port": SBI_PROXY_LISTENER_PORTS[nf],
+            f"{nf}_fqdn": SBI_PROXY_FQDN,
+        }
 
     @property
-    def _config_smf_0_fqdn(self) -> str:
-        return "oai-smf-svc"
+    def _ngap_network_attachment_is_ready(self) -> bool:
+        """Returns whether the NGAP interface is ready to be used by the AMF.
 
-    @property
-    def _config_smf_1_instance_id(self) -> str:
-        return "2"
+        With a Multus attachment, the pod of this unit must have an address on the NGAP
+        interface. Once it has one, the attachment is kept in the charm state, which does not
+        outlive the pod, so that later hooks do not call the Kubernetes API.
+        """
+        network_attachment_definition = self._charm_config.ngap_network_attachment_definition
+        if not network_attachment_definition:
+            return True
+        if self._stored.ready_network_attachment == network_attachment_definition:
+            return True
+        if not self.kubernetes.get_pod_network_attachment_ip(
+            pod_name=self._pod_name, interface_name=NGAP_MULTUS_INTERFACE_NAME
+        ):
+            return False
+        self._stored.ready_network_attachment = network_attachment_definition
+        return True
 
-    @property
-    def _config_smf_1_ipv4_address(self) -> str:
-        return "0.0.0.0"
+    def _patch_statefulset_network_attachment(self, network_attachment_definition: str) -> None:
+        current_annotation = self.kubernetes.get_statefulset_network_attachment(
+            statefulset_name=self.app.name
+        )
+        if network_attachment_definition:
+            expected_annotation = self.kubernetes.network_attachment_annotation(
+                network_attachment_definition=network_attachment_definition,
+                interface_name=NGAP_MULTUS_INTERFACE_NAME,
+            )
+        else:
+            expected_annotation = None
+        if current_annotation == expected_annotation:
+            return
+        self.kubernetes.patch_statefulset_network_attachment(
+            statefulset_name=self.app.name,
+            network_attachment_definition=network_attachment_definition or None,
+            interface_name=NGAP_MULTUS_INTERFACE_NAME,
+        )
 
     @property
-    def _config_smf_1_port(self) -> str:
-        return "80"
+    def _database_relation_created(self) -> bool:
+        return self._relation_created("database")
 
     @property
-    def _config_smf_1_http2_port(self) -> str:
-        return "8080"
+    def _nrf_relation_created(self) -> bool:
+        return self._relation_created("fiveg-nrf")
 
     @property
-    def _config_smf_1_api_version(self) -> str:
-        return "v1"
+    def _udm_relation_created(self) -> bool:
+        return self._relation_created("fiveg-udm")
 
     @property
-    def _config_smf_1_fqdn(self) -> str:
-        return "localhost"
+    def _ausf_relation_created(self) -> bool:
+        return self._relation_created("fiveg-ausf")
 
-    @property
-    def _config_nssf_ipv4_address(self) -> str:
-        return "127.0.0.1"
+    def _relation_created(self, relation_name: str) -> bool:
+        return bool(self.model.relations[relation_name])
 
     @property
-    def _config_nssf_port(self) -> str:
-        return "80"
+    def _database_relation_data_is_available(self) -> bool:
+        relation_data = self.database.fetch_relation_data()
+        if not relation_data:
+            return False
+        relation = self.model.get_relation(relation_name="database")
+        if not relation:
+            return False
+        if "username" not in relation_data[relation.id]:
+            return False
+        if "password" not in relation_data[relation.id]:
+            return False
+        if "endpoints" not in relation_data[relation.id]:
+            return False
+        return True
 
     @property
-    def _config_nssf_api_version(self) -> str:
-        return "v1"
+    def _config_section_parameters(self) -> Dict[str, Dict[str, Any]]:
+        """Returns the template parameters of each section of the config file."""
+        parameters: Dict[str, Dict[str, Any]] = {
+            "general": {
+                "instance": self._charm_config.instance_id,
+                "pid_directory": self._charm_config.pid_directory,
+                "amf_name": self._charm_config.amf_name,
+                "relative_capacity": self._charm_config.relative_capacity,
+            },
+            "guami": {
+                "guami_mcc": self._charm_config.guami_mcc,
+                "guami_mnc": self._charm_config.guami_mnc,
+                "guami_region_id": self._charm_config.guami_region_id,
+                "guami_amf_set_id": self._charm_config.guami_amf_set_id,
+                "guami_amf_pointer": self._guami_amf_pointer,
+                "served_guami_0_mcc": self._charm_config.served_guami_0_mcc,
+                "served_guami_0_mnc": self._charm_config.served_guami_0_mnc,
+                "served_guami_0_region_id": self._charm_config.served_guami_0_region_id,
+                "served_guami_0_amf_set_id": self._charm_config.served_guami_0_amf_set_id,
+                "served_guami_1_mcc": self._charm_config.served_guami_1_mcc,
+                "served_guami_1_mnc": self._charm_config.served_guami_1_mnc,
+                "served_guami_1_region_id": self._charm_config.served_guami_1_region_id,
+                "served_guami_1_amf_set_id": self._charm_config.served_guami_1_amf_set_id,
+            },
+            "plmn_support": {
+                "plmn_0_support_mcc": self._charm_config.plmn_0_support_mcc,
+                "plmn_0_support_mnc": self._charm_config.plmn_0_support_mnc,
+                "plmn_0_support_tac": self._charm_config.plmn_0_support_tac,
+                "plmn_0_slice_0_sd": self._charm_config.plmn_0_slice_0_sd,
+                "plmn_0_slice_1_sd": self._charm_config.plmn_0_slice_1_sd,
+                "plmn_0_slice_2_sd": self._charm_config.plmn_0_slice_2_sd,
+                "plmn_0_slice_0_sst": self._charm_config.plmn_0_slice_0_sst,
+                "plmn_0_slice_1_sst": self._charm_config.plmn_0_slice_1_sst,
+                "plmn_0_slice_2_sst": self._charm_config.plmn_0_slice_2_sst,
+            },
+            "ngap": {
+                "ngap_amf_interface_name": self._ngap_interface_name,
+                "ngap_amf_interface_port": NGAP_PORT,
+            },
+            "n11": {
+                "n11_amf_interface_name": self._charm_config.n11_interface_name,
+                "n11_amf_interface_port": N11_PORT,
+                "n11_amf_api_version": self._charm_config.n11_api_version,
+                "n11_amf_interface_http2_port": N11_HTTP2_PORT,
+                "smf_0_instance_id": self._charm_config.smf_0_instance_id,
+                "smf_0_ipv4_address": self._charm_config.smf_0_ipv4_address,
+                "smf_0_port": self._charm_config.smf_0_port,
+                "smf_0_http2_port": self._charm_config.smf_0_http2_port,
+                "smf_0_api_version": self._charm_config.smf_0_api_version,
+                "smf_0_fqdn": self._charm_config.smf_0_fqdn,
+                "smf_1_instance_id": self._charm_config.smf_1_instance_id,
+                "smf_1_ipv4_address": self._charm_config.smf_1_ipv4_address,
+                "smf_1_port": self._charm_config.smf_1_port,
+                "smf_1_http2_port": self._charm_config.smf_1_http2_port,
+                "smf_1_api_version": self._charm_config.smf_1_api_version,
+                "smf_1_fqdn": self._charm_config.smf_1_fqdn,
+            },
+            "nf_peers": {
+                **self._nrf_peer_parameters,
+                **self._nf_peer_parameters("udm"),
+                **self._nf_peer_parameters("ausf"),
+                "nssf_ipv4_address": self._charm_config.nssf_ipv4_address,
+                "nssf_port": self._charm_config.nssf_port,
+                "nssf_api_version": self._charm_config.nssf_api_version,
+                "nssf_fqdn": self._charm_config.nssf_fqdn,
+            },
+            "support_features": {
+                "nf_registration": self._charm_config.nf_registration,
+                "nrf_selection": self._charm_config.nrf_selection,
+                "external_nrf": self._charm_config.external_nrf,
+                "smf_selection": self._charm_config.smf_selection,
+                "external_ausf": self._charm_config.external_ausf,
+                "external_udm": self._charm_config.external_udm,
+                "external_nssf": self._charm_config.external_nssf,
+                "use_fqdn_dns": self._charm_config.effective_use_fqdn_dns,
+                "use_http2": self._charm_config.use_http2,
+            },
+            "authentication": {
+                "mysql_server": self._database_relation_server,
+                "mysql_user": self._database_relation_user,
+                "mysql_password": self._database_relation_password,
+                "mysql_database": DATABASE_NAME,
+            },
+            "nas": {
+                "integrity_algorithm_list": self._charm_config.integrity_algorithm_list,
+                "cyphering_algorithm_list": self._charm_config.ciphering_algorithm_list,
+            },
+        }
+        if self._charm_config.pins_fqdns:
+            self._pin_peer_addresses(parameters)
+        return parameters
 
-    @property
-    def _config_nssf_fqdn(self) -> str:
-        return "oai-nssf-svc"
+    def _pin_peer_addresses(self, parameters: Dict[str, Dict[str, Any]]) -> None:
+        """Replaces peer addresses with the addresses their FQDN resolves to.
 
-    @property
-    def _config_nf_registration(self) -> str:
-        return "yes"
+        The configured or related address is only used when the FQDN does not resolve.
+        Cached addresses of FQDNs that are no longer rendered are dropped.
+        """
+        now = time.time()
+        fqdns = set()
+        for section, peers in PINNED_PEERS.items():
+            for peer in peers:
+                fqdn = parameters[section][f"{peer}_fqdn"]
+                fqdns.add(fqdn)
+                parameters[section][f"{peer}_ipv4_address"] = pinned_address(
+                    self._stored.resolved_fqdns,
+                    fqdn,
+                    fallback=parameters[section][f"{peer}_ipv4_address"],
+                    ttl=self._charm_config.fqdn_pinning_ttl,
+                    now=now,
+                )
+        for fqdn in set(self._stored.resolved_fqdns) - fqdns:
+            del self._stored.resolved_fqdns[fqdn]
+
+    def _render_config_sections(self) -> Dict[str, str]:
+        """Renders the sections of the config file.
+
+        Sections whose parameters did not change since they were last rendered are reused from
+        the charm state. The authentication section holds the database password, so it is never
+        kept in the charm state and is rendered every time.
+        """
+        sections = {}
+        for name, parameters in self._config_section_parameters.items():
+            parameters_digest = _digest(parameters)
+            cached_section = self._stored.config_sections.get(name)
+            if cached_section and cached_section["parameters_digest"] == parameters_digest:
+                sections[name] = cached_section["content"]
+                continue
+            sections[name] = render_section(name, parameters)
+            if name != "authentication":
+                self._stored.config_sections[name] = {
+                    "parameters_digest": parameters_digest,
+                    "content": sections[name],
+                }
+        return sections
 
-    @property
-    def _config_nrf_selection(self) -> str:
-        return "no"
+    def _push_config(self, content: str) -> bool:
+        """Pushes the config file, keeping a copy of the file it replaces.
 
-    @property
-    def _config_external_nrf(self) -> str:
-        return "no"
+        Pebble writes pushed files to a temporary file, syncs it and renames it over the
+        destination, so the AMF never reads a partially written config file.
 
-    @property
-    def _config_smf_selection(self) -> str:
-        return "yes"
+        Returns:
+            bool: Whether the config file changed.
+        """
+        existing_content = self._pull_config()
+        if existing_content == content:
+            logger.info(f"Config file is up to date: {CONFIG_FILE_NAME}")
+            return False
+        if existing_content is not None:
+            self._archive_config(existing_content)
+        self._container.push(path=f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}", source=content)
+        logger.info(f"Wrote file to container: {CONFIG_FILE_NAME}")
+        return True
 
-    @property
-    def _config_external_ausf(self) -> str:
-        return "yes"
+    def _pull_config(self) -> Optional[str]:
+        """Returns the content of the config file in the container, None if there is none."""
+        try:
+            return self._container.pull(f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}").read()
+        except PathError:
+            return None
 
-    @property
-    def _config_external_udm(self) -> str:
-        return "no"
+    def _archive_config(self, content: str) -> None:
+        """Keeps a copy of a replaced config file and removes the oldest copies.
 
-    @property
-    def _config_external_nssf(self) -> str:
-        return "no"
+        Copies are named after the time they were replaced at, so that they sort by age.
+        """
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+        self._container.push(
+            path=f"{CONFIG_HISTORY_DIRECTORY}/{CONFIG_FILE_NAME}.{timestamp}",
+            source=content,
+            make_dirs=True,
+        )
+        for path in self._archived_config_paths[:-CONFIG_HISTORY_SIZE]:
+            self._container.remove_path(path)
 
     @property
-    def _config_integrity_algorithm_list(self) -> str:
-        return '[ "NIA0" , "NIA1" , "NIA2" ]'
+    def _archived_config_paths(self) -> List[str]:
+        """Returns the paths of the archived config files, oldest first."""
+        if not self._container.exists(CONFIG_HISTORY_DIRECTORY):
+            return []
+        files = self._container.list_files(
+            CONFIG_HISTORY_DIRECTORY, pattern=f"{CONFIG_FILE_NAME}.*"
+        )
+        return sorted(file.path for file in files)
+
+    def _on_rollback_config_action(self, event: ActionEvent) -> None:
+        """Applies the most recently archived config file in place of the current one.
+
+        The archived file is used as is, without rendering. It goes through the same path as a
+        rendered config file: the restart lock is taken, the unit is drained and the AMF is
+        watched after its restart. The config file it replaces is archived, so running the
+        action again undoes the rollback.
+
+        Args:
+            event: Rollback Config Action Event
+        """
+        if not self._amf_service_started:
+            event.fail("AMF service is not running")
+            return
+        archived_config_paths = self._archived_config_paths
+        if not archived_config_paths:
+            event.fail("No previous config file to roll back to")
+            return
+        if not self._restart_lock_acquired():
+            self._release_restart_lock()
+            event.fail("Other units are restarting, run the action again later")
+            return
+        previous_config_path = archived_config_paths[-1]
+        previous_content = self._container.pull(previous_config_path).read()
+        self._container.remove_path(previous_config_path)
+        healthy = self._apply_workload_config(None, previous_content, self._pebble_layer)
+        self._release_restart_lock()
+        if not healthy:
+            event.fail(f"AMF did not become healthy with {previous_config_path}")
+            return
+        logger.info(f"Rolled back {CONFIG_FILE_NAME} to {previous_config_path}")
+        event.set_results({"restored-config": previous_config_path})
 
     @property
-    def _config_cyphering_algorithm_list(self) -> str:
-        return '[ "NEA0" , "NEA1" , "NEA2" ]'
+    def _config_file_is_pushed(self) -> bool:
+        """Check if config file is pushed to the container."""
+        if not self._container.exists(f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}"):
+            logger.info(f"Config file is not written: {CONFIG_FILE_NAME}")
+            return False
+        logger.info("Config file is pushed")
+        return True
 
     @property
     def _database_relation_server(self) -> str:
@@ -580,20 +1529,123 @@ class Oai5GAMFOperatorCharm(CharmBase):
 
     @property
     def _pebble_layer(self) -> dict:
-        """Return a dictionary representing a Pebble layer."""
+        """Return a dictionary representing a Pebble layer.
+
+        The log rotation service is always defined, and disabled outside of the file log sink
+        mode, so that a service added in that mode is not started again by later replans. Its
+        limits are passed through its environment rather than rendered in its script, so that
+        changing them changes the layer and Pebble restarts the service on replan.
+        """
+        workload_service = {
+            "override": "replace",
+            "summary": "amf",
+            "command": self._workload_command,
+            "startup": "enabled",
+            "on-check-failure": {check_name: "restart" for check_name in WORKLOAD_CHECK_NAMES},
+        }
+        if environment := self._workload_environment:
+            workload_service["environment"] = environment
+        services = {
+            self._service_name: workload_service,
+            LOG_ROTATE_SERVICE_NAME: {
+                "override": "replace",
+                "summary": "amf log rotation",
+                "command": f"/bin/sh {LOG_DIRECTORY}/{LOG_ROTATE_SCRIPT_NAME}",
+                "startup": "enabled" if self._charm_config.log_sink == "file" else "disabled",
+                "environment": {
+                    "LOG_FILE_MAX_SIZE_BYTES": str(
+                        self._charm_config.log_file_max_size * 1024 * 1024
+                    ),
+                    "LOG_FILE_MAX_FILES": str(self._charm_config.log_file_max_files),
+                },
+            },
+        }
         return {
             "summary": "amf layer",
             "description": "pebble config layer for amf",
-            "services": {
-                self._service_name: {
-                    "override": "replace",
-                    "summary": "amf",
-                    "command": f"/openair-amf/bin/oai_amf -c {BASE_CONFIG_PATH}/{CONFIG_FILE_NAME} -o",  # noqa: E501
-                    "startup": "enabled",
-                }
+            "services": services,
+            "checks": self._workload_checks,
+        }
+
+    @property
+    def _workload_command(self) -> str:
+        """Returns the AMF command.
+
+        With the file log sink, the AMF output is appended to a file on the config storage
+        instead of going through the Pebble log buffer.
+        """
+        command = f"/openair-amf/bin/oai_amf -c {BASE_CONFIG_PATH}/{CONFIG_FILE_NAME} -o"
+        if self._charm_config.log_sink == "file":
+            return f'/bin/sh -c "exec {command} >> {LOG_FILE_PATH} 2>&1"'
+        return command
+
+    @property
+    def _workload_checks(self) -> dict:
+        """Returns the Pebble checks of the AMF.
+
+        Pebble has no SCTP check, so the NGAP check looks for the listening SCTP endpoint in
+        `/proc/net/sctp/eps`, whose sixth column is the local port. The AMF binds N11 to the
+        address of its interface rather than to the loopback, so the SBI check looks for a TCP
+        socket listening on the N11 HTTP port in `/proc/net/tcp`, whose second column is the
+        hexadecimal local address and port and whose fourth column is the state, `0A` when
+        listening. Failing NGAP and SBI checks make Pebble restart the AMF. Their threshold
+        gives the AMF `WORKLOAD_STARTUP_GRACE_SECONDS` to bind its interfaces after a start, so
+        that a slow start does not end in a restart loop. The drain check fails while the unit
+        is drained and only affects the readiness of the pod.
+        """
+        return {
+            NGAP_CHECK_NAME: {
+                "override": "replace",
+                "level": "ready",
+                "period": f"{WORKLOAD_CHECK_PERIOD_SECONDS}s",
+                "timeout": f"{WORKLOAD_CHECK_TIMEOUT_SECONDS}s",
+                "threshold": WORKLOAD_CHECK_THRESHOLD,
+                "exec": {
+                    "command": f"awk '$6 == {NGAP_PORT} {{ found = 1 }} END {{ exit !found }}' /proc/net/sctp/eps"  # noqa: E501
+                },
+            },
+            SBI_CHECK_NAME: {
+                "override": "replace",
+                "level": "ready",
+                "period": f"{WORKLOAD_CHECK_PERIOD_SECONDS}s",
+                "timeout": f"{WORKLOAD_CHECK_TIMEOUT_SECONDS}s",
+                "threshold": WORKLOAD_CHECK_THRESHOLD,
+                "exec": {
+                    "command": f"awk '$2 ~ /:{N11_PORT:04X}$/ && $4 ~ /^0A$/ {{ found = 1 }} END {{ exit !found }}' /proc/net/tcp"  # noqa: E501
+                },
+            },
+            DRAIN_CHECK_NAME: {
+                "override": "replace",
+                "level": "ready",
+                "period": "1s",
+                "timeout": "1s",
+                "threshold": 1,
+                "exec": {"command": f"test ! -e {DRAIN_MARKER_PATH}"},
             },
         }
 
+    @property
+    def _workload_environment(self) -> Dict[str, str]:
+        """Returns the environment of the AMF process.
+
+        An alternative allocator is preloaded only when its library is present in the workload
+        image.
+        """
+        environment: Dict[str, str] = {}
+        if allocator_library := self._allocator_library:
+            environment["LD_PRELOAD"] = allocator_library
+        return environment
+
+    @property
+    def _allocator_library(self) -> Optional[str]:
+        allocator = self._charm_config.allocator
+        for library_path in ALLOCATOR_LIBRARIES.get(allocator, []):
+            if self._container.exists(library_path):
+                return library_path
+        if allocator != "default":
+            logger.warning("No %s library found in the workload image, using default", allocator)
+        return None
+
 
 if __name__ == "__main__":
     main(Oai5GAMFOperatorCharm)
@@ -0,0 +1,249 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Typed model of the charm configuration."""
+
+import dataclasses
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional
+
+ALLOCATORS = ["default", "jemalloc", "tcmalloc"]
+LOG_SINKS = ["stdout", "file"]
+INTEGRITY_ALGORITHMS = ["NIA0", "NIA1", "NIA2", "NIA3"]
+CIPHERING_ALGORITHMS = ["NEA0", "NEA1", "NEA2", "NEA3"]
+CPU_QUANTITY_REGEX = re.compile(r"^\d+(\.\d+)?m?$")
+MEMORY_QUANTITY_REGEX = re.compile(r"^\d+(\.\d+)?([EPTGMk]i?)?$")
+YES_NO_FIELDS = [
+    "use_fqdn_dns",
+    "use_http2",
+    "nf_registration",
+    "nrf_selection",
+    "external_nrf",
+    "smf_selection",
+    "external_ausf",
+    "external_udm",
+    "external_nssf",
+]
+# The drain runs in the hook that restarts the AMF, which blocks every other hook of the unit
+MAX_DRAIN_PERIOD_SECONDS = 120
+PORT_FIELDS = ["smf_0_port", "smf_0_http2_port", "smf_1_port", "smf_1_http2_port", "nssf_port"]
+
+
+@dataclass(frozen=True)
+class CharmConfig:
+    """Charm configuration, built once per hook from the Juju config.
+
+    Each field maps to the config option of the same name, with dashes instead of underscores.
+    Types are enforced by Juju from `config.yaml`, `validate` checks values.
+    """
+
+    instance_id: int
+    pid_directory: str
+    amf_name: str
+    guami_mcc: str
+    guami_mnc: str
+    guami_region_id: str
+    guami_amf_set_id: str
+    served_guami_0_mcc: str
+    served_guami_0_mnc: str
+    served_guami_0_region_id: str
+    served_guami_0_amf_set_id: str
+    served_guami_1_mcc: str
+    served_guami_1_mnc: str
+    served_guami_1_region_id: str
+    served_guami_1_amf_set_id: str
+    plmn_0_support_mcc: str
+    plmn_0_support_mnc: str
+    plmn_0_support_tac: str
+    plmn_0_slice_0_sd: str
+    plmn_0_slice_0_sst: str
+    plmn_0_slice_1_sd: str
+    plmn_0_slice_1_sst: str
+    plmn_0_slice_2_sd: str
+    plmn_0_slice_2_sst: str
+    ngap_interface_name: str
+    n11_interface_name: str
+    n11_api_version: str
+    smf_0_instance_id: int
+    smf_0_ipv4_address: str
+    smf_0_port: int
+    smf_0_http2_port: int
+    smf_0_api_version: str
+    smf_0_fqdn: str
+    smf_1_instance_id: int
+    smf_1_ipv4_address: str
+    smf_1_port: int
+    smf_1_http2_port: int
+    smf_1_api_version: str
+    smf_1_fqdn: str
+    nssf_ipv4_address: str
+    nssf_port: int
+    nssf_api_version: str
+    nssf_fqdn: str
+    nf_registration: str
+    nrf_selection: str
+    external_nrf: str
+    smf_selection: str
+    external_ausf: str
+    external_udm: str
+    external_nssf: str
+    use_fqdn_dns: str
+    use_http2: str
+    integrity_algorithms: str
+    ciphering_algorithms: str
+    ngap_network_attachment_definition: str
+    allocator: str
+    log_sink: str
+    log_file_max_size: int
+    log_file_max_files: int
+    cpu_request: str
+    cpu_limit: str
+    memory_request: str
+    memory_limit: str
+    guaranteed_qos: bool
+    max_unavailable_units: int
+    drain_period: int
+    relative_capacity: int
+    sbi_proxy: bool
+    fqdn_pinning: bool
+    fqdn_pinning_ttl: int
+
+    @classmethod
+    def from_charm_config(cls, config: Mapping[str, Any]) -> "CharmConfig":
+        """Builds the model from the Juju config.
+
+        Args:
+            config: Juju config (`self.model.config`)
+
+        Returns:
+            CharmConfig: Typed charm configuration.
+        """
+        return cls(
+            **{
+                field.name: config[field.name.replace("_", "-")]
+                for field in dataclasses.fields(cls)
+            }
+        )
+
+    def validate(self) -> Optional[str]:
+        """Validates option values that Juju cannot type check.
+
+        Returns:
+            str: Description of the first invalid option, None if the configuration is valid.
+        """
+        for validator in (
+            self._validate_choices,
+            self._validate_algorithms,
+            self._validate_numbers,
+            self._validate_resources,
+        ):
+            if error := validator():
+                return error
+        return None
+
+    @property
+    def pins_fqdns(self) -> bool:
+        """Whether the charm resolves peer FQDNs, which only matters when the AMF uses them."""
+        return self.fqdn_pinning and self.use_fqdn_dns == "yes"
+
+    @property
+    def effective_use_fqdn_dns(self) -> str:
+        """USE_FQDN_DNS of the AMF, forced to "no" when the charm pins peer FQDNs."""
+        return "no" if self.pins_fqdns else self.use_fqdn_dns
+
+    @property
+    def integrity_algorithm_list(self) -> str:
+        """Integrity algorithms rendered as a libconfig array."""
+        return _libconfig_string_array(self.integrity_algorithms)
+
+    @property
+    def ciphering_algorithm_list(self) -> str:
+        """Ciphering algorithms rendered as a libconfig array."""
+        return _libconfig_string_array(self.ciphering_algorithms)
+
+    @property
+    def resource_requests(self) -> Dict[str, str]:
+        """Resource requests of the workload container."""
+        requests = {}
+        if self.cpu_request:
+            requests["cpu"] = self.cpu_request
+        if self.memory_request:
+            requests["memory"] = self.memory_request
+        return requests
+
+    @property
+    def resource_limits(self) -> Dict[str, str]:
+        """Resource limits of the workload container.
+
+        With guaranteed QoS, limits equal requests. Combined with an integer CPU request, this
+        lets the kubelet static CPU manager give the AMF exclusive cores.
+        """
+        if self.guaranteed_qos:
+            return self.resource_requests
+        limits = {}
+        if self.cpu_limit:
+            limits["cpu"] = self.cpu_limit
+        if self.memory_limit:
+            limits["memory"] = self.memory_limit
+        return limits
+
+    def _validate_choices(self) -> Optional[str]:
+        choices = {"allocator": ALLOCATORS, "log_sink": LOG_SINKS}
+        choices.update({name: ["yes", "no"] for name in YES_NO_FIELDS})
+        for name, valid_values in choices.items():
+            value = getattr(self, name)
+            if value not in valid_values:
+                return f"Invalid {_option(name)}: {value} (expected one of {valid_values})"
+        return None
+
+    def _validate_algorithms(self) -> Optional[str]:
+        for name, valid_values in (
+            ("integrity_algorithms", INTEGRITY_ALGORITHMS),
+            ("ciphering_algorithms", CIPHERING_ALGORITHMS),
+        ):
+            algorithms = _split(getattr(self, name))
+            if not algorithms or not set(algorithms) <= set(valid_values):
+                return f"Invalid {_option(name)}: expected a list of {valid_values}"
+        return None
+
+    def _validate_numbers(self) -> Optional[str]:
+        for name in PORT_FIELDS:
+            if not 1 <= getattr(self, name) <= 65535:
+                return f"Invalid {_option(name)}: {getattr(self, name)} is not a port"
+        if self.log_file_max_size < 1 or self.log_file_max_files < 1:
+            return "log-file-max-size and log-file-max-files must be positive"
+        if self.max_unavailable_units < 1:
+            return "max-unavailable-units must be positive"
+        if not 0 <= self.relative_capacity <= 255:
+            return f"Invalid relative-capacity: {self.relative_capacity} (expected 0 to 255)"
+        if not 0 <= self.drain_period <= MAX_DRAIN_PERIOD_SECONDS:
+            return (
+                f"Invalid drain-period: {self.drain_period} "
+                f"(expected 0 to {MAX_DRAIN_PERIOD_SECONDS})"
+            )
+        if self.fqdn_pinning_ttl < 1:
+            return "fqdn-pinning-ttl must be positive"
+        return None
+
+    def _validate_resources(self) -> Optional[str]:
+        quantities = list(self.resource_requests.items()) + list(self.resource_limits.items())
+        for resource, quantity in quantities:
+            regex = CPU_QUANTITY_REGEX if resource == "cpu" else MEMORY_QUANTITY_REGEX
+            if not regex.match(quantity):
+                return f"Invalid {resource} quantity: {quantity}"
+        if self.guaranteed_qos and set(self.resource_requests) != {"cpu", "memory"}:
+            return "guaranteed-qos requires both cpu-request and memory-request"
+        return None
+
+
+def _option(field_name: str) -> str:
+    return field_name.replace("_", "-")
+
+
+def _split(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _libconfig_string_array(value: str) -> str:
+    return "[ " + " , ".join(f'"{item}"' for item in _split(value)) + " ]"
@@ -0,0 +1,80 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Section by section rendering of the AMF configuration file.
+
+Each group of `amf.conf` has its own template in `templates/amf.conf.d` and is rendered on its
+own. `amf.conf.j2` only lays the rendered sections out, so the charm can tell which sections
+changed and skip rendering the ones whose parameters did not change.
+"""
+
+import hashlib
+from typing import Any, Dict, List, Mapping
+
+from jinja2 import Environment, FileSystemLoader
+
+TEMPLATES_DIRECTORY = "src/templates/"
+CONFIG_TEMPLATE_NAME = "amf.conf.j2"
+SECTION_TEMPLATES_DIRECTORY = "amf.conf.d"
+SECTION_NAMES = [
+    "general",
+    "guami",
+    "plmn_support",
+    "ngap",
+    "n11",
+    "nf_peers",
+    "support_features",
+    "authentication",
+    "nas",
+]
+
+
+def _environment() -> Environment:
+    return Environment(loader=FileSystemLoader(TEMPLATES_DIRECTORY))
+
+
+def render_section(name: str, parameters: Mapping[str, Any]) -> str:
+    """Renders one section of the AMF configuration.
+
+    Args:
+        name: Section name, one of `SECTION_NAMES`
+        parameters: Template parameters of the section
+
+    Returns:
+        str: Rendered section, without trailing newline.
+    """
+    template = _environment().get_template(f"{SECTION_TEMPLATES_DIRECTORY}/{name}.j2")
+    return template.render(**parameters)
+
+
+def render_config(sections: Mapping[str, str]) -> str:
+    """Lays rendered sections out into the AMF configuration file.
+
+    Args:
+        sections: Rendered sections, by name
+
+    Returns:
+        str: Content of the AMF configuration file.
+    """
+    return _environment().get_template(CONFIG_TEMPLATE_NAME).render(sections=sections)
+
+
+def section_digests(sections: Mapping[str, str]) -> Dict[str, str]:
+    """Returns the SHA-256 digest of each rendered section."""
+    return {
+        name: hashlib.sha256(content.encode()).hexdigest() for name, content in sections.items()
+    }
+
+
+def changed_sections(sections: Mapping[str, str], digests: Mapping[str, str]) -> List[str]:
+    """Returns the names of the sections whose content differs from the given digests.
+
+    Args:
+        sections: Rendered sections, by name
+        digests: Digests of previously applied sections, by name
+
+    Returns:
+        list: Changed section names, in file order.
+    """
+    new_digests = section_digests(sections)
+    return [name for name in SECTION_NAMES if new_digests.get(name) != digests.get(name)]
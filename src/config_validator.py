@@ -0,0 +1,260 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Parser and validator for the libconfig file read by the OAI AMF.
+
+The AMF exits at startup when its configuration does not parse or holds invalid identifiers,
+which makes the workload crash loop. Validating the rendered configuration before pushing it
+lets the charm report a precise error instead.
+"""
+
+import re
+from typing import Any, Dict, Iterator, List, NoReturn, Tuple
+
+TOKEN_REGEX = re.compile(
+    r"""
+    (?P<whitespace>[ \t\r\n]+)
+    |(?P<comment>\#[^\n]*|//[^\n]*|/\*.*?\*/)
+    |(?P<string>"(?:[^"\\]|\\.)*")
+    |(?P<float>[-+]?(?:\d+\.\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?\d+[eE][-+]?\d+)
+    |(?P<hex>0[xX][0-9A-Fa-f]+L{0,2})
+    |(?P<integer>[-+]?\d+L{0,2})
+    |(?P<boolean>(?i:true|false)\b)
+    |(?P<name>[A-Za-z*][-A-Za-z0-9_*]*)
+    |(?P<punctuation>[=:;,\[\]\(\)\{\}])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+ESCAPE_REGEX = re.compile(r"\\(x[0-9A-Fa-f]{2}|.)", re.DOTALL)
+ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "f": "\f", "\\": "\\", '"': '"'}
+
+MCC_REGEX = re.compile(r"^\d{3}$")
+MNC_REGEX = re.compile(r"^\d{2,3}$")
+MAX_TAC = 0xFFFFFF
+MAX_SST = 0xFF
+MAX_SD = 0xFFFFFF
+
+Token = Tuple[str, str, int]
+
+
+class ConfigValidationError(Exception):
+    """Raised when the AMF configuration is not valid."""
+
+
+class LibconfigParser:
+    """Recursive descent parser for the libconfig grammar.
+
+    Groups are parsed to dictionaries, lists and arrays to Python lists and scalars to `bool`,
+    `int`, `float` or `str`.
+    """
+
+    def __init__(self, content: str):
+        """Tokenizes the content to parse."""
+        self._tokens = list(self._tokenize(content))
+        self._position = 0
+
+    def parse(self) -> Dict[str, Any]:
+        """Parses the whole configuration.
+
+        Returns:
+            dict: Top level settings of the configuration.
+        """
+        settings = self._parse_settings(closing=None)
+        if self._position != len(self._tokens):
+            self._fail("Unexpected token")
+        return settings
+
+    @staticmethod
+    def _tokenize(content: str) -> Iterator[Token]:
+        line = 1
+        position = 0
+        while position < len(content):
+            match = TOKEN_REGEX.match(content, position)
+            if not match:
+                raise ConfigValidationError(
+                    f"line {line}: unexpected character {content[position]!r}"
+                )
+            kind = match.lastgroup
+            value = match.group()
+            if kind not in ("whitespace", "comment"):
+                yield kind, value, line  # type: ignore[misc]
+            line += value.count("\n")
+            position = match.end()
+
+    def _peek(self) -> Token:
+        if self._position >= len(self._tokens):
+            line = self._tokens[-1][2] if self._tokens else 1
+            return "end", "", line
+        return self._tokens[self._position]
+
+    def _next(self) -> Token:
+        token = self._peek()
+        self._position += 1
+        return token
+
+    def _expect(self, value: str) -> None:
+        kind, token_value, _ = self._next()
+        if kind != "punctuation" or token_value != value:
+            self._position -= 1
+            self._fail(f"Expected {value!r}")
+
+    def _fail(self, message: str) -> NoReturn:
+        kind, value, line = self._peek()
+        found = "end of file" if kind == "end" else repr(value)
+        raise ConfigValidationError(f"line {line}: {message}, found {found}")
+
+    def _parse_settings(self, closing: Any) -> Dict[str, Any]:
+        settings: Dict[str, Any] = {}
+        while True:
+            kind, value, _ = self._peek()
+            if kind == "end" or (kind == "punctuation" and value == closing):
+                return settings
+            if kind != "name":
+                self._fail("Expected setting name")
+            self._next()
+            if value in settings:
+                self._position -= 1
+                self._fail(f"Duplicate setting {value}")
+            if self._peek()[1] not in ("=", ":"):
+                self._fail(f"Expected '=' or ':' after {value}")
+            self._next()
+            settings[value] = self._parse_value()
+            if self._peek()[1] in (";", ","):
+                self._next()
+
+    def _parse_value(self) -> Any:
+        kind, value, _ = self._peek()
+        if kind == "punctuation" and value == "{":
+            self._next()
+            group = self._parse_settings(closing="}")
+            self._expect("}")
+            return group
+        if kind == "punctuation" and value == "(":
+            self._next()
+            items = self._parse_values(closing=")", scalars_only=False)
+            self._expect(")")
+            return items
+        if kind == "punctuation" and value == "[":
+            self._next()
+            items = self._parse_values(closing="]", scalars_only=True)
+            self._expect("]")
+            if len({type(item) for item in items}) > 1:
+                self._fail("Array elements must all have the same type")
+            return items
+        return self._parse_scalar()
+
+    def _parse_values(self, closing: str, scalars_only: bool) -> List[Any]:
+        items: List[Any] = []
+        while self._peek()[1] != closing:
+            item = self._parse_scalar() if scalars_only else self._parse_value()
+            items.append(item)
+            if self._peek()[1] != ",":
+                break
+            self._next()
+        return items
+
+    def _parse_scalar(self) -> Any:
+        kind, value, _ = self._peek()
+        if kind == "string":
+            parts = []
+            while self._peek()[0] == "string":
+                parts.append(self._unescape(self._next()[1][1:-1]))
+            return "".join(parts)
+        if kind == "boolean":
+            self._next()
+            return value.lower() == "true"
+        if kind == "hex":
+            self._next()
+            return int(value.rstrip("L"), 16)
+        if kind == "integer":
+            self._next()
+            return int(value.rstrip("L"))
+        if kind == "float":
+            self._next()
+            return float(value)
+        self._fail("Expected a value")
+
+    @staticmethod
+    def _unescape(value: str) -> str:
+        def replace(match: "re.Match[str]") -> str:
+            escape = match.group(1)
+            if escape.startswith("x") and len(escape) == 3:
+                return chr(int(escape[1:], 16))
+            return ESCAPES.get(escape, escape)
+
+        return ESCAPE_REGEX.sub(replace, value)
+
+
+def parse_config(content: str) -> Dict[str, Any]:
+    """Parses a libconfig document.
+
+    Args:
+        content: libconfig document
+
+    Returns:
+        dict: Top level settings of the document.
+
+    Raises:
+        ConfigValidationError: if the document does not follow the libconfig grammar.
+    """
+    return LibconfigParser(content).parse()
+
+
+def validate_amf_config(content: str) -> None:
+    """Parses the AMF configuration and type checks its network identifiers.
+
+    Args:
+        content: Rendered AMF configuration
+
+    Raises:
+        ConfigValidationError: if the configuration does not parse or holds an invalid MCC, MNC,
+            TAC, SST or SD.
+    """
+    amf = _get(parse_config(content), "AMF", dict, "")
+    guami = _get(amf, "GUAMI", dict, "AMF")
+    _validate_plmn(guami, "AMF.GUAMI")
+    for index, served_guami in enumerate(_get(amf, "SERVED_GUAMI_LIST", list, "AMF")):
+        _validate_plmn(served_guami, f"AMF.SERVED_GUAMI_LIST[{index}]")
+    for index, plmn in enumerate(_get(amf, "PLMN_SUPPORT_LIST", list, "AMF")):
+        path = f"AMF.PLMN_SUPPORT_LIST[{index}]"
+        _validate_plmn(plmn, path)
+        tac = _get(plmn, "TAC", int, path)
+        if not 0 <= tac <= MAX_TAC:
+            raise ConfigValidationError(f"{path}.TAC: {tac} is out of range [0, {MAX_TAC}]")
+        for slice_index, slice_ in enumerate(_get(plmn, "SLICE_SUPPORT_LIST", list, path)):
+            slice_path = f"{path}.SLICE_SUPPORT_LIST[{slice_index}]"
+            _validate_number_string(slice_, "SST", slice_path, base=10, maximum=MAX_SST)
+            _validate_number_string(slice_, "SD", slice_path, base=0, maximum=MAX_SD)
+
+
+def _get(settings: Any, name: str, expected_type: type, path: str) -> Any:
+    setting_path = f"{path}.{name}" if path else name
+    if not isinstance(settings, dict):
+        raise ConfigValidationError(f"{path}: expected a group")
+    if name not in settings:
+        raise ConfigValidationError(f"{setting_path}: missing setting")
+    value = settings[name]
+    if not isinstance(value, expected_type) or isinstance(value, bool) != (expected_type is bool):
+        raise ConfigValidationError(
+            f"{setting_path}: expected {expected_type.__name__}, got {value!r}"
+        )
+    return value
+
+
+def _validate_plmn(settings: Any, path: str) -> None:
+    mcc = _get(settings, "MCC", str, path)
+    if not MCC_REGEX.match(mcc):
+        raise ConfigValidationError(f"{path}.MCC: {mcc!r} is not a 3 digit MCC")
+    mnc = _get(settings, "MNC", str, path)
+    if not MNC_REGEX.match(mnc):
+        raise ConfigValidationError(f"{path}.MNC: {mnc!r} is not a 2 or 3 digit MNC")
+
+
+def _validate_number_string(settings: Any, name: str, path: str, base: int, maximum: int) -> None:
+    value = _get(settings, name, str, path)
+    try:
+        number = int(value, base)
+    except ValueError:
+        raise ConfigValidationError(f"{path}.{name}: {value!r} is not a number")
+    if not 0 <= number <= maximum:
+        raise ConfigValidationError(f"{path}.{name}: {value!r} is out of range [0, {maximum}]")
@@ -0,0 +1,50 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Resolution of peer FQDNs by the charm, cached for a TTL.
+
+With `USE_FQDN_DNS = "yes"`, every FQDN lookup made by the AMF goes to the cluster DNS. When
+FQDN pinning is enabled, the charm resolves the FQDNs of the AMF peers itself and renders the
+resulting addresses in the config file, so the AMF does not depend on DNS latency. Resolved
+addresses are kept in a cache and resolved again once their TTL expired. Expiry is only checked
+in charm hooks, on update-status in steady state, so the effective TTL is at least the
+update-status interval of the model.
+"""
+
+import logging
+import socket
+from typing import Any, MutableMapping
+
+logger = logging.getLogger(__name__)
+
+
+def pinned_address(
+    cache: MutableMapping[str, Any], fqdn: str, fallback: str, ttl: int, now: float
+) -> str:
+    """Returns the address of an FQDN, from the cache unless its entry expired.
+
+    Args:
+        cache: Resolved addresses and resolution times, by FQDN
+        fqdn: FQDN to resolve
+        fallback: Address used when the FQDN was never resolved and does not resolve
+        ttl: Number of seconds a resolved address is kept
+        now: Current time, in seconds since the epoch
+
+    Returns:
+        str: IPv4 address to use for the FQDN.
+    """
+    entry = cache.get(fqdn)
+    if entry and now - entry["resolved_at"] < ttl:
+        return entry["address"]
+    try:
+        address = socket.gethostbyname(fqdn)
+    except OSError as e:
+        address = entry["address"] if entry else fallback
+        logger.warning("Could not resolve %s, using %s: %s", fqdn, address, e)
+    cache[fqdn] = {"address": address, "resolved_at": now}
+    return address
+
+
+def cache_expired(cache: MutableMapping[str, Any], ttl: int, now: float) -> bool:
+    """Returns whether an address of the cache must be resolved again."""
+    return any(now - entry["resolved_at"] >= ttl for entry in cache.values())
@@ -3,14 +3,24 @@
 
 """Kubernetes specific utilities."""
 
+import hashlib
+import json
 import logging
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from lightkube import Client
-from lightkube.resources.core_v1 import Service
+from lightkube import ApiError, Client
+from lightkube.models.core_v1 import ServicePort, ServiceSpec
+from lightkube.models.meta_v1 import ObjectMeta
+from lightkube.resources.apps_v1 import StatefulSet
+from lightkube.resources.core_v1 import Pod, Service
+from lightkube.types import PatchType
 
 logger = logging.getLogger(__name__)
 
+MULTUS_NETWORKS_ANNOTATION = "k8s.v1.cni.cncf.io/networks"
+MULTUS_NETWORK_STATUS_ANNOTATION = "k8s.v1.cni.cncf.io/network-status"
+SERVICE_SPEC_HASH_ANNOTATION = "oai-5g-amf/spec-hash"
+
 
 class Kubernetes:
     """Kubernetes main class."""
@@ -33,3 +43,221 @@ class Kubernetes:
         if not ingress:
             raise RuntimeError("The service has no ingress address.")
         return ingress[0].hostname, ingress[0].ip
+
+    def get_service_cluster_ip(self, name: str) -> Optional[str]:
+        """Retrieves ClusterIP address based on service name."""
+        service = self.get_service(name)
+        return service.spec.clusterIP  # type: ignore[union-attr]
+
+    def patch_service(
+        self, name: str, app_name: str, ports: List[ServicePort], service_type: str
+    ) -> None:
+        """Sets the type and ports of a service created by Juju, with server-side apply.
+
+        A digest of the type and ports is kept in an annotation of the service, so that a
+        service that already has them costs a single GET. They are applied with the application
+        as field manager. Ports owned by another field manager, such as the placeholder port Juju
+        creates the service with, are not removed by the apply and are replaced with a merge
+        patch.
+
+        Args:
+            name: Name of the service
+            app_name: Name of the Juju application, used as field manager
+            ports: Ports exposed by the service
+            service_type: Type of the service, such as `ClusterIP`
+
+        Returns:
+            None
+        """
+        spec_hash = hashlib.sha256(
+            json.dumps(
+                {"type": service_type, "ports": [port.to_dict() for port in ports]},
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()
+        current_service = self.get_service(name)
+        annotations = current_service.metadata.annotations or {}  # type: ignore[union-attr]
+        if annotations.get(SERVICE_SPEC_HASH_ANNOTATION) == spec_hash:
+            return
+        service = Service(
+            apiVersion="v1",
+            kind="Service",
+            metadata=ObjectMeta(
+                namespace=self.namespace,
+                name=name,
+                annotations={SERVICE_SPEC_HASH_ANNOTATION: spec_hash},
+            ),
+            spec=ServiceSpec(ports=ports, type=service_type),
+        )
+        applied_service = self.client.apply(service, field_manager=app_name, force=True)
+        port_names = {port.name for port in ports}
+        applied_ports = applied_service.spec.ports or []  # type: ignore[union-attr]
+        if any(port.name not in port_names for port in applied_ports):
+            self.client.patch(
+                Service,
+                name=name,
+                obj={"spec": {"ports": [port.to_dict() for port in ports]}},
+                namespace=self.namespace,
+                patch_type=PatchType.MERGE,
+            )
+        logger.info("Kubernetes service %s applied", name)
+
+    def create_load_balancer_service(
+        self,
+        name: str,
+        app_name: str,
+        port: ServicePort,
+        external_traffic_policy: str = "Cluster",
+    ) -> None:
+        """Creates or updates a LoadBalancer service selecting the application's pods.
+
+        Args:
+            name: Name of the service
+            app_name: Name of the Juju application whose pods are selected
+            port: Port exposed by the service
+            external_traffic_policy: `Cluster` or `Local`
+
+        Returns:
+            None
+        """
+        service = Service(
+            apiVersion="v1",
+            kind="Service",
+            metadata=ObjectMeta(
+                namespace=self.namespace,
+                name=name,
+                labels={"app.kubernetes.io/name": app_name},
+            ),
+            spec=ServiceSpec(
+                selector={"app.kubernetes.io/name": app_name},
+                ports=[port],
+                type="LoadBalancer",
+                externalTrafficPolicy=external_traffic_policy,
+            ),
+        )
+        self.client.apply(service, field_manager=app_name)
+        logger.info("Kubernetes service %s applied", name)
+
+    def delete_service(self, name: str) -> None:
+        """Deletes service based on name, ignoring services that no longer exist."""
+        try:
+            self.client.delete(Service, name, namespace=self.namespace)
+        except ApiError as e:
+            if e.status.code != 404:
+                raise
+        logger.info("Kubernetes service %s deleted", name)
+
+    def get_statefulset_network_attachment(self, statefulset_name: str) -> Optional[str]:
+        """Returns the Multus networks annotation of a StatefulSet's pod template."""
+        statefulset = self.client.get(StatefulSet, statefulset_name, namespace=self.namespace)
+        metadata = statefulset.spec.template.metadata
+        annotations = metadata.annotations if metadata else None
+        if not annotations:
+            return None
+        return annotations.get(MULTUS_NETWORKS_ANNOTATION)
+
+    def patch_statefulset_network_attachment(
+        self,
+        statefulset_name: str,
+        network_attachment_definition: Optional[str],
+        interface_name: str,
+    ) -> None:
+        """Attaches (or detaches) a Multus network to the StatefulSet's pod template.
+
+        Args:
+            statefulset_name: Name of the StatefulSet
+            network_attachment_definition: Name of the NetworkAttachmentDefinition, None to detach
+            interface_name: Name of the interface created in the pod
+
+        Returns:
+            None
+        """
+        networks = None
+        if network_attachment_definition:
+            networks = self.network_attachment_annotation(
+                network_attachment_definition=network_attachment_definition,
+                interface_name=interface_name,
+            )
+        patch = {
+            "spec": {
+                "template": {"metadata": {"annotations": {MULTUS_NETWORKS_ANNOTATION: networks}}}
+            }
+        }
+        self.client.patch(StatefulSet, name=statefulset_name, obj=patch, namespace=self.namespace)
+        logger.info("Multus network attachment patched on statefulset %s", statefulset_name)
+
+    @staticmethod
+    def network_attachment_annotation(
+        network_attachment_definition: str, interface_name: str
+    ) -> str:
+        """Returns the Multus networks annotation value for a single attachment."""
+        return json.dumps([{"name": network_attachment_definition, "interface": interface_name}])
+
+    def get_pod_network_attachment_ip(self, pod_name: str, interface_name: str) -> Optional[str]:
+        """Retrieves the IP address Multus assigned to a pod's secondary interface."""
+        pod = self.client.get(Pod, pod_name, namespace=self.namespace)
+        annotations = pod.metadata.annotations  # type: ignore[union-attr]
+        if not annotations or MULTUS_NETWORK_STATUS_ANNOTATION not in annotations:
+            return None
+        for network in json.loads(annotations[MULTUS_NETWORK_STATUS_ANNOTATION]):
+            if network.get("interface") == interface_name and network.get("ips"):
+                return network["ips"][0]
+        return None
+
+    def get_statefulset_resources(
+        self, statefulset_name: str
+    ) -> Dict[str, Dict[str, Dict[str, Dict[str, str]]]]:
+        """Returns the resource requests and limits of the containers of a StatefulSet.
+
+        Returns:
+            dict: Requests and limits by container name, under `containers` and
+                `initContainers` (e.g. {"containers": {"amf": {"requests": {}, "limits": {}}}}).
+        """
+        statefulset = self.client.get(StatefulSet, statefulset_name, namespace=self.namespace)
+        pod_spec = statefulset.spec.template.spec
+        return {
+            kind: {
+                container.name: {
+                    "requests": dict(getattr(container.resources, "requests", None) or {}),
+                    "limits": dict(getattr(container.resources, "limits", None) or {}),
+                }
+                for container in getattr(pod_spec, kind) or []
+            }
+            for kind in ("containers", "initContainers")
+        }
+
+    def patch_statefulset_resources(
+        self,
+        statefulset_name: str,
+        resources: Dict[str, Dict[str, Dict[str, Dict[str, str]]]],
+    ) -> None:
+        """Replaces the resource requests and limits of containers of a StatefulSet.
+
+        Args:
+            statefulset_name: Name of the StatefulSet
+            resources: Requests and limits by container name, under `containers` and
+                `initContainers`, as returned by `get_statefulset_resources`. Containers that
+                are not listed are left unchanged.
+
+        Returns:
+            None
+        """
+        patch = {
+            "spec": {
+                "template": {
+                    "spec": {
+                        kind: [
+                            {
+                                "name": container_name,
+                                "resources": {"$patch": "replace", **container_resources},
+                            }
+                            for container_name, container_resources in containers.items()
+                        ]
+                        for kind, containers in resources.items()
+                        if containers
+                    }
+                }
+            }
+        }
+        self.client.patch(StatefulSet, name=statefulset_name, obj=patch, namespace=self.namespace)
+        logger.info("Container resources patched on statefulset %s", statefulset_name)
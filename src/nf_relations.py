@@ -0,0 +1,53 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Data of the UDM and AUSF applications related to the AMF.
+
+The UDM and AUSF requirer libraries belong to the charms providing those interfaces and read a
+single relation. The AMF can be related to several UDM or AUSF applications, so their data is
+read here from every relation of the endpoint.
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, List
+
+from ops.model import Relation
+
+NF_INSTANCE_FIELDS = ["ipv4_address", "fqdn", "port", "api_version"]
+
+
+@dataclass(frozen=True)
+class NFInstance:
+    """NF application related to the AMF."""
+
+    app_name: str
+    ipv4_address: str
+    fqdn: str
+    port: str
+    api_version: str
+
+
+def nf_instances(nf: str, relations: Iterable[Relation]) -> List[NFInstance]:
+    """Returns the NF applications of every relation, ordered by relation id.
+
+    Args:
+        nf: "udm" or "ausf", the prefix of the relation data keys
+        relations: Relations of the NF endpoint
+
+    Returns:
+        list: NF applications, leaving out those that did not publish every field yet.
+    """
+    instances = []
+    for relation in sorted(relations, key=lambda relation: relation.id):
+        if not relation.app:
+            continue
+        relation_data = relation.data[relation.app]
+        if not all(f"{nf}_{field}" in relation_data for field in NF_INSTANCE_FIELDS):
+            continue
+        instances.append(
+            NFInstance(
+                app_name=relation.app.name,
+                **{field: relation_data[f"{nf}_{field}"] for field in NF_INSTANCE_FIELDS},
+            )
+        )
+    return instances
@@ -0,0 +1,54 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Configuration of the SBI egress proxy.
+
+The proxy is an Envoy process running next to the AMF in the workload container, listening on
+localhost, one port per NF. The AMF is pointed at these ports instead of the NFs, and Envoy
+keeps pooled keep-alive connections to every related instance, retries failed requests on
+another instance and ejects failing ones.
+
+Requests that may have reached an instance are only retried for idempotent methods, so that a
+POST such as a UE context creation is never sent twice. Other requests are only retried when
+the instance did not take them: on connection failures and refused HTTP/2 streams.
+"""
+
+from typing import List, Mapping, Tuple
+
+from jinja2 import Environment, FileSystemLoader
+
+TEMPLATES_DIRECTORY = "src/templates/"
+SBI_PROXY_TEMPLATE_NAME = "sbi-proxy.yaml.j2"
+SBI_PROXY_ADDRESS = "127.0.0.1"
+SBI_PROXY_FQDN = "localhost"
+SBI_PROXY_ADMIN_PORT = 9901
+SBI_PROXY_LISTENER_PORTS = {"nrf": 10080, "udm": 10081, "ausf": 10082}
+SBI_PROXY_RETRIES = 2
+SBI_PROXY_IDEMPOTENT_METHODS = ["GET", "HEAD", "PUT", "DELETE", "OPTIONS"]
+SBI_PROXY_RETRY_ON = "connect-failure,refused-stream"
+SBI_PROXY_IDEMPOTENT_RETRY_ON = f"{SBI_PROXY_RETRY_ON},reset,gateway-error"
+
+Endpoint = Tuple[str, int]
+
+
+def render_sbi_proxy_config(upstreams: Mapping[str, List[Endpoint]]) -> str:
+    """Renders the Envoy configuration of the SBI proxy.
+
+    Args:
+        upstreams: Address and port of the instances of each proxied NF, by NF name. NFs
+            without instance are left out.
+
+    Returns:
+        str: Envoy bootstrap configuration.
+    """
+    environment = Environment(loader=FileSystemLoader(TEMPLATES_DIRECTORY))
+    return environment.get_template(SBI_PROXY_TEMPLATE_NAME).render(
+        upstreams={nf: endpoints for nf, endpoints in upstreams.items() if endpoints},
+        listener_address=SBI_PROXY_ADDRESS,
+        listener_ports=SBI_PROXY_LISTENER_PORTS,
+        admin_port=SBI_PROXY_ADMIN_PORT,
+        retries=SBI_PROXY_RETRIES,
+        idempotent_methods="|".join(SBI_PROXY_IDEMPOTENT_METHODS),
+        idempotent_retry_on=SBI_PROXY_IDEMPOTENT_RETRY_ON,
+        retry_on=SBI_PROXY_RETRY_ON,
+    )
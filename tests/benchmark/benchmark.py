@@ -0,0 +1,421 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Registration storm benchmark of the AMF, for each config variant of the charm.
+
+For each variant, the charm renders `amf.conf` and its Pebble layer in a Harness, with relation
+data pointing at local stand-ins:
+
+- `stub_nf.py` stands in for the NRF, UDM and AUSF,
+- a MySQL container holds the subscribers that the AMF authenticates,
+- UERANSIM (`nr-gnb` and `nr-ue`) sets the NG interface up over SCTP on the loopback and
+  registers the UEs all at once.
+
+The AMF, and the SBI proxy for the variants enabling it, run in Docker on the host network with
+the rendered files and the command and environment of the Pebble layer. The stock AMF image
+does not ship Envoy, so the proxy runs from `--sbi-proxy-image` with the config directory of
+the AMF mounted. Registration latency is measured from the UERANSIM logs, from the first
+registration attempt of each UE until it is accepted.
+
+Usage:
+    tox -e benchmark -- --ueransim-directory ~/UERANSIM/build --ues 500
+"""
+
+import argparse
+import json
+import logging
+import math
+import re
+import shlex
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple
+from unittest.mock import patch
+
+import ops.testing
+from ops.pebble import CheckInfo, CheckLevel, CheckStatus
+from ops.testing import Harness
+from stub_nf import start_stub_nf
+
+from charm import Oai5GAMFOperatorCharm
+
+logger = logging.getLogger(__name__)
+
+VARIANTS: Dict[str, Dict[str, Any]] = {
+    "baseline": {},
+    "http2": {"use-http2": "yes"},
+    "sbi-proxy": {"sbi-proxy": True},
+}
+LOOPBACK_ADDRESS = "127.0.0.1"
+STUB_NF_PORT = 18080
+MYSQL_PORT = 3306
+MYSQL_USER = "oai"
+MYSQL_PASSWORD = "oai"
+AMF_CONTAINER_NAME = "amf-benchmark"
+SBI_PROXY_CONTAINER_NAME = "sbi-proxy-benchmark"
+ENVOY_BINARY_PATH = "/usr/local/bin/envoy"
+MYSQL_CONTAINER_NAME = "mysql-benchmark"
+MCC = "208"
+MNC = "99"
+TAC = 1
+SST = 1
+FIRST_MSIN = 1
+UE_KEY = "8baf473f2f8fd09487cccbd7097c6862"
+UE_OPC = "8e27b6af0e692e750f32667a3b14605d"
+UERANSIM_LOG_REGEX = re.compile(
+    r"^\[(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d{3})\] "
+    r"\[(?P<ue>imsi-\d+)\|nas\] \[\w+\] (?P<message>.*)$"
+)
+REGISTRATION_STARTED_REGEX = re.compile(
+    r"Sending Initial Registration|switches to state \[MM-REGISTER(ED)?-INITIATED"
+)
+REGISTRATION_ACCEPTED_REGEX = re.compile(r"Initial Registration is successful")
+PERCENTILES = [50, 90, 99]
+
+
+class RenderedVariant(NamedTuple):
+    """Files and Pebble layers rendered by the charm for a variant."""
+
+    amf_config: str
+    pebble_layer: dict
+    sbi_proxy_config: str
+
+
+class RegistrationResult(NamedTuple):
+    """Registration rate and latency of a benchmark run."""
+
+    attempted: int
+    registered: int
+    registrations_per_second: float
+    latency_percentiles_ms: Dict[int, float]
+
+
+@patch("charm.time.sleep")
+@patch(
+    "ops.model.Container.get_checks",
+    return_value={
+        name: CheckInfo(name=name, level=CheckLevel.READY, status=CheckStatus.UP)
+        for name in ["ngap", "sbi"]
+    },
+)
+@patch("lightkube.core.client.GenericSyncClient")
+def render_variant(options: Dict[str, Any], *_) -> RenderedVariant:
+    """Runs the charm in a Harness and returns what it pushed to the workload.
+
+    Args:
+        options: Config options of the variant, on top of the benchmark defaults
+    """
+    ops.testing.SIMULATE_CAN_CONNECT = True
+    harness = Harness(Oai5GAMFOperatorCharm)
+    try:
+        harness.begin()
+        harness.set_can_connect(container="amf", val=True)
+        amf_container = harness.model.unit.get_container("amf")
+        amf_container.make_dir("/openair-amf/etc", make_parents=True)
+        amf_container.push(ENVOY_BINARY_PATH, source="", make_dirs=True)
+        _add_stand_in_relations(harness)
+        harness.update_config({"ngap-interface-name": "lo", "n11-interface-name": "lo", **options})
+        sbi_proxy_config = ""
+        if options.get("sbi-proxy"):
+            sbi_proxy_config = amf_container.pull("/openair-amf/etc/sbi-proxy.yaml").read()
+        return RenderedVariant(
+            amf_config=amf_container.pull("/openair-amf/etc/amf.conf").read(),
+            pebble_layer=amf_container.get_plan().to_dict(),
+            sbi_proxy_config=sbi_proxy_config,
+        )
+    finally:
+        harness.cleanup()
+        ops.testing.SIMULATE_CAN_CONNECT = False
+
+
+def _add_stand_in_relations(harness: Harness) -> None:
+    for nf in ("nrf", "udm", "ausf"):
+        relation_id = harness.add_relation(f"fiveg-{nf}", nf)
+        harness.add_relation_unit(relation_id=relation_id, remote_unit_name=f"{nf}/0")
+        harness.update_relation_data(
+            relation_id=relation_id,
+            app_or_unit=nf,
+            key_values={
+                f"{nf}_ipv4_address": LOOPBACK_ADDRESS,
+                f"{nf}_port": str(STUB_NF_PORT),
+                f"{nf}_api_version": "v1",
+                f"{nf}_fqdn": "localhost",
+            },
+        )
+    relation_id = harness.add_relation(relation_name="database", remote_app="mysql")
+    harness.add_relation_unit(relation_id=relation_id, remote_unit_name="mysql/0")
+    harness.update_relation_data(
+        relation_id=relation_id,
+        app_or_unit="mysql",
+        key_values={
+            "username": MYSQL_USER,
+            "password": MYSQL_PASSWORD,
+            "endpoints": f"{LOOPBACK_ADDRESS}:{MYSQL_PORT}",
+        },
+    )
+
+
+def subscribers_sql(count: int) -> str:
+    """Returns the SQL creating the authentication data of `count` subscribers."""
+    statements = [
+        "CREATE TABLE IF NOT EXISTS AuthenticationSubscription ("
+        "ueid varchar(20) NOT NULL PRIMARY KEY, authenticationMethod varchar(25) NOT NULL, "
+        "encPermanentKey varchar(50), protectionParameterId varchar(50), sequenceNumber json, "
+        "authenticationManagementField varchar(50), algorithmId varchar(50), "
+        "encOpcKey varchar(50), encTopcKey varchar(50), vectorGenerationInHSS tinyint(1), "
+        "n5gcAuthMethod varchar(15), rgAuthenticationInd tinyint(1), supi varchar(20));"
+    ]
+    sequence_number = json.dumps(
+        {"sqn": "000000000020", "sqnScheme": "NON_TIME_BASED", "lastIndexes": {"ausf": 0}}
+    )
+    for imsi in _imsis(count):
+        statements.append(
+            "INSERT INTO AuthenticationSubscription (ueid, authenticationMethod, "
+            "encPermanentKey, protectionParameterId, sequenceNumber, "
+            "authenticationManagementField, algorithmId, encOpcKey, supi) VALUES "
+            f"('{imsi}', '5G_AKA', '{UE_KEY}', '{UE_KEY}', '{sequence_number}', '8000', "
+            f"'milenage', '{UE_OPC}', '{imsi}');"
+        )
+    return "\n".join(statements)
+
+
+def _imsis(count: int) -> List[str]:
+    return [f"{MCC}{MNC}{msin:010d}" for msin in range(FIRST_MSIN, FIRST_MSIN + count)]
+
+
+def gnb_config() -> Dict[str, Any]:
+    """Returns the UERANSIM gNB configuration."""
+    return {
+        "mcc": MCC,
+        "mnc": MNC,
+        "nci": "0x000000010",
+        "idLength": 32,
+        "tac": TAC,
+        "linkIp": LOOPBACK_ADDRESS,
+        "ngapIp": LOOPBACK_ADDRESS,
+        "gtpIp": LOOPBACK_ADDRESS,
+        "amfConfigs": [{"address": LOOPBACK_ADDRESS, "port": 38412}],
+        "slices": [{"sst": SST}],
+        "ignoreStreamIds": True,
+    }
+
+
+def ue_config() -> Dict[str, Any]:
+    """Returns the UERANSIM UE configuration, `nr-ue -n` increments the IMSI of each UE."""
+    return {
+        "supi": f"imsi-{_imsis(1)[0]}",
+        "mcc": MCC,
+        "mnc": MNC,
+        "key": UE_KEY,
+        "op": UE_OPC,
+        "opType": "OPC",
+        "amf": "8000",
+        "gnbSearchList": [LOOPBACK_ADDRESS],
+        "uacAic": {"mps": False, "mcs": False},
+        "uacAcc": {
+            "normalClass": 0,
+            "class11": False,
+            "class12": False,
+            "class13": False,
+            "class14": False,
+            "class15": False,
+        },
+        "sessions": [],
+        "configured-nssai": [{"sst": SST}],
+        "default-nssai": [{"sst": SST}],
+        "integrity": {"IA1": True, "IA2": True, "IA3": True},
+        "ciphering": {"EA1": True, "EA2": True, "EA3": True},
+        "integrityMaxRate": {"uplink": "full", "downlink": "full"},
+    }
+
+
+def parse_registrations(log_lines: Iterable[str], attempted: int) -> RegistrationResult:
+    """Computes the registration rate and latency percentiles from UERANSIM UE logs.
+
+    Args:
+        log_lines: Output of `nr-ue`
+        attempted: Number of UEs that were started
+    """
+    started: Dict[str, datetime] = {}
+    latencies_ms: List[float] = []
+    first_started = last_accepted = None
+    for line in log_lines:
+        match = UERANSIM_LOG_REGEX.match(line.strip())
+        if not match:
+            continue
+        ue = match.group("ue")
+        timestamp = datetime.strptime(match.group("time"), "%Y-%m-%d %H:%M:%S.%f")
+        if REGISTRATION_STARTED_REGEX.search(match.group("message")):
+            started.setdefault(ue, timestamp)
+            first_started = first_started or timestamp
+        elif REGISTRATION_ACCEPTED_REGEX.search(match.group("message")) and ue in started:
+            latencies_ms.append((timestamp - started.pop(ue)).total_seconds() * 1000)
+            last_accepted = timestamp
+    duration = (last_accepted - first_started).total_seconds() if last_accepted else 0
+    return RegistrationResult(
+        attempted=attempted,
+        registered=len(latencies_ms),
+        registrations_per_second=len(latencies_ms) / duration if duration else 0.0,
+        latency_percentiles_ms={
+            percentile: _percentile(latencies_ms, percentile) for percentile in PERCENTILES
+        },
+    )
+
+
+def _percentile(values: List[float], percentile: int) -> float:
+    """Returns the nearest-rank percentile of the values, 0 if there is none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percentile / 100 * len(ordered)) - 1, 0)]
+
+
+def _docker(*args: str) -> None:
+    subprocess.run(["docker", *args], check=True, stdout=subprocess.DEVNULL)
+
+
+def _start_mysql(ues: int) -> None:
+    _docker(
+        "run",
+        "-d",
+        "--rm",
+        "--name",
+        MYSQL_CONTAINER_NAME,
+        "--network",
+        "host",
+        "-e",
+        "MYSQL_ROOT_PASSWORD=root",
+        "-e",
+        "MYSQL_DATABASE=oai_db",
+        "-e",
+        f"MYSQL_USER={MYSQL_USER}",
+        "-e",
+        f"MYSQL_PASSWORD={MYSQL_PASSWORD}",
+        "mysql:8.0",
+    )
+    client = ["docker", "exec", "-i", MYSQL_CONTAINER_NAME, "mysql", "-uroot", "-proot"]
+    for _ in range(60):
+        if subprocess.run([*client, "-e", "SELECT 1"], capture_output=True).returncode == 0:
+            break
+        time.sleep(1)
+    subprocess.run([*client, "oai_db"], input=subscribers_sql(ues).encode(), check=True)
+
+
+def _start_workload(name: str, image: str, layer: dict, volume: str, service_name: str) -> None:
+    """Runs a Pebble service of a rendered layer in a container on the host network."""
+    service = layer["services"][service_name]
+    environment = [f"--env={key}={value}" for key, value in service.get("environment", {}).items()]
+    _docker(
+        "run",
+        "-d",
+        "--rm",
+        "--name",
+        name,
+        "--network",
+        "host",
+        "--volume",
+        volume,
+        *environment,
+        "--entrypoint",
+        "/bin/sh",
+        image,
+        "-c",
+        f"exec {service['command']}",
+    )
+
+
+def run_variant(
+    name: str, options: Dict[str, Any], arguments: argparse.Namespace
+) -> RegistrationResult:
+    """Renders a variant, starts the AMF with it and runs the registration storm."""
+    rendered = render_variant(options)
+    directory = (arguments.output_directory / name).resolve()
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / "amf.conf").write_text(rendered.amf_config)
+    (directory / "gnb.json").write_text(json.dumps(gnb_config()))
+    (directory / "ue.json").write_text(json.dumps(ue_config()))
+    containers = [AMF_CONTAINER_NAME]
+    processes = []
+    try:
+        if rendered.sbi_proxy_config:
+            (directory / "sbi-proxy.yaml").write_text(rendered.sbi_proxy_config)
+            containers.append(SBI_PROXY_CONTAINER_NAME)
+            _start_workload(
+                SBI_PROXY_CONTAINER_NAME,
+                arguments.sbi_proxy_image,
+                rendered.pebble_layer,
+                f"{directory}:/openair-amf/etc",
+                "sbi-proxy",
+            )
+        _start_workload(
+            AMF_CONTAINER_NAME,
+            arguments.amf_image,
+            rendered.pebble_layer,
+            f"{directory}:/openair-amf/etc",
+            "amf",
+        )
+        time.sleep(arguments.startup_seconds)
+        ueransim = arguments.ueransim_directory
+        processes.append(subprocess.Popen([f"{ueransim}/nr-gnb", "-c", f"{directory}/gnb.json"]))
+        time.sleep(arguments.startup_seconds)
+        ue_command = [f"{ueransim}/nr-ue", "-c", f"{directory}/ue.json", "-n", str(arguments.ues)]
+        logger.info("Running %s", shlex.join(ue_command))
+        ue_process = subprocess.Popen(ue_command, stdout=subprocess.PIPE, text=True)
+        processes.append(ue_process)
+        time.sleep(arguments.duration_seconds)
+        ue_process.terminate()
+        ue_output, _ = ue_process.communicate()
+        (directory / "nr-ue.log").write_text(ue_output)
+        return parse_registrations(ue_output.splitlines(), attempted=arguments.ues)
+    finally:
+        for process in processes:
+            process.terminate()
+        for container in containers:
+            subprocess.run(["docker", "rm", "-f", container], capture_output=True)
+
+
+def _arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ueransim-directory", required=True, type=Path)
+    parser.add_argument("--ues", type=int, default=100)
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--duration-seconds", type=int, default=60)
+    parser.add_argument("--startup-seconds", type=int, default=10)
+    parser.add_argument("--amf-image", default="docker.io/oaisoftwarealliance/oai-amf:v1.4.0")
+    parser.add_argument("--sbi-proxy-image", default="docker.io/envoyproxy/envoy:v1.28.0")
+    parser.add_argument("--output-directory", type=Path, default=Path("benchmark-results"))
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Runs the benchmark for each selected variant and reports the results."""
+    logging.basicConfig(level=logging.INFO)
+    arguments = _arguments()
+    stub_nf = start_stub_nf((LOOPBACK_ADDRESS, STUB_NF_PORT))
+    _start_mysql(arguments.ues)
+    arguments.output_directory.mkdir(parents=True, exist_ok=True)
+    results = {}
+    try:
+        for name in arguments.variants:
+            results[name] = run_variant(name, VARIANTS[name], arguments)
+    finally:
+        stub_nf.shutdown()
+        subprocess.run(["docker", "rm", "-f", MYSQL_CONTAINER_NAME], capture_output=True)
+    print(f"{'variant':<16} {'registered':>12} {'reg/s':>8}", end="")
+    print("".join(f" {f'p{percentile} ms':>10}" for percentile in PERCENTILES))
+    for name, result in results.items():
+        print(
+            f"{name:<16} {f'{result.registered}/{result.attempted}':>12} "
+            f"{result.registrations_per_second:>8.1f}",
+            end="",
+        )
+        print("".join(f" {result.latency_percentiles_ms[p]:>10.1f}" for p in PERCENTILES))
+    (arguments.output_directory / "results.json").write_text(
+        json.dumps({name: result._asdict() for name, result in results.items()}, indent=2)
+    )
+
+
+if __name__ == "__main__":
+    main()
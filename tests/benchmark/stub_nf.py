@@ -0,0 +1,91 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Stand-in NRF, UDM and AUSF for the benchmark.
+
+A single HTTP/1.1 server answers the SBI requests of the AMF with canned responses, so that the
+benchmark measures the AMF and not its peers. NF registrations are echoed back, heartbeats and
+deletions are acknowledged and queries return empty or minimal documents.
+"""
+
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ACCESS_AND_MOBILITY_SUBSCRIPTION = {
+    "nssai": {"defaultSingleNssais": [{"sst": 1, "sd": "0xFFFFFF"}]},
+    "subscribedUeAmbr": {"uplink": "1 Gbps", "downlink": "1 Gbps"},
+}
+
+
+class StubNFHandler(BaseHTTPRequestHandler):
+    """Answers every SBI request with a canned response."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Returns subscription data to UDM queries and no instance to NRF discoveries."""
+        if self.path.startswith("/nnrf-disc/"):
+            self._respond(200, {"validityPeriod": 3600, "nfInstances": []})
+        elif "/am-data" in self.path:
+            self._respond(200, ACCESS_AND_MOBILITY_SUBSCRIPTION)
+        else:
+            self._respond(200, {})
+
+    def do_PUT(self) -> None:  # noqa: N802
+        """Echoes NF profiles back, as the NRF does on registration."""
+        self._respond(201, self._read_body() or {})
+
+    def do_POST(self) -> None:  # noqa: N802
+        """Acknowledges subscriptions and notifications."""
+        self._read_body()
+        self._respond(201, {})
+
+    def do_PATCH(self) -> None:  # noqa: N802
+        """Acknowledges NRF heartbeats."""
+        self._read_body()
+        self._respond(204)
+
+    def do_DELETE(self) -> None:  # noqa: N802
+        """Acknowledges NF deregistrations."""
+        self._respond(204)
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        """Logs requests at debug level, the default handler writes every one to stderr."""
+        logger.debug(format, *args)
+
+    def _read_body(self) -> Optional[Dict[str, Any]]:
+        length = int(self.headers.get("Content-Length", 0))
+        if not length:
+            return None
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return None
+
+    def _respond(self, status: int, body: Optional[Dict[str, Any]] = None) -> None:
+        content = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if content:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def start_stub_nf(address: Tuple[str, int]) -> ThreadingHTTPServer:
+    """Starts the stand-in NFs in a background thread.
+
+    Args:
+        address: Address and port to listen on
+
+    Returns:
+        ThreadingHTTPServer: Running server, to be stopped with `shutdown`.
+    """
+    server = ThreadingHTTPServer(address, StubNFHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,30 +1,50 @@
 # Copyright 2022 Guillaume Belanger
 # See LICENSE file for licensing details.
 
+import io
+import json
+import shlex
+import subprocess
+import tempfile
+import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import ANY, Mock, PropertyMock, patch
 
 import ops.testing
+from lightkube.models.apps_v1 import StatefulSetSpec
 from lightkube.models.core_v1 import (
+    Container,
     LoadBalancerIngress,
     LoadBalancerStatus,
+    PodSpec,
+    PodTemplateSpec,
+    ResourceRequirements,
     Service,
     ServiceSpec,
 )
 from lightkube.models.core_v1 import ServiceStatus as K8sServiceStatus
-from ops.model import ActiveStatus
-from ops.pebble import ServiceInfo, ServiceStartup, ServiceStatus
+from lightkube.models.meta_v1 import LabelSelector, ObjectMeta
+from lightkube.resources.apps_v1 import StatefulSet
+from lightkube.resources.core_v1 import Pod
+from lightkube.resources.core_v1 import Service as ServiceResource
+from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus, WaitingStatus
+from ops.pebble import (
+    CheckInfo,
+    CheckLevel,
+    CheckStatus,
+    PathError,
+    ServiceInfo,
+    ServiceStartup,
+    ServiceStatus,
+)
 from ops.testing import Harness
 
-from charm import Oai5GAMFOperatorCharm
+from charm import Oai5GAMFOperatorCharm, _digest
+from charm_config import CharmConfig
 
 
 class TestCharm(unittest.TestCase):
     @patch("lightkube.core.client.GenericSyncClient")
-    @patch(
-        "charm.KubernetesServicePatch",
-        lambda charm, ports, service_type: None,
-    )
     def setUp(self, patch_lightkube_client):
         ops.testing.SIMULATE_CAN_CONNECT = True
         self.model_name = "whatever"
@@ -33,6 +53,22 @@ class TestCharm(unittest.TestCase):
         self.addCleanup(self.harness.cleanup)
         self.harness.set_model_name(name=self.model_name)
         self.harness.begin()
+        for patcher in (
+            patch("charm.time.sleep"),
+            patch(
+                "ops.model.Container.get_checks",
+                return_value=self._workload_checks(CheckStatus.UP),
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _workload_checks(status):
+        return {
+            name: CheckInfo(name=name, level=CheckLevel.READY, status=status)
+            for name in ["ngap", "sbi"]
+        }
 
     def _create_nrf_relation_with_valid_data(self):
         relation_id = self.harness.add_relation("fiveg-nrf", "nrf")
@@ -172,7 +208,7 @@ class TestCharm(unittest.TestCase):
             '    MCC = "208"; MNC = "99"; RegionID = "128"; AMFSetID = "1"; AMFPointer = "1"\n'  # noqa: E501, W505
             "  }\n\n"
             "  SERVED_GUAMI_LIST = (\n"
-            '    {MCC = "208"; MNC = "99"; RegionID = "128"; AMFSetID = "1"; AMFPointer = "0"}, #48bits <MCC><MNC><RegionID><AMFSetID><AMFPointer>\n'  # noqa: E501, W505
+            '    {MCC = "208"; MNC = "99"; RegionID = "128"; AMFSetID = "1"; AMFPointer = "1"}, #48bits <MCC><MNC><RegionID><AMFSetID><AMFPointer>\n'  # noqa: E501, W505
             '    {MCC = "460"; MNC = "11"; RegionID = "10"; AMFSetID = "1"; AMFPointer = "1"}  #48bits <MCC><MNC><RegionID><AMFSetID><AMFPointer>\n'  # noqa: E501, W505
             "  );\n\n"
             "  PLMN_SUPPORT_LIST = (\n"
@@ -287,7 +323,18 @@ class TestCharm(unittest.TestCase):
                     "summary": "amf",
                     "command": "/openair-amf/bin/oai_amf -c /openair-amf/etc/amf.conf -o",
                     "startup": "enabled",
-                }
+                    "on-check-failure": {"ngap": "restart", "sbi": "restart"},
+                },
+                "log-rotate": {
+                    "override": "replace",
+                    "summary": "amf log rotation",
+                    "command": "/bin/sh /openair-amf/etc/log/log-rotate.sh",
+                    "startup": "disabled",
+                    "environment": {
+                        "LOG_FILE_MAX_SIZE_BYTES": "104857600",
+                        "LOG_FILE_MAX_FILES": "3",
+                    },
+                },
             },
         }
         self.harness.container_pebble_ready("amf")
@@ -298,24 +345,24 @@ class TestCharm(unittest.TestCase):
         self.assertEqual(self.harness.model.unit.status, ActiveStatus())
 
     @patch("lightkube.Client.get")
+    @patch("ops.model.Container.get_checks")
     @patch("ops.model.Container.get_service")
     def test_given_unit_is_leader_when_amf_relation_joined_then_amf_relation_data_is_set(
-        self, patch_get_service, patch_k8s_get
+        self, patch_get_service, patch_get_checks, patch_k8s_get
     ):
-        load_balancer_ip = "1.2.3.4"
+        cluster_ip = "10.152.183.20"
         patch_k8s_get.return_value = Service(
-            spec=ServiceSpec(type="LoadBalancer"),
-            status=K8sServiceStatus(
-                loadBalancer=LoadBalancerStatus(ingress=[LoadBalancerIngress(ip=load_balancer_ip)])
-            ),
+            spec=ServiceSpec(type="ClusterIP", clusterIP=cluster_ip)
         )
         self.harness.set_leader(True)
+        self.harness.add_network("10.1.2.3")
         self.harness.set_can_connect(container="amf", val=True)
         patch_get_service.return_value = ServiceInfo(
             name="amf",
             current=ServiceStatus.ACTIVE,
             startup=ServiceStartup.ENABLED,
         )
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.UP)
 
         relation_id = self.harness.add_relation(relation_name="fiveg-amf", remote_app="smf")
         self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="smf/0")
@@ -324,15 +371,17 @@ class TestCharm(unittest.TestCase):
             relation_id=relation_id, app_or_unit=self.harness.model.app.name
         )
 
-        assert relation_data["amf_ipv4_address"] == load_balancer_ip
+        patch_k8s_get.assert_called_with(ServiceResource, "oai-5g-amf", namespace=self.model_name)
+        assert relation_data["amf_ipv4_address"] == cluster_ip
         assert relation_data["amf_fqdn"] == f"oai-5g-amf.{self.model_name}.svc.cluster.local"
         assert relation_data["amf_port"] == "80"
         assert relation_data["amf_api_version"] == "v1"
 
     @patch("lightkube.Client.get")
+    @patch("ops.model.Container.get_checks")
     @patch("ops.model.Container.get_service")
     def test_given_unit_is_leader_when_n2_relation_joined_then_amf_relation_data_is_set(
-        self, patch_get_service, patch_k8s_get
+        self, patch_get_service, patch_get_checks, patch_k8s_get
     ):
         load_balancer_ip = "5.6.7.8"
         patch_k8s_get.return_value = Service(
@@ -348,6 +397,7 @@ class TestCharm(unittest.TestCase):
             current=ServiceStatus.ACTIVE,
             startup=ServiceStartup.ENABLED,
         )
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.UP)
 
         relation_id = self.harness.add_relation(relation_name="fiveg-n2", remote_app="cu")
         self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="cu/0")
@@ -356,4 +406,1344 @@ class TestCharm(unittest.TestCase):
             relation_id=relation_id, app_or_unit=self.harness.model.app.name
         )
 
+        patch_k8s_get.assert_called_with(
+            ServiceResource, "oai-5g-amf-ngap", namespace=self.model_name
+        )
         assert relation_data["amf_address"] == load_balancer_ip
+
+    @patch("kubernetes.Kubernetes.patch_service")
+    @patch("lightkube.Client.apply")
+    def test_when_install_then_ngap_load_balancer_service_is_created(self, patch_k8s_apply, _):
+        self.harness.charm.on.install.emit()
+
+        patch_k8s_apply.assert_called_once()
+        service = patch_k8s_apply.call_args.args[0]
+        assert service.metadata.name == "oai-5g-amf-ngap"
+        assert service.spec.type == "LoadBalancer"
+        assert service.spec.externalTrafficPolicy == "Local"
+        assert service.spec.selector == {"app.kubernetes.io/name": "oai-5g-amf"}
+        assert [(port.port, port.protocol) for port in service.spec.ports] == [(38412, "SCTP")]
+
+    def test_given_data_published_on_n2_relation_when_relation_broken_then_published_data_digest_is_forgotten(  # noqa: E501
+        self,
+    ):
+        relation_id = self.harness.add_relation(relation_name="fiveg-n2", remote_app="cu")
+        other_relation_id = self.harness.add_relation(relation_name="fiveg-n2", remote_app="du")
+        for published_relation_id in (relation_id, other_relation_id):
+            self.harness.charm._record_published_relation_data(
+                published_relation_id, {"amf_address": "1.2.3.4"}
+            )
+
+        self.harness.remove_relation(relation_id)
+
+        self.assertEqual(
+            list(self.harness.charm._stored.relation_data_digests), [f"{other_relation_id}/app"]
+        )
+
+    @patch("lightkube.Client.apply", Mock())
+    @patch("kubernetes.Kubernetes.patch_service")
+    def test_when_install_then_juju_service_is_cluster_ip_with_sbi_ports(self, patch_service):
+        self.harness.charm.on.install.emit()
+
+        patch_service.assert_called_once_with(
+            name="oai-5g-amf", app_name="oai-5g-amf", ports=ANY, service_type="ClusterIP"
+        )
+        ports = patch_service.call_args.kwargs["ports"]
+        assert [(port.name, port.port) for port in ports] == [("http1", 80), ("http2", 9090)]
+
+    @patch("lightkube.Client.get")
+    @patch("ops.model.Container.get_checks")
+    @patch("ops.model.Container.get_service")
+    def test_given_ngap_network_attachment_configured_when_n2_relation_joined_then_multus_address_is_set(  # noqa: E501
+        self, patch_get_service, patch_get_checks, patch_k8s_get
+    ):
+        multus_ip = "192.168.250.3"
+        patch_k8s_get.return_value = Pod(
+            metadata=ObjectMeta(
+                annotations={
+                    "k8s.v1.cni.cncf.io/network-status": json.dumps(
+                        [
+                            {"name": "cilium", "interface": "eth0", "ips": ["10.1.0.4"]},
+                            {"name": "n2-net", "interface": "ngap", "ips": [multus_ip]},
+                        ]
+                    )
+                }
+            )
+        )
+        self.harness.update_config({"ngap-network-attachment-definition": "n2-net"})
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="amf", val=True)
+        patch_get_service.return_value = ServiceInfo(
+            name="amf",
+            current=ServiceStatus.ACTIVE,
+            startup=ServiceStartup.ENABLED,
+        )
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.UP)
+
+        relation_id = self.harness.add_relation(relation_name="fiveg-n2", remote_app="cu")
+        self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="cu/0")
+
+        relation_data = self.harness.get_relation_data(
+            relation_id=relation_id, app_or_unit=self.harness.model.app.name
+        )
+        assert relation_data["amf_address"] == multus_ip
+
+    @patch("ops.model.Container.push")
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    def test_given_ngap_network_attachment_configured_when_config_changed_then_statefulset_is_patched(  # noqa: E501
+        self, patch_k8s_get, patch_k8s_patch, _
+    ):
+        patch_k8s_get.return_value = StatefulSet(
+            metadata=ObjectMeta(annotations={}),
+            spec=StatefulSetSpec(
+                selector=LabelSelector(),
+                serviceName="oai-5g-amf-endpoints",
+                template=PodTemplateSpec(
+                    metadata=ObjectMeta(annotations={}),
+                    spec=PodSpec(containers=[Container(name="amf")]),
+                ),
+            ),
+        )
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        self.harness.update_config({"ngap-network-attachment-definition": "n2-net"})
+
+        patch_k8s_patch.assert_called_with(
+            StatefulSet,
+            name="oai-5g-amf",
+            obj={
+                "spec": {
+                    "template": {
+                        "metadata": {
+                            "annotations": {
+                                "k8s.v1.cni.cncf.io/networks": '[{"name": "n2-net", "interface": "ngap"}]'  # noqa: E501
+                            }
+                        }
+                    }
+                }
+            },
+            namespace=self.model_name,
+        )
+        self.assertEqual(
+            self.harness.model.unit.status,
+            WaitingStatus("Waiting for NGAP network attachment to be ready"),
+        )
+
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    def test_given_guaranteed_qos_when_config_changed_then_statefulset_resources_are_patched(
+        self, patch_k8s_get, patch_k8s_patch
+    ):
+        patch_k8s_get.return_value = StatefulSet(
+            spec=StatefulSetSpec(
+                selector=LabelSelector(),
+                serviceName="oai-5g-amf-endpoints",
+                template=PodTemplateSpec(
+                    spec=PodSpec(
+                        containers=[
+                            Container(
+                                name="amf",
+                                resources=ResourceRequirements(requests={"cpu": "1"}),
+                            )
+                        ]
+                    ),
+                ),
+            )
+        )
+        self.harness.set_leader(True)
+
+        self.harness.update_config(
+            {"cpu-request": "2", "memory-request": "1Gi", "guaranteed-qos": True}
+        )
+
+        patch_k8s_patch.assert_called_once_with(
+            StatefulSet,
+            name="oai-5g-amf",
+            obj={
+                "spec": {
+                    "template": {
+                        "spec": {
+                            "containers": [
+                                {
+                                    "name": "amf",
+                                    "resources": {
+                                        "$patch": "replace",
+                                        "requests": {"cpu": "2", "memory": "1Gi"},
+                                        "limits": {"cpu": "2", "memory": "1Gi"},
+                                    },
+                                }
+                            ]
+                        }
+                    }
+                }
+            },
+            namespace=self.model_name,
+        )
+
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    def test_given_guaranteed_qos_when_config_changed_then_every_container_gets_limits_equal_to_requests(  # noqa: E501
+        self, patch_k8s_get, patch_k8s_patch
+    ):
+        patch_k8s_get.return_value = StatefulSet(
+            spec=StatefulSetSpec(
+                selector=LabelSelector(),
+                serviceName="oai-5g-amf-endpoints",
+                template=PodTemplateSpec(
+                    spec=PodSpec(
+                        containers=[Container(name="charm"), Container(name="amf")],
+                        initContainers=[Container(name="charm-init")],
+                    ),
+                ),
+            )
+        )
+        self.harness.set_leader(True)
+
+        self.harness.update_config(
+            {"cpu-request": "2", "memory-request": "1Gi", "guaranteed-qos": True}
+        )
+
+        pod_spec_patch = patch_k8s_patch.call_args.kwargs["obj"]["spec"]["template"]["spec"]
+        sidecar_resources = {"cpu": "250m", "memory": "256Mi"}
+        self.assertEqual(
+            pod_spec_patch,
+            {
+                "containers": [
+                    {
+                        "name": "charm",
+                        "resources": {
+                            "$patch": "replace",
+                            "requests": sidecar_resources,
+                            "limits": sidecar_resources,
+                        },
+                    },
+                    {
+                        "name": "amf",
+                        "resources": {
+                            "$patch": "replace",
+                            "requests": {"cpu": "2", "memory": "1Gi"},
+                            "limits": {"cpu": "2", "memory": "1Gi"},
+                        },
+                    },
+                ],
+                "initContainers": [
+                    {
+                        "name": "charm-init",
+                        "resources": {
+                            "$patch": "replace",
+                            "requests": sidecar_resources,
+                            "limits": sidecar_resources,
+                        },
+                    }
+                ],
+            },
+        )
+
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.get")
+    def test_given_resources_normalized_by_api_server_when_config_changed_then_statefulset_is_not_patched(  # noqa: E501
+        self, patch_k8s_get, patch_k8s_patch
+    ):
+        normalized_resources = ResourceRequirements(
+            requests={"cpu": "2", "memory": "1Gi"}, limits={"cpu": "2", "memory": "1Gi"}
+        )
+        sidecar_resources = ResourceRequirements(
+            requests={"cpu": "250m", "memory": "256Mi"}, limits={"cpu": "250m", "memory": "256Mi"}
+        )
+        patch_k8s_get.return_value = StatefulSet(
+            spec=StatefulSetSpec(
+                selector=LabelSelector(),
+                serviceName="oai-5g-amf-endpoints",
+                template=PodTemplateSpec(
+                    spec=PodSpec(
+                        containers=[
+                            Container(name="charm", resources=sidecar_resources),
+                            Container(name="amf", resources=normalized_resources),
+                        ]
+                    ),
+                ),
+            )
+        )
+        self.harness.set_leader(True)
+
+        self.harness.update_config(
+            {"cpu-request": "2000m", "memory-request": "1024Mi", "guaranteed-qos": True}
+        )
+
+        patch_k8s_patch.assert_not_called()
+
+    def test_when_config_changed_then_charm_config_is_built_once_with_new_options(self):
+        with patch.object(
+            CharmConfig, "from_charm_config", wraps=CharmConfig.from_charm_config
+        ) as patch_from_charm_config:
+            self.harness.update_config({"allocator": "jemalloc"})
+
+        patch_from_charm_config.assert_called_once()
+        self.assertEqual(self.harness.charm._charm_config.allocator, "jemalloc")
+
+    @patch("lightkube.Client.get")
+    def test_given_statefulset_patched_for_current_options_when_config_changed_then_statefulset_is_not_fetched(  # noqa: E501
+        self, patch_k8s_get
+    ):
+        patch_k8s_get.return_value = StatefulSet(
+            spec=StatefulSetSpec(
+                selector=LabelSelector(),
+                serviceName="oai-5g-amf-endpoints",
+                template=PodTemplateSpec(spec=PodSpec(containers=[Container(name="amf")])),
+            )
+        )
+        self.harness.set_leader(True)
+        self.harness.update_config({"cpu-request": "1"})
+        patch_k8s_get.reset_mock()
+
+        self.harness.update_config({"allocator": "jemalloc"})
+
+        patch_k8s_get.assert_not_called()
+
+    def test_given_guaranteed_qos_without_requests_when_config_changed_then_status_is_blocked(
+        self,
+    ):
+        self.harness.update_config({"guaranteed-qos": True})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("guaranteed-qos requires both cpu-request and memory-request"),
+        )
+
+    @patch("ops.model.Container.pull")
+    def test_given_container_is_throttled_when_update_status_then_throttling_is_shown_in_status(
+        self, patch_pull
+    ):
+        patch_pull.return_value = io.StringIO(
+            "usage_usec 1000000\n"
+            "nr_periods 200\n"
+            "nr_throttled 50\n"
+            "throttled_usec 2500000\n"
+        )
+        self.harness.set_can_connect(container="amf", val=True)
+        self.harness.model.unit.status = ActiveStatus()
+
+        self.harness.charm.on.update_status.emit()
+
+        patch_pull.assert_called_with("/sys/fs/cgroup/cpu.stat")
+        self.assertEqual(
+            self.harness.model.unit.status,
+            ActiveStatus("CPU throttled in 25.0% of periods (2.5s total)"),
+        )
+
+    @patch("ops.model.Container.exists")
+    @patch("ops.model.Container.push")
+    def test_given_allocator_configured_when_config_changed_then_pebble_environment_is_set(  # noqa: E501
+        self, _, patch_exists
+    ):
+        patch_exists.side_effect = (
+            lambda path: path == "/usr/lib/x86_64-linux-gnu/libjemalloc.so.2"
+        )
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        self.harness.update_config({"allocator": "jemalloc"})
+
+        updated_plan = self.harness.get_container_pebble_plan("amf").to_dict()
+        self.assertEqual(
+            updated_plan["services"]["amf"]["environment"],
+            {"LD_PRELOAD": "/usr/lib/x86_64-linux-gnu/libjemalloc.so.2"},
+        )
+
+    def test_given_invalid_allocator_when_config_changed_then_status_is_blocked(self):
+        self.harness.set_can_connect(container="amf", val=True)
+
+        self.harness.update_config({"allocator": "mimalloc"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid allocator: mimalloc (expected one of "
+                "['default', 'jemalloc', 'tcmalloc'])"
+            ),
+        )
+
+    @patch("lightkube.Client.get")
+    @patch("ops.model.Container.get_checks")
+    @patch("ops.model.Container.get_service")
+    def test_given_amf_checks_are_down_when_n2_relation_joined_then_amf_relation_data_is_not_set(  # noqa: E501
+        self, patch_get_service, patch_get_checks, patch_k8s_get
+    ):
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="amf", val=True)
+        patch_get_service.return_value = ServiceInfo(
+            name="amf",
+            current=ServiceStatus.ACTIVE,
+            startup=ServiceStartup.ENABLED,
+        )
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.DOWN)
+
+        relation_id = self.harness.add_relation(relation_name="fiveg-n2", remote_app="cu")
+        self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="cu/0")
+
+        relation_data = self.harness.get_relation_data(
+            relation_id=relation_id, app_or_unit=self.harness.model.app.name
+        )
+        self.assertEqual(relation_data, {})
+        patch_k8s_get.assert_not_called()
+
+    def test_given_default_config_when_pebble_layer_is_built_then_readiness_checks_are_defined(  # noqa: E501
+        self,
+    ):
+        expected_checks = {
+            "ngap": {
+                "override": "replace",
+                "level": "ready",
+                "period": "3s",
+                "timeout": "2s",
+                "threshold": 5,
+                "exec": {
+                    "command": "awk '$6 == 38412 { found = 1 } END { exit !found }' /proc/net/sctp/eps"  # noqa: E501
+                },
+            },
+            "sbi": {
+                "override": "replace",
+                "level": "ready",
+                "period": "3s",
+                "timeout": "2s",
+                "threshold": 5,
+                "exec": {
+                    "command": "awk '$2 ~ /:0050$/ && $4 ~ /^0A$/ { found = 1 } END { exit !found }' /proc/net/tcp"  # noqa: E501
+                },
+            },
+            "drain": {
+                "override": "replace",
+                "level": "ready",
+                "period": "1s",
+                "timeout": "1s",
+                "threshold": 1,
+                "exec": {"command": "test ! -e /openair-amf/etc/draining"},
+            },
+        }
+
+        self.assertEqual(self.harness.charm._pebble_layer["checks"], expected_checks)
+
+    def test_given_amf_listening_on_n11_of_pod_address_when_sbi_check_runs_then_check_succeeds(
+        self,
+    ):
+        command = shlex.split(self.harness.charm._pebble_layer["checks"]["sbi"]["exec"]["command"])
+        proc_net_tcp = (
+            "  sl  local_address rem_address   st tx_queue rx_queue\n"
+            "   0: 0100007F:0CEA 00000000:0000 0A 00000000:00000000\n"
+            "   1: 0A01A8C0:0050 00000000:0000 0A 00000000:00000000\n"
+        )
+        with tempfile.NamedTemporaryFile("w", suffix="tcp") as sample:
+            sample.write(proc_net_tcp)
+            sample.flush()
+
+            check = subprocess.run([*command[:-1], sample.name])
+
+        self.assertEqual(check.returncode, 0)
+
+    def test_given_n11_port_not_listening_when_sbi_check_runs_then_check_fails(self):
+        command = shlex.split(self.harness.charm._pebble_layer["checks"]["sbi"]["exec"]["command"])
+        proc_net_tcp = (
+            "  sl  local_address rem_address   st tx_queue rx_queue\n"
+            "   0: 0A01A8C0:0050 0A01A8C1:9C40 01 00000000:00000000\n"
+        )
+        with tempfile.NamedTemporaryFile("w", suffix="tcp") as sample:
+            sample.write(proc_net_tcp)
+            sample.flush()
+
+            check = subprocess.run([*command[:-1], sample.name])
+
+        self.assertNotEqual(check.returncode, 0)
+
+    @patch("ops.model.Container.push")
+    def test_given_file_log_sink_when_config_changed_then_amf_logs_to_file_and_log_rotate_service_is_added(  # noqa: E501
+        self, patch_push
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        self.harness.update_config({"log-sink": "file", "log-file-max-size": 10})
+
+        services = self.harness.get_container_pebble_plan("amf").to_dict()["services"]
+        self.assertEqual(
+            services["amf"]["command"],
+            '/bin/sh -c "exec /openair-amf/bin/oai_amf -c /openair-amf/etc/amf.conf -o '
+            '>> /openair-amf/etc/log/amf.log 2>&1"',
+        )
+        self.assertEqual(
+            services["log-rotate"]["command"], "/bin/sh /openair-amf/etc/log/log-rotate.sh"
+        )
+        self.assertEqual(
+            services["log-rotate"]["environment"]["LOG_FILE_MAX_SIZE_BYTES"], "10485760"
+        )
+        patch_push.assert_called_with(
+            path="/openair-amf/etc/log/log-rotate.sh", source=ANY, make_dirs=True
+        )
+
+    @patch("ops.model.Container.restart")
+    def test_given_file_log_sink_when_log_file_limits_change_then_log_rotate_service_is_updated_without_amf_restart(  # noqa: E501
+        self, patch_restart
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self.harness.model.unit.get_container("amf").make_dir(
+            "/openair-amf/etc", make_parents=True
+        )
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        self.harness.update_config({"log-sink": "file"})
+        layer_digest = self.harness.charm._stored.layer_digest
+
+        self.harness.update_config({"log-file-max-size": 10, "log-file-max-files": 5})
+
+        services = self.harness.get_container_pebble_plan("amf").to_dict()["services"]
+        self.assertEqual(
+            services["log-rotate"]["environment"],
+            {"LOG_FILE_MAX_SIZE_BYTES": "10485760", "LOG_FILE_MAX_FILES": "5"},
+        )
+        self.assertNotEqual(self.harness.charm._stored.layer_digest, layer_digest)
+        patch_restart.assert_not_called()
+
+    @patch("ops.model.Container.push")
+    def test_given_file_log_sink_when_log_sink_set_to_stdout_then_log_rotate_service_is_stopped_and_disabled(  # noqa: E501
+        self, _
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        self.harness.update_config({"log-sink": "file"})
+        container = self.harness.model.unit.get_container("amf")
+        self.assertTrue(container.get_service("log-rotate").is_running())
+
+        self.harness.update_config({"log-sink": "stdout"})
+        container.replan()
+
+        services = self.harness.get_container_pebble_plan("amf").to_dict()["services"]
+        self.assertEqual(services["log-rotate"]["startup"], "disabled")
+        self.assertFalse(container.get_service("log-rotate").is_running())
+        self.assertTrue(container.get_service("amf").is_running())
+
+    @patch("ops.model.Container.pull")
+    def test_given_file_log_sink_when_update_status_then_log_rate_is_shown_in_status(
+        self, patch_pull
+    ):
+        patch_pull.side_effect = lambda path: {
+            "/openair-amf/etc/log/rate": io.StringIO("20480\n"),
+            "/sys/fs/cgroup/cpu.stat": io.StringIO("nr_periods 0\nnr_throttled 0\n"),
+        }[path]
+        self.harness.update_config({"log-sink": "file"})
+        self.harness.set_can_connect(container="amf", val=True)
+        self.harness.model.unit.status = ActiveStatus()
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus("Logging 20.0 KiB/s"))
+
+    @patch("ops.model.Container.push")
+    def test_given_invalid_tac_when_config_changed_then_status_is_blocked_and_config_is_not_pushed(  # noqa: E501
+        self, patch_push
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        patch_push.reset_mock()
+
+        self.harness.update_config({"plmn-0-support-tac": "0x0001; 0x0002"})
+
+        patch_push.assert_not_called()
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("Invalid AMF config: line 50: Expected setting name, found '0x0002'"),
+        )
+
+    @patch("ops.model.Container.restart")
+    @patch("ops.model.Container.push")
+    def test_given_config_already_applied_when_config_changed_then_amf_is_not_restarted(
+        self, patch_push, patch_restart
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        patch_push.reset_mock()
+        patch_restart.reset_mock()
+
+        self.harness.charm.on.config_changed.emit()
+
+        patch_push.assert_not_called()
+        patch_restart.assert_not_called()
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    @patch("ops.model.Container.pull")
+    @patch("lightkube.Client.get")
+    @patch("ops.model.Container.get_checks")
+    @patch("ops.model.Container.get_service")
+    def test_given_load_balancer_address_changed_when_update_status_then_n2_relation_data_is_updated(  # noqa: E501
+        self, patch_get_service, patch_get_checks, patch_k8s_get, patch_pull
+    ):
+        patch_pull.side_effect = PathError("not-found", "")
+        patch_k8s_get.return_value = Service(
+            spec=ServiceSpec(type="LoadBalancer"),
+            status=K8sServiceStatus(
+                loadBalancer=LoadBalancerStatus(ingress=[LoadBalancerIngress(ip="5.6.7.8")])
+            ),
+        )
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="amf", val=True)
+        patch_get_service.return_value = ServiceInfo(
+            name="amf",
+            current=ServiceStatus.ACTIVE,
+            startup=ServiceStartup.ENABLED,
+        )
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.UP)
+        relation_id = self.harness.add_relation(relation_name="fiveg-n2", remote_app="cu")
+        self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="cu/0")
+        patch_k8s_get.return_value = Service(
+            spec=ServiceSpec(type="LoadBalancer"),
+            status=K8sServiceStatus(
+                loadBalancer=LoadBalancerStatus(ingress=[LoadBalancerIngress(ip="9.10.11.12")])
+            ),
+        )
+        self.harness.model.unit.status = ActiveStatus()
+
+        self.harness.charm.on.update_status.emit()
+
+        relation_data = self.harness.get_relation_data(
+            relation_id=relation_id, app_or_unit=self.harness.model.app.name
+        )
+        assert relation_data["amf_address"] == "9.10.11.12"
+
+    @patch("ops.model.Container.pull")
+    @patch("lightkube.Client.get")
+    @patch("ops.model.Container.get_checks")
+    @patch("ops.model.Container.get_service")
+    def test_given_load_balancer_without_ingress_when_update_status_then_published_address_is_kept(  # noqa: E501
+        self, patch_get_service, patch_get_checks, patch_k8s_get, patch_pull
+    ):
+        patch_pull.side_effect = PathError("not-found", "")
+        patch_k8s_get.return_value = Service(
+            spec=ServiceSpec(type="LoadBalancer"),
+            status=K8sServiceStatus(
+                loadBalancer=LoadBalancerStatus(ingress=[LoadBalancerIngress(ip="5.6.7.8")])
+            ),
+        )
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="amf", val=True)
+        patch_get_service.return_value = ServiceInfo(
+            name="amf",
+            current=ServiceStatus.ACTIVE,
+            startup=ServiceStartup.ENABLED,
+        )
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.UP)
+        relation_id = self.harness.add_relation(relation_name="fiveg-n2", remote_app="cu")
+        self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="cu/0")
+        patch_k8s_get.return_value = Service(
+            spec=ServiceSpec(type="LoadBalancer"),
+            status=K8sServiceStatus(loadBalancer=LoadBalancerStatus(ingress=[])),
+        )
+        self.harness.model.unit.status = ActiveStatus()
+
+        self.harness.charm.on.update_status.emit()
+
+        relation_data = self.harness.get_relation_data(
+            relation_id=relation_id, app_or_unit=self.harness.model.app.name
+        )
+        assert relation_data["amf_address"] == "5.6.7.8"
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    @patch("ops.model.Container.push")
+    def test_given_config_pushed_when_config_changed_then_rendered_sections_except_authentication_are_kept(  # noqa: E501
+        self, _
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        self.harness.update_config({"amf-name": "AMF_1"})
+
+        config_sections = self.harness.charm._stored.config_sections
+        self.assertNotIn("authentication", config_sections)
+        self.assertIn('AMF_NAME = "AMF_1";', config_sections["general"]["content"])
+
+    def test_given_config_changed_twice_when_rollback_config_action_then_previous_config_is_restored(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        container = self.harness.model.unit.get_container("amf")
+        container.make_dir("/openair-amf/etc", make_parents=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        self.harness.update_config({"amf-name": "AMF_1"})
+        archived_configs = container.list_files("/openair-amf/etc/history")
+        self.assertEqual(len(archived_configs), 1)
+
+        output = self.harness.run_action("rollback-config")
+
+        config = container.pull("/openair-amf/etc/amf.conf").read()
+        self.assertIn('AMF_NAME = "OAI_AMF";', config)
+        self.assertEqual(output.results, {"restored-config": archived_configs[0].path})
+        archived_configs = container.list_files("/openair-amf/etc/history")
+        self.assertEqual(len(archived_configs), 1)
+        archived_config = container.pull(archived_configs[0].path).read()
+        self.assertIn('AMF_NAME = "AMF_1";', archived_config)
+        self.assertEqual(self.harness.charm._stored.config_digest, _digest(config))
+        self.assertEqual(dict(self.harness.charm._stored.config_section_digests), {})
+
+    def test_given_no_archived_config_when_rollback_config_action_then_action_fails(self):
+        self.harness.set_can_connect(container="amf", val=True)
+        container = self.harness.model.unit.get_container("amf")
+        container.make_dir("/openair-amf/etc", make_parents=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        with self.assertRaises(ops.testing.ActionFailed) as e:
+            self.harness.run_action("rollback-config")
+
+        self.assertEqual(e.exception.message, "No previous config file to roll back to")
+
+    @patch("ops.model.Container.get_checks")
+    def test_given_amf_checks_go_down_after_config_change_when_config_changed_then_known_good_config_is_restored(  # noqa: E501
+        self, patch_get_checks
+    ):
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.UP)
+        self.harness.set_can_connect(container="amf", val=True)
+        container = self.harness.model.unit.get_container("amf")
+        container.make_dir("/openair-amf/etc", make_parents=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.DOWN)
+
+        self.harness.update_config({"amf-name": "AMF_1"})
+
+        config = container.pull("/openair-amf/etc/amf.conf").read()
+        self.assertIn('AMF_NAME = "OAI_AMF";', config)
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("AMF was not healthy with the new config, restored last known good"),
+        )
+
+    @patch("ops.model.Container.get_checks")
+    def test_given_amf_checks_go_down_after_layer_change_when_config_changed_then_known_good_layer_is_restored(  # noqa: E501
+        self, patch_get_checks
+    ):
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.UP)
+        self.harness.set_can_connect(container="amf", val=True)
+        container = self.harness.model.unit.get_container("amf")
+        container.make_dir("/openair-amf/etc", make_parents=True)
+        container.push("/usr/lib/x86_64-linux-gnu/libjemalloc.so.2", source="", make_dirs=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.DOWN)
+
+        self.harness.update_config({"allocator": "jemalloc"})
+
+        services = self.harness.get_container_pebble_plan("amf").to_dict()["services"]
+        self.assertNotIn("environment", services["amf"])
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("AMF was not healthy with the new config, restored last known good"),
+        )
+
+    def test_given_amf_checks_pass_after_restart_when_config_changed_then_health_watch_ends_after_one_check_period(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self.harness.model.unit.get_container("amf").make_dir(
+            "/openair-amf/etc", make_parents=True
+        )
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        with patch("charm.time.sleep") as patch_sleep:
+            self.harness.update_config({"amf-name": "AMF_1"})
+
+        self.assertEqual(patch_sleep.call_count, 5)
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    @patch("ops.model.Container.restart")
+    @patch("ops.model.Container.push")
+    def test_given_relations_joined_one_after_the_other_when_bring_up_then_amf_is_started_without_restart(  # noqa: E501
+        self, _, patch_restart
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_database_relation_with_valid_data()
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self.harness.charm.on.config_changed.emit()
+
+        patch_restart.assert_not_called()
+        service = self.harness.model.unit.get_container("amf").get_service("amf")
+        self.assertTrue(service.is_running())
+
+    @patch("ops.model.Container.restart")
+    def test_given_amf_running_when_config_file_changes_then_amf_is_restarted_once(
+        self, patch_restart
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self.harness.model.unit.get_container("amf").make_dir(
+            "/openair-amf/etc", make_parents=True
+        )
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        self.harness.update_config({"amf-name": "AMF_1"})
+
+        patch_restart.assert_called_once_with("amf")
+
+    def _bring_up_amf_with_peer(self):
+        self.harness.set_can_connect(container="amf", val=True)
+        self.harness.model.unit.get_container("amf").make_dir(
+            "/openair-amf/etc", make_parents=True
+        )
+        peer_relation_id = self.harness.add_relation("replicas", "oai-5g-amf")
+        self.harness.add_relation_unit(peer_relation_id, "oai-5g-amf/1")
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        return peer_relation_id
+
+    def test_given_restart_lock_held_by_other_unit_when_rollback_config_action_then_action_fails_and_config_is_kept(  # noqa: E501
+        self,
+    ):
+        peer_relation_id = self._bring_up_amf_with_peer()
+        self.harness.set_leader(True)
+        self.harness.update_config({"amf-name": "AMF_1"})
+        self.harness.update_relation_data(
+            peer_relation_id, "oai-5g-amf/1", {"restart-requested": "true"}
+        )
+        self.harness.update_relation_data(
+            peer_relation_id, "oai-5g-amf", {"restart-lock-holders": '["oai-5g-amf/1"]'}
+        )
+
+        with self.assertRaises(ops.testing.ActionFailed) as e:
+            self.harness.run_action("rollback-config")
+
+        self.assertEqual(
+            e.exception.message, "Other units are restarting, run the action again later"
+        )
+        config = self.harness.model.unit.get_container("amf").pull("/openair-amf/etc/amf.conf")
+        self.assertIn('AMF_NAME = "AMF_1";', config.read())
+        unit_data = self.harness.get_relation_data(peer_relation_id, "oai-5g-amf/0")
+        self.assertNotIn("restart-requested", unit_data)
+
+    @patch("ops.model.Container.restart")
+    def test_given_amf_running_with_peers_and_lock_held_by_other_unit_when_config_changed_then_amf_waits_for_restart_lock(  # noqa: E501
+        self, patch_restart
+    ):
+        peer_relation_id = self._bring_up_amf_with_peer()
+        self.harness.update_relation_data(
+            peer_relation_id, "oai-5g-amf", {"restart-lock-holders": '["oai-5g-amf/1"]'}
+        )
+
+        self.harness.update_config({"amf-name": "AMF_1"})
+
+        patch_restart.assert_not_called()
+        self.assertEqual(
+            self.harness.model.unit.status, MaintenanceStatus("Waiting for rolling restart lock")
+        )
+        unit_data = self.harness.get_relation_data(peer_relation_id, "oai-5g-amf/0")
+        self.assertEqual(unit_data["restart-requested"], "true")
+
+    def test_given_amf_waiting_for_restart_lock_when_config_becomes_invalid_then_restart_request_is_withdrawn(  # noqa: E501
+        self,
+    ):
+        peer_relation_id = self._bring_up_amf_with_peer()
+        self.harness.update_relation_data(
+            peer_relation_id, "oai-5g-amf", {"restart-lock-holders": '["oai-5g-amf/1"]'}
+        )
+        self.harness.update_config({"amf-name": "AMF_1"})
+
+        self.harness.update_config({"allocator": "mimalloc"})
+
+        self.assertIsInstance(self.harness.model.unit.status, BlockedStatus)
+        unit_data = self.harness.get_relation_data(peer_relation_id, "oai-5g-amf/0")
+        self.assertNotIn("restart-requested", unit_data)
+
+    def test_given_restart_requested_by_peer_when_leader_elected_then_restart_lock_is_granted(
+        self,
+    ):
+        peer_relation_id = self.harness.add_relation("replicas", "oai-5g-amf")
+        self.harness.add_relation_unit(peer_relation_id, "oai-5g-amf/1")
+        self.harness.update_relation_data(
+            peer_relation_id, "oai-5g-amf/1", {"restart-requested": "true"}
+        )
+
+        self.harness.set_leader(True)
+
+        app_data = self.harness.get_relation_data(peer_relation_id, "oai-5g-amf")
+        self.assertEqual(app_data["restart-lock-holders"], '["oai-5g-amf/1"]')
+
+    def test_given_restart_lock_held_by_unit_when_unit_departs_then_lock_is_granted_to_next_unit(
+        self,
+    ):
+        peer_relation_id = self.harness.add_relation("replicas", "oai-5g-amf")
+        for unit_name in ("oai-5g-amf/1", "oai-5g-amf/2"):
+            self.harness.add_relation_unit(peer_relation_id, unit_name)
+            self.harness.update_relation_data(
+                peer_relation_id, unit_name, {"restart-requested": "true"}
+            )
+        self.harness.set_leader(True)
+
+        self.harness.remove_relation_unit(peer_relation_id, "oai-5g-amf/1")
+
+        app_data = self.harness.get_relation_data(peer_relation_id, "oai-5g-amf")
+        self.assertEqual(app_data["restart-lock-holders"], '["oai-5g-amf/2"]')
+
+    @patch("ops.model.Container.restart")
+    def test_given_lock_released_by_other_unit_when_peer_relation_changed_then_amf_is_restarted_and_lock_is_released(  # noqa: E501
+        self, patch_restart
+    ):
+        peer_relation_id = self._bring_up_amf_with_peer()
+        self.harness.update_relation_data(
+            peer_relation_id, "oai-5g-amf/1", {"restart-requested": "true"}
+        )
+        self.harness.set_leader(True)
+        self.harness.update_relation_data(
+            peer_relation_id, "oai-5g-amf", {"restart-lock-holders": '["oai-5g-amf/1"]'}
+        )
+        self.harness.update_config({"amf-name": "AMF_1"})
+        patch_restart.assert_not_called()
+
+        self.harness.update_relation_data(
+            peer_relation_id, "oai-5g-amf/1", {"restart-requested": ""}
+        )
+
+        patch_restart.assert_called_once_with("amf")
+        self.assertNotIn(
+            "restart-requested", self.harness.get_relation_data(peer_relation_id, "oai-5g-amf/0")
+        )
+        app_data = self.harness.get_relation_data(peer_relation_id, "oai-5g-amf")
+        self.assertEqual(app_data["restart-lock-holders"], "[]")
+
+    @patch("ops.model.Container.restart")
+    def test_given_drain_period_when_config_file_changes_then_unit_is_drained_before_restart_and_resumed_after(  # noqa: E501
+        self, patch_restart
+    ):
+        container = self.harness.model.unit.get_container("amf")
+        drained_at_restart = []
+        patch_restart.side_effect = lambda *_: drained_at_restart.append(
+            container.exists("/openair-amf/etc/draining")
+        )
+        self.harness.set_can_connect(container="amf", val=True)
+        container.make_dir("/openair-amf/etc", make_parents=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        self.harness.update_config({"amf-name": "AMF_1", "drain-period": 30})
+
+        self.assertEqual(drained_at_restart, [True])
+        self.assertFalse(container.exists("/openair-amf/etc/draining"))
+
+    def test_given_ngap_network_attachment_and_drain_period_when_drain_before_restart_then_unit_is_not_drained(  # noqa: E501
+        self,
+    ):
+        self.harness.update_config(
+            {"ngap-network-attachment-definition": "n2-net", "drain-period": 30}
+        )
+        self.harness.set_can_connect(container="amf", val=True)
+        container = self.harness.model.unit.get_container("amf")
+
+        with patch("charm.time.sleep") as patch_sleep:
+            drained = self.harness.charm._drain_before_restart()
+
+        self.assertFalse(drained)
+        self.assertFalse(container.exists("/openair-amf/etc/draining"))
+        patch_sleep.assert_not_called()
+
+    def test_given_amf_active_when_drain_action_then_unit_is_drained_until_resume_action(self):
+        self.harness.set_can_connect(container="amf", val=True)
+        container = self.harness.model.unit.get_container("amf")
+        container.make_dir("/openair-amf/etc", make_parents=True)
+        self.harness.model.unit.status = ActiveStatus()
+
+        self.harness.run_action("drain")
+
+        self.assertTrue(container.exists("/openair-amf/etc/draining"))
+        self.assertEqual(
+            self.harness.model.unit.status,
+            ActiveStatus("Drained, not accepting new NGAP associations"),
+        )
+
+        self.harness.run_action("resume")
+
+        self.assertFalse(container.exists("/openair-amf/etc/draining"))
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    @patch("ops.model.Container.get_checks")
+    @patch("ops.model.Container.get_service")
+    def test_given_amf_service_is_ready_when_amf_relation_joined_then_unit_guami_is_published(
+        self, patch_get_service, patch_get_checks
+    ):
+        self.harness.add_network("10.1.2.3")
+        self.harness.set_can_connect(container="amf", val=True)
+        patch_get_service.return_value = ServiceInfo(
+            name="amf",
+            current=ServiceStatus.ACTIVE,
+            startup=ServiceStartup.ENABLED,
+        )
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.UP)
+
+        relation_id = self.harness.add_relation(relation_name="fiveg-amf", remote_app="smf")
+        self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="smf/0")
+
+        unit_data = self.harness.get_relation_data(
+            relation_id=relation_id, app_or_unit=self.harness.model.unit.name
+        )
+        amf_fqdn = f"oai-5g-amf-0.oai-5g-amf-endpoints.{self.model_name}.svc.cluster.local"
+        self.assertEqual(
+            json.loads(unit_data.pop("amf_instance")),
+            {
+                "version": 1,
+                "address": "10.1.2.3",
+                "fqdn": amf_fqdn,
+                "mcc": "208",
+                "mnc": "99",
+                "region_id": "128",
+                "amf_set_id": "1",
+                "amf_pointer": "1",
+                "relative_capacity": 30,
+            },
+        )
+        self.assertEqual(
+            unit_data,
+            {
+                "amf_address": "10.1.2.3",
+                "amf_fqdn": amf_fqdn,
+                "guami_mcc": "208",
+                "guami_mnc": "99",
+                "guami_region_id": "128",
+                "guami_amf_set_id": "1",
+                "guami_amf_pointer": "1",
+                "relative_capacity": "30",
+            },
+        )
+
+    @patch("charm.Oai5GAMFOperatorCharm._unit_number", new_callable=PropertyMock)
+    def test_given_unit_number_beyond_amf_pointer_range_when_config_changed_then_status_is_blocked(  # noqa: E501
+        self, patch_unit_number
+    ):
+        patch_unit_number.return_value = 63
+        self.harness.set_can_connect(container="amf", val=True)
+
+        self.harness.update_config({"amf-name": "AMF_1"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("Unit number 63 exceeds the GUAMI AMF pointer range (at most 62)"),
+        )
+
+    @patch("ops.model.Container.push")
+    def test_given_two_udm_relations_when_config_changed_then_config_file_uses_udm_selected_by_unit_number(  # noqa: E501
+        self, patch_push
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        relation_id = self.harness.add_relation("fiveg-udm", "udm-b")
+        self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="udm-b/0")
+
+        self.harness.update_relation_data(
+            relation_id=relation_id,
+            app_or_unit="udm-b",
+            key_values={
+                "udm_ipv4_address": "5.6.7.8",
+                "udm_port": "81",
+                "udm_fqdn": "udm-b.example.com",
+                "udm_api_version": "v1",
+            },
+        )
+
+        content = patch_push.call_args.kwargs["source"]
+        self.assertIn('IPV4_ADDRESS = "1.2.3.4";', content)
+        self.assertNotIn("5.6.7.8", content)
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    def test_given_sbi_proxy_enabled_when_config_changed_then_amf_is_pointed_at_proxy_and_proxy_is_configured_with_relation_data(  # noqa: E501
+        self,
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        container = self.harness.model.unit.get_container("amf")
+        container.make_dir("/openair-amf/etc", make_parents=True)
+        container.push("/usr/local/bin/envoy", source="", make_dirs=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        self.harness.update_config({"sbi-proxy": True})
+
+        amf_config = (
+            self.harness.model.unit.get_container("amf")
+            .pull("/openair-amf/etc/amf.conf")
+            .read()
+        )
+        proxy_config = container.pull("/openair-amf/etc/sbi-proxy.yaml").read()
+        self.assertIn('IPV4_ADDRESS = "127.0.0.1";\n      PORT         = 10081;', amf_config)
+        self.assertIn('FQDN         = "localhost";', amf_config)
+        self.assertIn("socket_address: { address: 1.2.3.4, port_value: 81 }", proxy_config)
+        self.assertIn(
+            'regex: "GET|HEAD|PUT|DELETE|OPTIONS" } }\n'
+            "                route:\n"
+            "                  cluster: udm\n"
+            "                  retry_policy:\n"
+            "                    retry_on: connect-failure,refused-stream,reset,gateway-error\n",
+            proxy_config,
+        )
+        self.assertEqual(proxy_config.count("retry_on: connect-failure,refused-stream\n"), 3)
+        self.assertEqual(
+            container.get_plan().services["sbi-proxy"].command,
+            "/usr/local/bin/envoy -c /openair-amf/etc/sbi-proxy.yaml --log-level warn",
+        )
+        self.assertTrue(container.get_service("sbi-proxy").is_running())
+        self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    def test_given_restart_lock_held_by_other_unit_when_sbi_proxy_enabled_then_proxy_is_not_configured(  # noqa: E501
+        self,
+    ):
+        peer_relation_id = self._bring_up_amf_with_peer()
+        container = self.harness.model.unit.get_container("amf")
+        container.push("/usr/local/bin/envoy", source="", make_dirs=True)
+        self.harness.update_relation_data(
+            peer_relation_id, "oai-5g-amf", {"restart-lock-holders": '["oai-5g-amf/1"]'}
+        )
+
+        self.harness.update_config({"sbi-proxy": True})
+
+        self.assertFalse(container.exists("/openair-amf/etc/sbi-proxy.yaml"))
+        self.assertNotIn("sbi-proxy", container.get_plan().services)
+        self.assertEqual(
+            self.harness.model.unit.status, MaintenanceStatus("Waiting for rolling restart lock")
+        )
+
+    def test_given_sbi_proxy_enabled_when_udm_relation_added_then_proxy_config_is_updated(self):
+        self.harness.set_can_connect(container="amf", val=True)
+        container = self.harness.model.unit.get_container("amf")
+        container.make_dir("/openair-amf/etc", make_parents=True)
+        container.push("/usr/local/bin/envoy", source="", make_dirs=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        self.harness.update_config({"sbi-proxy": True})
+
+        relation_id = self.harness.add_relation("fiveg-udm", "udm-b")
+        self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="udm-b/0")
+        self.harness.update_relation_data(
+            relation_id=relation_id,
+            app_or_unit="udm-b",
+            key_values={
+                "udm_ipv4_address": "5.6.7.8",
+                "udm_port": "81",
+                "udm_fqdn": "udm-b.example.com",
+                "udm_api_version": "v1",
+            },
+        )
+
+        proxy_config = container.pull("/openair-amf/etc/sbi-proxy.yaml").read()
+        self.assertIn("socket_address: { address: 5.6.7.8, port_value: 81 }", proxy_config)
+        self.assertTrue(container.get_service("sbi-proxy").is_running())
+
+    def test_given_envoy_not_in_workload_image_when_sbi_proxy_enabled_then_status_is_blocked(
+        self,
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self.harness.model.unit.get_container("amf").make_dir(
+            "/openair-amf/etc", make_parents=True
+        )
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        self.harness.update_config({"sbi-proxy": True})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("sbi-proxy requires Envoy in the workload image"),
+        )
+
+    @patch("fqdn_pinning.socket.gethostbyname")
+    @patch("ops.model.Container.push")
+    def test_given_fqdn_pinning_when_config_changed_then_config_file_holds_resolved_addresses_and_does_not_use_dns(  # noqa: E501
+        self, patch_push, patch_gethostbyname
+    ):
+        patch_gethostbyname.return_value = "10.0.0.1"
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        self.harness.update_config({"fqdn-pinning": True})
+
+        content = patch_push.call_args.kwargs["source"]
+        self.assertIn('IPV4_ADDRESS = "10.0.0.1";', content)
+        self.assertNotIn('IPV4_ADDRESS = "1.2.3.4";', content)
+        self.assertIn('USE_FQDN_DNS    = "no";', content)
+        patch_gethostbyname.assert_any_call("udm.example.com")
+
+    @patch("fqdn_pinning.socket.gethostbyname")
+    def test_given_fqdn_pinning_and_udm_relation_removed_when_update_status_with_expired_pins_then_status_is_blocked(  # noqa: E501
+        self, patch_gethostbyname
+    ):
+        patch_gethostbyname.return_value = "10.0.0.1"
+        self.harness.set_can_connect(container="amf", val=True)
+        self.harness.model.unit.get_container("amf").make_dir(
+            "/openair-amf/etc", make_parents=True
+        )
+        self._create_nrf_relation_with_valid_data()
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        self.harness.update_config({"fqdn-pinning": True})
+        self.harness.remove_relation(self.harness.model.get_relation("fiveg-udm").id)
+
+        with patch("charm.time.time", return_value=time.time() + 86400):
+            self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("Waiting for relation to UDM to be created"),
+        )
+
+    @patch("lightkube.Client.get")
+    @patch("ops.model.Container.get_service")
+    def test_given_500_gnbs_when_n2_relations_joined_then_load_balancer_address_is_fetched_once(
+        self, patch_get_service, patch_k8s_get
+    ):
+        gnb_count = 500
+        patch_k8s_get.return_value = Service(
+            spec=ServiceSpec(type="LoadBalancer"),
+            status=K8sServiceStatus(
+                loadBalancer=LoadBalancerStatus(ingress=[LoadBalancerIngress(ip="5.6.7.8")])
+            ),
+        )
+        patch_get_service.return_value = ServiceInfo(
+            name="amf",
+            current=ServiceStatus.ACTIVE,
+            startup=ServiceStartup.ENABLED,
+        )
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="amf", val=True)
+        n2_provides = self.harness.charm.n2_provides
+        n2_provides.set_amf_information = Mock(wraps=n2_provides.set_amf_information)
+
+        relation_ids = []
+        for gnb in range(gnb_count):
+            relation_id = self.harness.add_relation(
+                relation_name="fiveg-n2", remote_app=f"gnb{gnb}"
+            )
+            self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name=f"gnb{gnb}/0")
+            relation_ids.append(relation_id)
+
+        self.assertEqual(patch_k8s_get.call_count, 1)
+        self.assertEqual(n2_provides.set_amf_information.call_count, gnb_count)
+        for relation_id in relation_ids:
+            relation_data = self.harness.get_relation_data(
+                relation_id=relation_id, app_or_unit=self.harness.model.app.name
+            )
+            self.assertEqual(relation_data["amf_address"], "5.6.7.8")
+
+    @patch("charm.Oai5GAMFOperatorCharm._patch_statefulset", Mock())
+    @patch("kubernetes.Kubernetes.get_pod_network_attachment_ip")
+    @patch("kubernetes.Kubernetes.get_service_load_balancer_address")
+    @patch("ops.model.Container.get_checks")
+    @patch("ops.model.Container.get_service")
+    def test_given_load_balancer_address_published_when_ngap_network_attachment_configured_then_multus_address_is_published(  # noqa: E501
+        self, patch_get_service, patch_get_checks, patch_load_balancer_address, patch_multus_ip
+    ):
+        patch_load_balancer_address.return_value = (None, "5.6.7.8")
+        patch_multus_ip.return_value = "192.168.250.3"
+        patch_get_service.return_value = ServiceInfo(
+            name="amf",
+            current=ServiceStatus.ACTIVE,
+            startup=ServiceStartup.ENABLED,
+        )
+        patch_get_checks.return_value = self._workload_checks(CheckStatus.UP)
+        self.harness.set_leader(True)
+        self.harness.set_can_connect(container="amf", val=True)
+        relation_id = self.harness.add_relation(relation_name="fiveg-n2", remote_app="cu")
+        self.harness.add_relation_unit(relation_id=relation_id, remote_unit_name="cu/0")
+
+        self.harness.update_config({"ngap-network-attachment-definition": "n2-net"})
+        other_relation_id = self.harness.add_relation(relation_name="fiveg-n2", remote_app="du")
+        self.harness.add_relation_unit(relation_id=other_relation_id, remote_unit_name="du/0")
+
+        relation_data = self.harness.get_relation_data(
+            relation_id=other_relation_id, app_or_unit=self.harness.model.app.name
+        )
+        self.assertEqual(relation_data["amf_address"], "192.168.250.3")
+
+    def test_given_pebble_not_ready_when_nrf_relation_changed_then_nf_relation_data_is_not_recorded(  # noqa: E501
+        self,
+    ):
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+
+        self._create_nrf_relation_with_valid_data()
+
+        self.assertEqual(self.harness.charm._stored.nf_relation_data_digest, "")
+        self.assertEqual(
+            self.harness.model.unit.status,
+            WaitingStatus("Waiting for Pebble in workload container"),
+        )
+
+    @patch("charm.Oai5GAMFOperatorCharm._configure_workload")
+    def test_given_unused_nrf_relation_key_changed_when_relation_changed_then_workload_is_not_reconfigured(  # noqa: E501
+        self, patch_configure_workload
+    ):
+        self.harness.set_can_connect(container="amf", val=True)
+        self._create_udm_relation_with_valid_data()
+        self._create_ausf_relation_with_valid_data()
+        self._create_database_relation_with_valid_data()
+        self._create_nrf_relation_with_valid_data()
+        patch_configure_workload.reset_mock()
+        relation_id = self.harness.model.get_relation("fiveg-nrf").id
+
+        self.harness.update_relation_data(
+            relation_id=relation_id, app_or_unit="nrf", key_values={"nrf_unused": "value"}
+        )
+        patch_configure_workload.assert_not_called()
+
+        self.harness.update_relation_data(
+            relation_id=relation_id, app_or_unit="nrf", key_values={"nrf_port": "82"}
+        )
+        patch_configure_workload.assert_called_once()
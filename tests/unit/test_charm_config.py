@@ -0,0 +1,53 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import dataclasses
+import unittest
+
+import yaml
+
+from charm_config import CharmConfig
+
+
+def _default_config() -> CharmConfig:
+    with open("config.yaml") as config_file:
+        options = yaml.safe_load(config_file)["options"]
+    return CharmConfig.from_charm_config(
+        {name: option.get("default") for name, option in options.items()}
+    )
+
+
+class TestCharmConfig(unittest.TestCase):
+    def test_given_default_options_when_validate_then_no_error_is_returned(self):
+        self.assertIsNone(_default_config().validate())
+
+    def test_given_default_options_when_algorithm_lists_then_libconfig_arrays_are_returned(self):
+        config = _default_config()
+
+        self.assertEqual(config.integrity_algorithm_list, '[ "NIA0" , "NIA1" , "NIA2" ]')
+        self.assertEqual(config.ciphering_algorithm_list, '[ "NEA0" , "NEA1" , "NEA2" ]')
+
+    def test_given_yes_no_option_with_other_value_when_validate_then_error_is_returned(self):
+        config = dataclasses.replace(_default_config(), use_http2="true")
+
+        self.assertEqual(
+            config.validate(), "Invalid use-http2: true (expected one of ['yes', 'no'])"
+        )
+
+    def test_given_unknown_integrity_algorithm_when_validate_then_error_is_returned(self):
+        config = dataclasses.replace(_default_config(), integrity_algorithms="NIA0,NIA9")
+
+        self.assertEqual(
+            config.validate(),
+            "Invalid integrity-algorithms: expected a list of ['NIA0', 'NIA1', 'NIA2', 'NIA3']",
+        )
+
+    def test_given_out_of_range_port_when_validate_then_error_is_returned(self):
+        config = dataclasses.replace(_default_config(), nssf_port=70000)
+
+        self.assertEqual(config.validate(), "Invalid nssf-port: 70000 is not a port")
+
+    def test_given_drain_period_above_maximum_when_validate_then_error_is_returned(self):
+        config = dataclasses.replace(_default_config(), drain_period=600)
+
+        self.assertEqual(config.validate(), "Invalid drain-period: 600 (expected 0 to 120)")
@@ -0,0 +1,34 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+
+from config_renderer import changed_sections, render_section, section_digests
+
+NAS_PARAMETERS = {
+    "integrity_algorithm_list": '[ "NIA0" ]',
+    "cyphering_algorithm_list": '[ "NEA0" ]',
+}
+
+
+class TestConfigRenderer(unittest.TestCase):
+    def test_given_nas_parameters_when_render_section_then_nas_group_is_rendered(self):
+        section = render_section("nas", NAS_PARAMETERS)
+
+        self.assertTrue(section.startswith("  NAS:\n  {\n"))
+        self.assertIn('ORDERED_SUPPORTED_INTEGRITY_ALGORITHM_LIST = [ "NIA0" ];', section)
+        self.assertTrue(section.endswith("  };"))
+
+    def test_given_one_section_changed_when_changed_sections_then_only_its_name_is_returned(
+        self,
+    ):
+        sections = {"ngap": "ngap", "nas": render_section("nas", NAS_PARAMETERS)}
+        digests = section_digests(sections)
+        sections["ngap"] = "new ngap"
+
+        self.assertEqual(changed_sections(sections, digests), ["ngap"])
+
+    def test_given_no_applied_digests_when_changed_sections_then_all_sections_are_returned(self):
+        sections = {"general": "general", "nas": "nas"}
+
+        self.assertEqual(changed_sections(sections, {}), ["general", "nas"])
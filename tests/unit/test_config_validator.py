@@ -0,0 +1,139 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+
+from config_validator import ConfigValidationError, parse_config, validate_amf_config
+
+VALID_AMF_CONFIG = """
+AMF =
+{
+  INSTANCE_ID = 0;            # 0 is the default
+  GUAMI:
+  {
+    MCC = "208"; MNC = "99"; RegionID = "128"; AMFSetID = "1"; AMFPointer = "1"
+  }
+
+  SERVED_GUAMI_LIST = (
+    {MCC = "208"; MNC = "99"; RegionID = "128"; AMFSetID = "1"; AMFPointer = "0"}, #48bits
+    {MCC = "460"; MNC = "011"; RegionID = "10"; AMFSetID = "1"; AMFPointer = "1"}
+  );
+
+  PLMN_SUPPORT_LIST = (
+  {
+    MCC = "208"; MNC = "99"; TAC = 0x0001;
+    SLICE_SUPPORT_LIST = (
+      {SST = "1"; SD = "1"},
+      {SST = "111"; SD = "0xFFFFFF"}
+     )
+  }
+  );
+
+  INTERFACES:
+  {
+    N11:
+    {
+      SMF_INSTANCES_POOL = (
+        {SMF_INSTANCE_ID = 1; PORT = "80"; HTTP2_PORT = 8080, SELECTED = "true"}
+      );
+    };
+  };
+
+  NAS:
+  {
+    ORDERED_SUPPORTED_INTEGRITY_ALGORITHM_LIST = [ "NIA0" , "NIA1" , "NIA2" ];
+  };
+};
+"""
+
+
+class TestConfigValidator(unittest.TestCase):
+    def test_given_valid_config_when_validate_then_no_error_is_raised(self):
+        validate_amf_config(VALID_AMF_CONFIG)
+
+    def test_given_libconfig_document_when_parse_then_values_are_typed(self):
+        settings = parse_config(
+            'a = 0x10; b = -3L; c = 1.5e2; d = TRUE; e = "x" "y\\n"; '
+            'f = [1, 2]; g = (1, "two", {h = 3;}); /* comment */ i: { j = false };'
+        )
+
+        self.assertEqual(
+            settings,
+            {
+                "a": 16,
+                "b": -3,
+                "c": 150.0,
+                "d": True,
+                "e": "xy\n",
+                "f": [1, 2],
+                "g": [1, "two", {"h": 3}],
+                "i": {"j": False},
+            },
+        )
+
+    def test_given_malformed_tac_when_validate_then_error_reports_line(self):
+        config = VALID_AMF_CONFIG.replace("TAC = 0x0001", "TAC = 1-2")
+
+        with self.assertRaises(ConfigValidationError) as context:
+            validate_amf_config(config)
+
+        self.assertEqual(str(context.exception), "line 17: Expected setting name, found '-2'")
+
+    def test_given_tac_out_of_range_when_validate_then_error_is_raised(self):
+        config = VALID_AMF_CONFIG.replace("TAC = 0x0001", "TAC = 0x1000000")
+
+        with self.assertRaises(ConfigValidationError) as context:
+            validate_amf_config(config)
+
+        self.assertEqual(
+            str(context.exception),
+            "AMF.PLMN_SUPPORT_LIST[0].TAC: 16777216 is out of range [0, 16777215]",
+        )
+
+    def test_given_invalid_mcc_when_validate_then_error_is_raised(self):
+        config = VALID_AMF_CONFIG.replace('MCC = "460"', 'MCC = "46"')
+
+        with self.assertRaises(ConfigValidationError) as context:
+            validate_amf_config(config)
+
+        self.assertEqual(
+            str(context.exception), "AMF.SERVED_GUAMI_LIST[1].MCC: '46' is not a 3 digit MCC"
+        )
+
+    def test_given_invalid_mnc_when_validate_then_error_is_raised(self):
+        config = VALID_AMF_CONFIG.replace('MNC = "011"', 'MNC = "1"')
+
+        with self.assertRaises(ConfigValidationError) as context:
+            validate_amf_config(config)
+
+        self.assertEqual(
+            str(context.exception), "AMF.SERVED_GUAMI_LIST[1].MNC: '1' is not a 2 or 3 digit MNC"
+        )
+
+    def test_given_sst_out_of_range_when_validate_then_error_is_raised(self):
+        config = VALID_AMF_CONFIG.replace('SST = "111"', 'SST = "256"')
+
+        with self.assertRaises(ConfigValidationError) as context:
+            validate_amf_config(config)
+
+        self.assertEqual(
+            str(context.exception),
+            "AMF.PLMN_SUPPORT_LIST[0].SLICE_SUPPORT_LIST[1].SST: '256' is out of range [0, 255]",
+        )
+
+    def test_given_non_numeric_sd_when_validate_then_error_is_raised(self):
+        config = VALID_AMF_CONFIG.replace('SD = "1"', 'SD = "abc"')
+
+        with self.assertRaises(ConfigValidationError) as context:
+            validate_amf_config(config)
+
+        self.assertEqual(
+            str(context.exception),
+            "AMF.PLMN_SUPPORT_LIST[0].SLICE_SUPPORT_LIST[0].SD: 'abc' is not a number",
+        )
+
+    def test_given_unterminated_group_when_validate_then_error_is_raised(self):
+        with self.assertRaises(ConfigValidationError) as context:
+            validate_amf_config('AMF = { GUAMI: { MCC = "208"; };')
+
+        self.assertEqual(str(context.exception), "line 1: Expected '}', found end of file")
@@ -0,0 +1,121 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import json
+import unittest
+
+from charms.oai_5g_amf.v1.fiveg_amf import (
+    AMFInformation,
+    FiveGAMFProvides,
+    FiveGAMFRequires,
+)
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+REQUIRER_METADATA = """
+name: smf
+requires:
+  fiveg-amf:
+    interface: fiveg-amf
+"""
+PROVIDER_METADATA = """
+name: amf
+provides:
+  fiveg-amf:
+    interface: fiveg-amf
+"""
+
+
+class RequirerCharm(CharmBase):
+    def __init__(self, *args):
+        """Init."""
+        super().__init__(*args)
+        self.amf_requires = FiveGAMFRequires(self, "fiveg-amf")
+
+
+class ProviderCharm(CharmBase):
+    def __init__(self, *args):
+        """Init."""
+        super().__init__(*args)
+        self.amf_provides = FiveGAMFProvides(self, "fiveg-amf")
+
+
+class TestFiveGAMFRequires(unittest.TestCase):
+    def setUp(self):
+        self.harness = Harness(RequirerCharm, meta=REQUIRER_METADATA)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.relation_id = self.harness.add_relation("fiveg-amf", "amf")
+        self.harness.add_relation_unit(self.relation_id, "amf/0")
+
+    def test_given_json_document_when_amf_information_then_document_fields_are_returned(self):
+        self.harness.update_relation_data(
+            self.relation_id,
+            "amf",
+            {
+                "amf": json.dumps(
+                    {
+                        "version": 1,
+                        "ipv4_address": "1.2.3.4",
+                        "fqdn": "amf.example.com",
+                        "port": "80",
+                        "api_version": "v1",
+                    }
+                )
+            },
+        )
+
+        self.assertEqual(
+            self.harness.charm.amf_requires.amf_information,
+            AMFInformation(
+                ipv4_address="1.2.3.4", fqdn="amf.example.com", port="80", api_version="v1"
+            ),
+        )
+
+    def test_given_only_v0_keys_when_amf_information_then_v0_keys_are_read(self):
+        self.harness.update_relation_data(
+            self.relation_id,
+            "amf",
+            {
+                "amf_ipv4_address": "1.2.3.4",
+                "amf_fqdn": "amf.example.com",
+                "amf_port": "80",
+                "amf_api_version": "v1",
+            },
+        )
+
+        self.assertEqual(
+            self.harness.charm.amf_requires.amf_information,
+            AMFInformation(
+                ipv4_address="1.2.3.4", fqdn="amf.example.com", port="80", api_version="v1"
+            ),
+        )
+
+    def test_given_json_document_from_v1_provider_when_amf_instances_then_instance_is_returned(
+        self,
+    ):
+        provider = Harness(ProviderCharm, meta=PROVIDER_METADATA)
+        self.addCleanup(provider.cleanup)
+        provider.begin()
+        provider.set_leader(True)
+        relation_id = provider.add_relation("fiveg-amf", "smf")
+        provider.charm.amf_provides.set_amf_unit_information(
+            amf_address="10.1.2.3",
+            amf_fqdn="amf-0.example.com",
+            guami_mcc="208",
+            guami_mnc="99",
+            guami_region_id="128",
+            guami_amf_set_id="1",
+            guami_amf_pointer="1",
+            relative_capacity=30,
+            relation_id=relation_id,
+        )
+
+        unit_data = provider.get_relation_data(relation_id, "amf/0")
+        self.harness.update_relation_data(
+            self.relation_id, "amf/0", {"amf_instance": unit_data["amf_instance"]}
+        )
+
+        (instance,) = self.harness.charm.amf_requires.amf_instances
+        self.assertEqual(instance.guami, "20899-128-1-1")
+        self.assertEqual(instance.relative_capacity, 30)
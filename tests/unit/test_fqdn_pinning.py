@@ -0,0 +1,41 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import patch
+
+from fqdn_pinning import cache_expired, pinned_address
+
+
+class TestFQDNPinning(unittest.TestCase):
+    @patch("fqdn_pinning.socket.gethostbyname")
+    def test_given_fresh_cache_entry_when_pinned_address_then_fqdn_is_not_resolved(
+        self, patch_gethostbyname
+    ):
+        cache = {"udm.example.com": {"address": "10.0.0.1", "resolved_at": 100.0}}
+
+        address = pinned_address(cache, "udm.example.com", fallback="1.2.3.4", ttl=60, now=150.0)
+
+        self.assertEqual(address, "10.0.0.1")
+        patch_gethostbyname.assert_not_called()
+
+    @patch("fqdn_pinning.socket.gethostbyname")
+    def test_given_expired_cache_entry_and_unresolvable_fqdn_when_pinned_address_then_cached_address_is_kept(  # noqa: E501
+        self, patch_gethostbyname
+    ):
+        patch_gethostbyname.side_effect = OSError("Name or service not known")
+        cache = {"udm.example.com": {"address": "10.0.0.1", "resolved_at": 100.0}}
+
+        address = pinned_address(cache, "udm.example.com", fallback="1.2.3.4", ttl=60, now=200.0)
+
+        self.assertEqual(address, "10.0.0.1")
+        self.assertEqual(cache["udm.example.com"]["resolved_at"], 200.0)
+
+    def test_given_entry_older_than_ttl_when_cache_expired_then_true_is_returned(self):
+        cache = {
+            "udm.example.com": {"address": "10.0.0.1", "resolved_at": 100.0},
+            "ausf.example.com": {"address": "10.0.0.2", "resolved_at": 190.0},
+        }
+
+        self.assertFalse(cache_expired(cache, ttl=60, now=150.0))
+        self.assertTrue(cache_expired(cache, ttl=60, now=160.0))
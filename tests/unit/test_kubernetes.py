@@ -0,0 +1,135 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import patch
+
+from lightkube.models.core_v1 import ServicePort, ServiceSpec
+from lightkube.models.meta_v1 import ObjectMeta
+from lightkube.resources.core_v1 import Service
+from lightkube.types import PatchType
+
+from kubernetes import SERVICE_SPEC_HASH_ANNOTATION, Kubernetes
+
+PORTS = [
+    ServicePort(name="http1", port=80, protocol="TCP", targetPort=80),
+    ServicePort(name="http2", port=9090, protocol="TCP", targetPort=9090),
+]
+PLACEHOLDER_PORT = ServicePort(name="placeholder", port=65535)
+
+
+def _service(ports, annotations=None):
+    return Service(
+        metadata=ObjectMeta(name="amf", namespace="whatever", annotations=annotations),
+        spec=ServiceSpec(ports=ports),
+    )
+
+
+class TestKubernetes(unittest.TestCase):
+    @patch("lightkube.core.client.GenericSyncClient")
+    def setUp(self, _):
+        self.kubernetes = Kubernetes(namespace="whatever")
+
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.apply")
+    @patch("lightkube.Client.get")
+    def test_given_ports_not_applied_when_patch_service_then_service_is_server_side_applied(  # noqa: E501
+        self, patch_get, patch_apply, patch_patch
+    ):
+        patch_get.return_value = _service(PORTS)
+        patch_apply.return_value = _service(PORTS)
+
+        self.kubernetes.patch_service(
+            name="amf", app_name="amf", ports=PORTS, service_type="ClusterIP"
+        )
+
+        patch_apply.assert_called_once()
+        service = patch_apply.call_args.args[0]
+        assert service.metadata.name == "amf"
+        assert service.spec.ports == PORTS
+        assert service.spec.type == "ClusterIP"
+        assert SERVICE_SPEC_HASH_ANNOTATION in service.metadata.annotations
+        assert patch_apply.call_args.kwargs == {"field_manager": "amf", "force": True}
+        patch_patch.assert_not_called()
+
+    @patch("lightkube.Client.apply")
+    @patch("lightkube.Client.get")
+    def test_given_ports_already_applied_when_patch_service_then_service_is_not_applied(
+        self, patch_get, patch_apply
+    ):
+        patch_get.return_value = _service([PLACEHOLDER_PORT])
+        patch_apply.return_value = _service(PORTS)
+        self.kubernetes.patch_service(
+            name="amf", app_name="amf", ports=PORTS, service_type="ClusterIP"
+        )
+        applied_annotations = patch_apply.call_args.args[0].metadata.annotations
+        patch_apply.reset_mock()
+        patch_get.return_value = _service(PORTS, annotations=applied_annotations)
+
+        self.kubernetes.patch_service(
+            name="amf", app_name="amf", ports=PORTS, service_type="ClusterIP"
+        )
+
+        patch_apply.assert_not_called()
+
+    @patch("lightkube.Client.apply")
+    @patch("lightkube.Client.get")
+    def test_given_ports_changed_when_patch_service_then_service_is_applied_again(
+        self, patch_get, patch_apply
+    ):
+        patch_get.return_value = _service([PLACEHOLDER_PORT])
+        patch_apply.return_value = _service(PORTS)
+        self.kubernetes.patch_service(
+            name="amf", app_name="amf", ports=PORTS, service_type="ClusterIP"
+        )
+        applied_annotations = patch_apply.call_args.args[0].metadata.annotations
+        patch_apply.reset_mock()
+        patch_get.return_value = _service(PORTS, annotations=applied_annotations)
+
+        self.kubernetes.patch_service(
+            name="amf", app_name="amf", ports=PORTS[:1], service_type="ClusterIP"
+        )
+
+        patch_apply.assert_called_once()
+
+    @patch("lightkube.Client.apply")
+    @patch("lightkube.Client.get")
+    def test_given_load_balancer_applied_when_patch_service_with_cluster_ip_then_service_is_applied_again(  # noqa: E501
+        self, patch_get, patch_apply
+    ):
+        patch_get.return_value = _service([PLACEHOLDER_PORT])
+        patch_apply.return_value = _service(PORTS)
+        self.kubernetes.patch_service(
+            name="amf", app_name="amf", ports=PORTS, service_type="LoadBalancer"
+        )
+        applied_annotations = patch_apply.call_args.args[0].metadata.annotations
+        patch_apply.reset_mock()
+        patch_get.return_value = _service(PORTS, annotations=applied_annotations)
+
+        self.kubernetes.patch_service(
+            name="amf", app_name="amf", ports=PORTS, service_type="ClusterIP"
+        )
+
+        patch_apply.assert_called_once()
+        assert patch_apply.call_args.args[0].spec.type == "ClusterIP"
+
+    @patch("lightkube.Client.patch")
+    @patch("lightkube.Client.apply")
+    @patch("lightkube.Client.get")
+    def test_given_placeholder_port_owned_by_juju_when_patch_service_then_placeholder_port_is_removed(  # noqa: E501
+        self, patch_get, patch_apply, patch_patch
+    ):
+        patch_get.return_value = _service([PLACEHOLDER_PORT])
+        patch_apply.return_value = _service([PLACEHOLDER_PORT, *PORTS])
+
+        self.kubernetes.patch_service(
+            name="amf", app_name="amf", ports=PORTS, service_type="ClusterIP"
+        )
+
+        patch_patch.assert_called_once_with(
+            Service,
+            name="amf",
+            obj={"spec": {"ports": [port.to_dict() for port in PORTS]}},
+            namespace="whatever",
+            patch_type=PatchType.MERGE,
+        )
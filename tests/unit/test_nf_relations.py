@@ -0,0 +1,53 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import Mock
+
+from nf_relations import NFInstance, nf_instances
+
+
+def _relation(relation_id: int, app_name: str, relation_data: dict) -> Mock:
+    relation = Mock(id=relation_id)
+    relation.app.name = app_name
+    relation.data = {relation.app: relation_data}
+    return relation
+
+
+class TestNFRelations(unittest.TestCase):
+    def test_given_several_relations_when_nf_instances_then_complete_instances_are_returned_by_relation_id(  # noqa: E501
+        self,
+    ):
+        relations = [
+            _relation(
+                7,
+                "udm-b",
+                {
+                    "udm_ipv4_address": "5.6.7.8",
+                    "udm_fqdn": "udm-b.example.com",
+                    "udm_port": "81",
+                    "udm_api_version": "v1",
+                },
+            ),
+            _relation(5, "udm-c", {"udm_ipv4_address": "9.9.9.9"}),
+            _relation(
+                3,
+                "udm-a",
+                {
+                    "udm_ipv4_address": "1.2.3.4",
+                    "udm_fqdn": "udm-a.example.com",
+                    "udm_port": "80",
+                    "udm_api_version": "v1",
+                },
+            ),
+        ]
+
+        instances = nf_instances("udm", relations)
+
+        self.assertEqual(
+            instances,
+            [
+                NFInstance("udm-a", "1.2.3.4", "udm-a.example.com", "80", "v1"),
+                NFInstance("udm-b", "5.6.7.8", "udm-b.example.com", "81", "v1"),
+            ],
+        )